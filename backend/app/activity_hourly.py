@@ -0,0 +1,187 @@
+"""
+Hourly activity aggregates for the activity heatmap.
+
+Every upload adds its ACTIVE and INACTIVE seconds onto ``core_activityhourly``,
+one row per (employee, UTC date, hour), in the ingest transaction. A weekday x hour
+heatmap for a company then reads at most ``employees x days x 24`` small rows
+instead of scanning ActivityLog. ``rebuild`` recomputes days from ActivityLog
+(backfill after deploying, or after manual fixes). It needs ``ACTIVITY_COMPACTION``:
+only compacted rows carry the agents' minutes; without it ActivityLog holds upload
+times, and a rebuild would move activity into other hours than live ingest does.
+
+Usage (from backend/):
+    python -m app.activity_hourly --days 90          # rebuild the last 90 days
+"""
+import argparse
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .date_ranges import in_range, on_day
+from .db import SessionLocal
+from .models import ActivityHourly, ActivityLog, User
+from .rollups import TEAM_MEMBERS, has_team_members
+
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+HourKey = Tuple[int, date, int]
+
+
+def hourly_deltas(rows: Iterable[dict]) -> Dict[HourKey, List[int]]:
+    """(employee, date, hour) -> [company_id, active, idle] for activity rows as written by ingest."""
+    deltas: Dict[HourKey, List[int]] = {}
+    for row in rows:
+        stamp = row["created_at"]
+        key = (row["employee_id"], stamp.date(), stamp.hour)
+        entry = deltas.setdefault(key, [row["company_id"], 0, 0])
+        seconds = row["duration_seconds"] or 0
+        if row["minute_type"] == "ACTIVE":
+            entry[1] += seconds
+        else:
+            entry[2] += seconds
+    return deltas
+
+
+def bump_hourly_activity(db: Session, rows: Iterable[dict]) -> None:
+    """Add activity rows onto their hourly buckets; part of the caller's transaction."""
+    deltas = hourly_deltas(rows)
+    if not deltas:
+        return
+    # Sorted so concurrent uploads lock buckets in the same order.
+    values = [
+        {
+            "company_id": company_id,
+            "employee_id": employee_id,
+            "date": day,
+            "hour": hour,
+            "active_seconds": active,
+            "idle_seconds": idle,
+        }
+        for (employee_id, day, hour), (company_id, active, idle) in sorted(deltas.items())
+    ]
+    table = ActivityHourly.__table__
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        stmt = (postgresql if dialect == "postgresql" else sqlite).insert(table).values(values)
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["employee_id", "date", "hour"],
+                set_={
+                    "active_seconds": table.c.active_seconds + stmt.excluded.active_seconds,
+                    "idle_seconds": table.c.idle_seconds + stmt.excluded.idle_seconds,
+                },
+            )
+        )
+        return
+    for row in values:
+        result = db.execute(
+            update(table)
+            .where(table.c.employee_id == row["employee_id"], table.c.date == row["date"], table.c.hour == row["hour"])
+            .values(
+                active_seconds=table.c.active_seconds + row["active_seconds"],
+                idle_seconds=table.c.idle_seconds + row["idle_seconds"],
+            )
+        )
+        if result.rowcount == 0:
+            db.execute(insert(table).values(**row))
+
+
+def rebuild(db: Session, start: date, end: date) -> int:
+    """Recompute the buckets of days ``start``..``end`` from ActivityLog, one transaction per day."""
+    if not settings.ACTIVITY_COMPACTION:
+        raise ValueError("ACTIVITY_COMPACTION is off: ActivityLog holds upload times, not the agents' minutes")
+    written = 0
+    day = start
+    while day <= end:
+        logs = db.execute(
+            select(
+                ActivityLog.company_id,
+                ActivityLog.employee_id,
+                ActivityLog.minute_type,
+                ActivityLog.duration_seconds,
+                ActivityLog.created_at,
+            ).where(on_day(ActivityLog.created_at, day), ActivityLog.employee_id.is_not(None))
+        )
+        db.execute(delete(ActivityHourly).where(ActivityHourly.date == day))
+        rows = [row._asdict() for row in logs]
+        bump_hourly_activity(db, rows)
+        db.commit()
+        written += len(hourly_deltas(rows))
+        day += timedelta(days=1)
+    return written
+
+
+def heatmap(
+    db: Session,
+    company_id: int,
+    start: date,
+    end: date,
+    department_id: Optional[int] = None,
+    team_id: Optional[int] = None,
+) -> dict:
+    """
+    Weekday x hour (UTC) active and idle seconds over ``start``..``end``, optionally
+    for one department / team. A team filter raises ValueError without Django's
+    team membership table.
+    """
+    query = (
+        select(
+            ActivityHourly.date,
+            ActivityHourly.hour,
+            func.sum(ActivityHourly.active_seconds),
+            func.sum(ActivityHourly.idle_seconds),
+        )
+        .where(ActivityHourly.company_id == company_id, in_range(ActivityHourly.date, (start, end + timedelta(days=1))))
+        .group_by(ActivityHourly.date, ActivityHourly.hour)
+    )
+    if department_id is not None:
+        query = query.where(
+            ActivityHourly.employee_id.in_(
+                select(User.id).where(User.company_id == company_id, User.department_id == department_id)
+            )
+        )
+    if team_id is not None:
+        if not has_team_members(db):
+            raise ValueError("team membership (core_team_members) is not available")
+        query = query.where(
+            ActivityHourly.employee_id.in_(select(TEAM_MEMBERS.c.user_id).where(TEAM_MEMBERS.c.team_id == team_id))
+        )
+
+    active = [[0] * 24 for _ in WEEKDAYS]
+    idle = [[0] * 24 for _ in WEEKDAYS]
+    for day, hour, active_seconds, idle_seconds in db.execute(query):
+        weekday = day.weekday()
+        active[weekday][hour] += int(active_seconds or 0)
+        idle[weekday][hour] += int(idle_seconds or 0)
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "weekdays": list(WEEKDAYS),
+        "hours": list(range(24)),
+        "active_seconds": active,
+        "idle_seconds": idle,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rebuild hourly activity aggregates from ActivityLog")
+    parser.add_argument("--days", type=int, default=30, help="rebuild this many days, ending today (UTC)")
+    args = parser.parse_args()
+
+    if not settings.ACTIVITY_COMPACTION:
+        print("[activity_hourly] ACTIVITY_COMPACTION is off; ActivityLog has no per-minute times to rebuild from")
+        raise SystemExit(1)
+    end = datetime.utcnow().date()
+    db = SessionLocal()
+    try:
+        written = rebuild(db, end - timedelta(days=args.days - 1), end)
+    finally:
+        db.close()
+    print(f"[activity_hourly] days={args.days} buckets={written}")
+
+
+if __name__ == "__main__":
+    main()
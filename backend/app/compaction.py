@@ -0,0 +1,130 @@
+"""
+Compact historical ActivityLog rows into per-minute buckets.
+
+The tracker reports one row per second. This job folds the rows of closed work
+sessions into one row per (work_session_id, minute, minute_type), keeping every
+session's per-type totals unchanged.
+
+Usage (from backend/):
+    python -m app.compaction --older-than-hours 24 --limit 200
+    python -m app.compaction --loop --interval 3600
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.orm import Session
+
+from .db import SessionLocal
+from .models import ActivityLog, WorkSession
+
+DELETE_CHUNK = 1000
+
+
+def compact_session(db: Session, session_id: int) -> Tuple[int, int]:
+    """Merge one session's rows into minute buckets. Returns (rows_before, rows_after)."""
+    rows = db.execute(
+        select(ActivityLog.id, ActivityLog.minute_type, ActivityLog.duration_seconds, ActivityLog.created_at)
+        .where(ActivityLog.work_session_id == session_id)
+        .order_by(ActivityLog.id)
+    ).all()
+
+    buckets: Dict[tuple, List] = {}
+    for row in rows:
+        created_at = row.created_at or datetime.utcnow()
+        key = (created_at.replace(second=0, microsecond=0), row.minute_type)
+        buckets.setdefault(key, []).append(row)
+
+    obsolete: List[int] = []
+    for (minute, _minute_type), members in buckets.items():
+        keeper = members[0]
+        if len(members) == 1 and keeper.created_at == minute:
+            continue
+        total = sum(m.duration_seconds or 0 for m in members)
+        db.execute(
+            update(ActivityLog)
+            .where(ActivityLog.id == keeper.id)
+            .values(duration_seconds=total, created_at=minute)
+        )
+        obsolete.extend(m.id for m in members[1:])
+
+    for start in range(0, len(obsolete), DELETE_CHUNK):
+        chunk = obsolete[start:start + DELETE_CHUNK]
+        db.execute(delete(ActivityLog).where(ActivityLog.id.in_(chunk)))
+
+    return len(rows), len(buckets)
+
+
+def find_uncompacted_sessions(db: Session, older_than: datetime, limit: int, after_id: int = 0) -> List[int]:
+    # A compacted session holds at most two rows (ACTIVE/INACTIVE) per minute.
+    row_count = func.count(ActivityLog.id)
+    minute_budget = 2 * (func.coalesce(WorkSession.total_seconds, 0) / 60 + 1)
+    return list(
+        db.execute(
+            select(WorkSession.id)
+            .join(ActivityLog, ActivityLog.work_session_id == WorkSession.id)
+            .where(WorkSession.id > after_id)
+            .where(WorkSession.end_time.is_not(None))
+            .where(WorkSession.end_time < older_than)
+            .group_by(WorkSession.id, WorkSession.total_seconds)
+            .having(row_count > minute_budget)
+            .order_by(WorkSession.id)
+            .limit(limit)
+        ).scalars()
+    )
+
+
+def compact_history(older_than: datetime, limit: int = 200, after_id: int = 0) -> Dict[str, int]:
+    """Compact up to ``limit`` closed sessions after ``after_id``, one transaction per session."""
+    stats = {"scanned": 0, "last_session_id": after_id, "sessions": 0, "rows_before": 0, "rows_after": 0}
+    db = SessionLocal()
+    try:
+        for session_id in find_uncompacted_sessions(db, older_than, limit, after_id):
+            stats["scanned"] += 1
+            stats["last_session_id"] = session_id
+            before, after = compact_session(db, session_id)
+            db.commit()
+            if after == before:
+                # Already minute buckets, just denser than the budget (e.g. overlapping reports).
+                continue
+            stats["sessions"] += 1
+            stats["rows_before"] += before
+            stats["rows_after"] += after
+    finally:
+        db.close()
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compact ActivityLog history into minute buckets")
+    parser.add_argument("--older-than-hours", type=int, default=24, help="only sessions closed before this age")
+    parser.add_argument("--limit", type=int, default=200, help="sessions per pass")
+    parser.add_argument("--loop", action="store_true", help="keep running, one pass per interval")
+    parser.add_argument("--interval", type=int, default=3600, help="seconds between passes with --loop")
+    args = parser.parse_args()
+
+    while True:
+        cutoff = datetime.utcnow() - timedelta(hours=args.older_than_hours)
+        totals = {"sessions": 0, "rows_before": 0, "rows_after": 0}
+        after_id = 0
+        while True:
+            # Page by id so sessions that stay over the row budget cannot be reselected forever.
+            stats = compact_history(cutoff, args.limit, after_id)
+            for key in totals:
+                totals[key] += stats[key]
+            if stats["scanned"] < args.limit:
+                break
+            after_id = stats["last_session_id"]
+        print(
+            f"[compaction] sessions={totals['sessions']} "
+            f"rows {totals['rows_before']} -> {totals['rows_after']}"
+        )
+        if not args.loop:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Day / week / month filters as half-open timestamp ranges.
+
+``func.date(col) == day`` or ``extract("month", col) == m`` wraps the column in a
+function, so the database evaluates it for every row and cannot use an index.
+``start <= col < end`` with the bounds computed here compares the column as
+stored and lets the (employee_id, start_time)-style indexes from
+``database/migrations/0004_date_range_indexes.sql`` do the work. Timestamps are
+naive UTC, like everything the agents write.
+
+Time series partitioned by ``created_at`` (upload time) only prune to the months
+a query covers when ``created_at`` itself is bounded. ``captured_in`` filters on
+a capture time and adds that bound.
+"""
+from datetime import date, datetime, time, timedelta
+from typing import Tuple
+
+from sqlalchemy import and_
+
+Range = Tuple[datetime, datetime]
+
+# How far ahead of the server an agent clock may run: a row is never uploaded
+# before it was captured, less this.
+CLOCK_SKEW = timedelta(days=1)
+
+
+def day_range(day: date) -> Range:
+    start = datetime.combine(day, time.min)
+    return start, start + timedelta(days=1)
+
+
+def week_range(day: date) -> Range:
+    """Monday to Monday around ``day``."""
+    start = datetime.combine(day - timedelta(days=day.weekday()), time.min)
+    return start, start + timedelta(days=7)
+
+
+def month_range(year: int, month: int) -> Range:
+    start = datetime(year, month, 1)
+    end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    return start, end
+
+
+def in_range(column, bounds: Range):
+    start, end = bounds
+    return and_(column >= start, column < end)
+
+
+def captured_in(captured, created, bounds: Range):
+    """``captured`` within ``bounds``, and ``created`` (the upload time) no earlier than the start."""
+    return and_(in_range(captured, bounds), created >= bounds[0] - CLOCK_SKEW)
+
+
+def on_day(column, day: date):
+    return in_range(column, day_range(day))
+
+
+def in_week(column, day: date):
+    return in_range(column, week_range(day))
+
+
+def in_month(column, year: int, month: int):
+    return in_range(column, month_range(year, month))
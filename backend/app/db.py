@@ -1,10 +1,171 @@
-from sqlalchemy import create_engine
+from collections import deque
+from dataclasses import dataclass
+import math
+import threading
+import time
+from typing import Dict, Optional
+
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
 from .config import settings
 
-engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True, future=True)
+
+@dataclass(frozen=True)
+class PoolConfig:
+    """Connection pool settings for one engine; ``statement_timeout_ms`` 0 means no limit."""
+
+    name: str
+    size: int
+    max_overflow: int
+    timeout: int
+    recycle: int
+    statement_timeout_ms: int
+
+
+DASHBOARD_POOL = PoolConfig(
+    name="dashboard",
+    size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    timeout=settings.DB_POOL_TIMEOUT,
+    recycle=settings.DB_POOL_RECYCLE,
+    statement_timeout_ms=settings.DB_STATEMENT_TIMEOUT_MS,
+)
+INGEST_POOL = PoolConfig(
+    name="ingest",
+    size=settings.INGEST_DB_POOL_SIZE,
+    max_overflow=settings.INGEST_DB_MAX_OVERFLOW,
+    timeout=settings.INGEST_DB_POOL_TIMEOUT,
+    recycle=settings.DB_POOL_RECYCLE,
+    statement_timeout_ms=settings.INGEST_DB_STATEMENT_TIMEOUT_MS,
+)
+
+
+class PoolWaitStats:
+    """How long checkouts waited for a connection, per pool (recent samples kept for percentiles)."""
+
+    def __init__(self, name: str, samples: int = 1000) -> None:
+        self.name = name
+        self._waits = deque(maxlen=samples)
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.max_wait = 0.0
+
+    def record(self, seconds: float, timed_out: bool = False) -> None:
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+                self._waits.append(seconds)
+            self.max_wait = max(self.max_wait, seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = sorted(self._waits)
+        return {
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_ms_avg": round(sum(waits) / len(waits) * 1000, 3) if waits else 0.0,
+            "wait_ms_p99": round(waits[math.ceil(len(waits) * 0.99) - 1] * 1000, 3) if waits else 0.0,
+            "wait_ms_max": round(self.max_wait * 1000, 3),
+        }
+
+
+_pool_stats: Dict[str, PoolWaitStats] = {}
+_engines: Dict[str, object] = {}
+
+
+def _timed_pool_class(base, stats: PoolWaitStats):
+    # A class attribute survives Pool.recreate(), which engine.dispose() uses.
+    class TimedPool(base):
+        wait_stats = stats
+
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except exc.TimeoutError:
+                self.wait_stats.record(time.perf_counter() - started, timed_out=True)
+                raise
+            self.wait_stats.record(time.perf_counter() - started)
+            return connection
+
+    TimedPool.__name__ = f"Timed{base.__name__}"
+    return TimedPool
+
+
+def engine_options(config: PoolConfig, url: str, is_async: bool = False, label: Optional[str] = None) -> dict:
+    """``create_engine`` keyword arguments for ``config`` under ``DB_POOL_MODE``."""
+    label = label or config.name
+    stats = _pool_stats.setdefault(label, PoolWaitStats(label))
+    parsed = make_url(url)
+    backend, driver = parsed.get_backend_name(), parsed.get_driver_name()
+    options: dict = {"pool_pre_ping": True, "connect_args": {}}
+
+    if settings.DB_POOL_MODE == "pgbouncer":
+        # PgBouncer owns pooling (transaction mode): open per checkout, keep nothing server-side.
+        options["poolclass"] = _timed_pool_class(NullPool, stats)
+        options["pool_pre_ping"] = False
+        if driver == "asyncpg":
+            options["connect_args"].update({"statement_cache_size": 0, "prepared_statement_cache_size": 0})
+    else:
+        options["poolclass"] = _timed_pool_class(AsyncAdaptedQueuePool if is_async else QueuePool, stats)
+        options.update(
+            pool_size=config.size,
+            max_overflow=config.max_overflow,
+            pool_timeout=config.timeout,
+            pool_recycle=config.recycle,
+        )
+
+    timeout_ms = config.statement_timeout_ms
+    if backend == "postgresql" and timeout_ms > 0 and settings.DB_POOL_MODE != "pgbouncer":
+        # Session-level default set at connect time; PgBouncer mode uses SET LOCAL per transaction instead.
+        if driver == "asyncpg":
+            options["connect_args"]["server_settings"] = {"statement_timeout": str(timeout_ms)}
+        else:
+            options["connect_args"]["options"] = f"-c statement_timeout={timeout_ms}"
+    return options
+
+
+def register_engine(engine, config: PoolConfig) -> None:
+    """Track ``engine`` for ``pool_stats`` and apply per-transaction timeouts in PgBouncer mode."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    _engines[sync_engine.pool.wait_stats.name] = sync_engine
+    timeout_ms = config.statement_timeout_ms
+    if settings.DB_POOL_MODE == "pgbouncer" and timeout_ms > 0 and sync_engine.dialect.name == "postgresql":
+
+        @event.listens_for(sync_engine, "begin")
+        def _set_statement_timeout(conn):
+            conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout_ms)}")
+
+
+def pool_stats() -> dict:
+    """Per-pool size, usage and checkout wait metrics for /runtime-metrics/."""
+    result = {"mode": settings.DB_POOL_MODE}
+    for label, sync_engine in _engines.items():
+        pool = sync_engine.pool
+        entry = {"pool": type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            entry.update(size=pool.size(), checked_out=pool.checkedout(), overflow=max(pool.overflow(), 0))
+        entry.update(pool.wait_stats.stats())
+        result[label] = entry
+    return result
+
+
+# Dashboards, reports and CLIs.
+engine = create_engine(settings.DATABASE_URL, future=True, **engine_options(DASHBOARD_POOL, settings.DATABASE_URL))
+register_engine(engine, DASHBOARD_POOL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, future=True)
 
+# Agent ingestion off the request path (write-behind buffer, presence flush), so a
+# heavy report cannot starve it of connections.
+ingest_engine = create_engine(settings.DATABASE_URL, future=True, **engine_options(INGEST_POOL, settings.DATABASE_URL))
+register_engine(ingest_engine, INGEST_POOL)
+IngestSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=ingest_engine, future=True)
+
 Base = declarative_base()
 
 
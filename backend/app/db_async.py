@@ -0,0 +1,40 @@
+"""
+Async engine for the tracker API (/api).
+
+Agent endpoints are ``async def`` and await the database instead of parking a
+threadpool thread per request, so one worker can hold thousands of concurrent
+agent connections. The dashboard (web.py), CLIs and background flushers keep
+the sync engine in ``db.py``; both engines map the same tables.
+
+The async URL is derived from ``DATABASE_URL`` (``postgresql+psycopg2`` ->
+``postgresql+asyncpg``, ``sqlite`` -> ``sqlite+aiosqlite``) unless
+``ASYNC_DATABASE_URL`` is set.
+"""
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from .config import settings
+from .db import INGEST_POOL, engine_options, register_engine
+
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+
+def async_database_url(url: str) -> str:
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No async driver known for {parsed.get_backend_name()!r}; set ASYNC_DATABASE_URL")
+    return parsed.set(drivername=f"{parsed.get_backend_name()}+{driver}").render_as_string(hide_password=False)
+
+
+ASYNC_URL = settings.ASYNC_DATABASE_URL or async_database_url(settings.DATABASE_URL)
+# Sized by the INGEST_DB_* settings, separate from the dashboard pool.
+async_engine = create_async_engine(ASYNC_URL, **engine_options(INGEST_POOL, ASYNC_URL, is_async=True, label="api"))
+register_engine(async_engine, INGEST_POOL)
+# Loaded attributes stay usable after commit; lazy loads are not possible on an AsyncSession.
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
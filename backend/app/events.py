@@ -0,0 +1,204 @@
+"""
+Push events for connected tracker agents (served as SSE by /api/agent/events).
+
+Views publish after committing: ``publish_to_user`` for one agent (session
+ended, task changed) and ``publish_to_company`` for all of a company's agents
+(config changed). On PostgreSQL with psycopg2 events travel through
+LISTEN/NOTIFY, so an agent connected to any worker receives them. Otherwise
+they only reach agents connected to the publishing worker; agents catch up on
+the rest with their periodic resync.
+
+Publishing never touches the database on the caller's thread (views publish
+from the event loop): NOTIFYs are queued for a notifier thread. The notifier and
+the listener each hold their own connection, outside the dashboard pool.
+"""
+import asyncio
+import json
+import logging
+import queue
+import select
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Optional, Set
+
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+
+from .config import settings
+from .db import engine
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "agent_events"
+OUTBOX_SIZE = 1000
+
+
+@dataclass(eq=False)
+class Subscription:
+    user_id: int
+    company_id: Optional[int]
+    loop: asyncio.AbstractEventLoop
+    queue: asyncio.Queue = field(default_factory=lambda: asyncio.Queue(maxsize=100))
+
+
+def _offer(queue: asyncio.Queue, event: dict) -> bool:
+    # Runs on the subscriber's event loop. A stalled agent loses its oldest events, never blocks publishers.
+    dropped = False
+    if queue.full():
+        queue.get_nowait()
+        dropped = True
+    queue.put_nowait(event)
+    return dropped
+
+
+class EventBroker:
+    def __init__(self, backend: str) -> None:
+        if backend == "auto":
+            # LISTEN needs a session-level connection, which PgBouncer transaction pooling does not give.
+            listenable = engine.dialect.name == "postgresql" and engine.dialect.driver == "psycopg2"
+            backend = "postgres" if listenable and settings.DB_POOL_MODE != "pgbouncer" else "local"
+        self.backend = backend
+        self._subscriptions: Set[Subscription] = set()
+        self._lock = threading.Lock()
+        self._listener: Optional[threading.Thread] = None
+        self._notifier: Optional[threading.Thread] = None
+        self._outbox: "queue.Queue[dict]" = queue.Queue(maxsize=OUTBOX_SIZE)
+        self._stopping = threading.Event()
+        # Long-lived connections of their own, so the broker never holds (or waits for) dashboard pool slots.
+        self._engine = None
+        if backend == "postgres":
+            self._engine = create_engine(settings.DATABASE_URL, poolclass=NullPool, future=True)
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def subscribe(self, user_id: int, company_id: Optional[int]) -> Subscription:
+        subscription = Subscription(user_id=user_id, company_id=company_id, loop=asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions.add(subscription)
+            if self.backend == "postgres" and self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name="agent-events-listener", daemon=True)
+                self._listener.start()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, event: dict, user_id: Optional[int] = None, company_id: Optional[int] = None) -> None:
+        message = {"event": event, "user_id": user_id, "company_id": company_id}
+        self.published += 1
+        if self.backend == "postgres":
+            with self._lock:
+                if self._notifier is None:
+                    self._notifier = threading.Thread(
+                        target=self._notify_loop, name="agent-events-notifier", daemon=True
+                    )
+                    self._notifier.start()
+            try:
+                self._outbox.put_nowait(message)
+                return
+            except queue.Full:
+                logger.warning("Agent event outbox full; delivering %s locally only", event.get("type"))
+        self._dispatch(message)
+
+    def stats(self) -> dict:
+        with self._lock:
+            connected = len(self._subscriptions)
+        return {
+            "backend": self.backend,
+            "connected_agents": connected,
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    def _dispatch(self, message: dict) -> None:
+        user_id = message.get("user_id")
+        company_id = message.get("company_id")
+        with self._lock:
+            targets = [
+                s
+                for s in self._subscriptions
+                if (user_id is not None and s.user_id == user_id)
+                or (user_id is None and company_id is not None and s.company_id == company_id)
+            ]
+        for subscription in targets:
+            try:
+                future = asyncio.run_coroutine_threadsafe(self._deliver(subscription, message["event"]), subscription.loop)
+            except RuntimeError:
+                continue  # loop already closed; the stream is going away
+            future.add_done_callback(self._count_delivery)
+
+    @staticmethod
+    async def _deliver(subscription: Subscription, event: dict) -> bool:
+        return _offer(subscription.queue, event)
+
+    def _count_delivery(self, future) -> None:
+        if future.cancelled() or future.exception() is not None:
+            return
+        self.delivered += 1
+        if future.result():
+            self.dropped += 1
+
+    def _notify_loop(self) -> None:
+        connection = None
+        while not self._stopping.is_set():
+            try:
+                message = self._outbox.get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                if connection is None:
+                    connection = self._engine.raw_connection()
+                    connection.dbapi_connection.autocommit = True
+                with connection.dbapi_connection.cursor() as cursor:
+                    cursor.execute("SELECT pg_notify(%s, %s)", (CHANNEL, json.dumps(message, default=str)))
+            except Exception:
+                logger.exception("NOTIFY failed; delivering %s locally only", message["event"].get("type"))
+                self._dispatch(message)
+                if connection is not None:
+                    connection.close()
+                    connection = None
+        if connection is not None:
+            connection.close()
+
+    def _listen(self) -> None:
+        while not self._stopping.is_set():
+            connection = None
+            try:
+                connection = self._engine.raw_connection()
+                dbapi_connection = connection.dbapi_connection
+                dbapi_connection.autocommit = True
+                with dbapi_connection.cursor() as cursor:
+                    cursor.execute(f"LISTEN {CHANNEL}")
+                while not self._stopping.is_set():
+                    if select.select([dbapi_connection], [], [], 5) == ([], [], []):
+                        continue
+                    dbapi_connection.poll()
+                    while dbapi_connection.notifies:
+                        notify = dbapi_connection.notifies.pop(0)
+                        self._dispatch(json.loads(notify.payload))
+            except Exception:
+                logger.exception("Agent event listener lost its connection; reconnecting")
+                time.sleep(5)
+            finally:
+                if connection is not None:
+                    connection.close()
+
+
+event_broker = EventBroker(settings.AGENT_EVENTS_BACKEND)
+
+
+def publish_to_user(user_id: Optional[int], event_type: str, **data) -> None:
+    if user_id is not None:
+        event_broker.publish({"type": event_type, **data}, user_id=user_id)
+
+
+def publish_to_company(company_id: Optional[int], event_type: str, **data) -> None:
+    if company_id is not None:
+        event_broker.publish({"type": event_type, **data}, company_id=company_id)
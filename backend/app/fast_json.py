@@ -0,0 +1,49 @@
+"""
+JSON encoding and decoding backed by ``orjson`` when it is installed.
+
+orjson serializes datetimes, dataclasses and UUIDs itself and is several times
+faster than the stdlib encoder. ``FastJSONResponse`` renders with it. Tracker
+routes (``AgentRoute``) also hand plain dict/list results straight to it,
+skipping FastAPI's ``jsonable_encoder`` pass, which costs more than the
+encoding itself. Without orjson everything falls back to ``json``.
+"""
+from decimal import Decimal
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # optional speed-up; the stdlib json module is used instead
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if hasattr(value, "isoformat"):  # datetime/date/time on the stdlib path
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data: Any) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,135 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .models import User
+from .presence import presence
+
+
+@dataclass(frozen=True)
+class AgentIdentity:
+    """The few User fields tracker endpoints need, detached from any DB session."""
+
+    id: int
+    company_id: Optional[int]
+    role: Optional[str]
+
+    @classmethod
+    def from_user(cls, user: User) -> "AgentIdentity":
+        return cls(id=user.id, company_id=user.company_id, role=user.role)
+
+
+class AgentIdentityCache:
+    """
+    In-process TTL + LRU cache of tracker token -> active agent identity.
+
+    Each worker holds its own copy. Admin changes invalidate the local worker
+    immediately; other workers pick the change up once the entry's TTL expires.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: int) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[AgentIdentity, float]]" = OrderedDict()
+        self._tokens_by_user: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 and self.max_entries > 0
+
+    def get(self, token: str) -> Optional[AgentIdentity]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            identity, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._drop(token)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return identity
+
+    def put(self, token: str, identity: AgentIdentity) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            previous = self._tokens_by_user.get(identity.id)
+            if previous is not None and previous != token:
+                self._drop(previous)
+            self._entries[token] = (identity, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(token)
+            self._tokens_by_user[identity.id] = token
+            while len(self._entries) > self.max_entries:
+                oldest, _ = next(iter(self._entries.items()))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def invalidate_user(self, user_id: int) -> None:
+        with self._lock:
+            token = self._tokens_by_user.get(user_id)
+            if token is not None:
+                self._drop(token)
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_user.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _drop(self, token: str) -> None:
+        entry = self._entries.pop(token, None)
+        if entry is not None and self._tokens_by_user.get(entry[0].id) == token:
+            del self._tokens_by_user[entry[0].id]
+
+
+agent_identity_cache = AgentIdentityCache(settings.AGENT_CACHE_MAX_ENTRIES, settings.AGENT_CACHE_TTL_SECONDS)
+
+
+def resolve_agent(db: Session, token: Optional[str], employee_id: Optional[int] = None) -> Optional[AgentIdentity]:
+    """Return the active agent owning ``token`` (and ``employee_id`` when given), or None."""
+    if not token:
+        return None
+    identity = agent_identity_cache.get(token)
+    if identity is None:
+        user = (
+            db.query(User)
+            .filter(User.tracker_token == token)
+            .filter(User.is_active_employee == True)
+            .filter(User.is_active == True)
+            .first()
+        )
+        if not user:
+            return None
+        identity = AgentIdentity.from_user(user)
+        agent_identity_cache.put(token, identity)
+    if employee_id is not None and identity.id != employee_id:
+        return None
+    presence.touch(identity.id)
+    return identity
@@ -0,0 +1,272 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+import io
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Table, insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from sqlalchemy.util import await_only
+
+from .config import settings
+from .models import ActivityBatch, ApplicationUsage, WebsiteUsage, ActivityLog
+from .activity_hourly import bump_hourly_activity
+from .session_counters import bump_session_counters
+
+
+@dataclass
+class IngestBatch:
+    """One agent upload, already authenticated and bound to a work session."""
+
+    company_id: Optional[int]
+    employee_id: int
+    work_session_id: int
+    applications: List[Any] = field(default_factory=list)
+    websites: List[Any] = field(default_factory=list)
+    activities: List[Any] = field(default_factory=list)
+    batch_id: Optional[str] = None
+    sequence: Optional[int] = None
+    # Time rows without their own timestamp are filed under (default: ingest time)
+    recorded_at: Optional[datetime] = None
+
+    @classmethod
+    def from_payload(cls, payload, user, session_id: int) -> "IngestBatch":
+        return cls(
+            company_id=user.company_id,
+            employee_id=user.id,
+            work_session_id=session_id,
+            applications=list(payload.applications),
+            websites=list(payload.websites),
+            activities=list(payload.activities),
+            batch_id=getattr(payload, "batch_id", None),
+            sequence=getattr(payload, "sequence", None),
+        )
+
+    @property
+    def row_count(self) -> int:
+        return len(self.applications) + len(self.websites) + len(self.activities)
+
+
+def _empty_counts() -> Dict[str, int]:
+    return {"applications": 0, "websites": 0, "activities": 0, "activities_merged": 0, "duplicate_batches": 0}
+
+
+def to_utc_naive(value: Optional[datetime]) -> Optional[datetime]:
+    """Agent timestamps are UTC; aware values are converted, naive ones taken as UTC."""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def minute_bucket(value: Optional[datetime], now: datetime) -> datetime:
+    value = to_utc_naive(value)
+    # Agent clocks drift; never file activity in the future.
+    value = min(value, now) if value else now
+    return value.replace(second=0, microsecond=0)
+
+
+def build_rows(batches: Sequence[IngestBatch], now: datetime) -> Dict[str, List[dict]]:
+    rows: Dict[str, List[dict]] = {"applications": [], "websites": [], "activities": []}
+    for batch in batches:
+        owner = {
+            "company_id": batch.company_id,
+            "work_session_id": batch.work_session_id,
+            "employee_id": batch.employee_id,
+        }
+        stamp = batch.recorded_at or now
+        for app in batch.applications:
+            rows["applications"].append(
+                {
+                    **owner,
+                    "app_name": app["app_name"],
+                    "window_title": app["window_title"],
+                    "active_seconds": app["active_seconds"] or 0,
+                    "created_at": stamp,
+                }
+            )
+        for site in batch.websites:
+            rows["websites"].append(
+                {
+                    **owner,
+                    "domain": site["domain"],
+                    "url": site["url"],
+                    "active_seconds": site["active_seconds"] or 0,
+                    "created_at": stamp,
+                }
+            )
+        for log in batch.activities:
+            rows["activities"].append(
+                {
+                    **owner,
+                    "minute_type": log["minute_type"],
+                    "duration_seconds": log["duration_seconds"] or 0,
+                    "created_at": stamp,
+                }
+            )
+    return rows
+
+
+def bucket_activity_rows(batches: Sequence[IngestBatch], now: datetime) -> List[dict]:
+    """Collapse activity items into one row per (work_session_id, minute, minute_type)."""
+    buckets: Dict[Tuple[int, datetime, Optional[str]], dict] = {}
+    for batch in batches:
+        for log in batch.activities:
+            minute = minute_bucket(log.get("created_at") or batch.recorded_at, now)
+            key = (batch.work_session_id, minute, log["minute_type"])
+            row = buckets.get(key)
+            if row is None:
+                buckets[key] = {
+                    "company_id": batch.company_id,
+                    "work_session_id": batch.work_session_id,
+                    "employee_id": batch.employee_id,
+                    "minute_type": log["minute_type"],
+                    "duration_seconds": log["duration_seconds"] or 0,
+                    "created_at": minute,
+                }
+            else:
+                row["duration_seconds"] += log["duration_seconds"] or 0
+    return list(buckets.values())
+
+
+def _merge_activity_buckets(db: Session, rows: List[dict]) -> Tuple[int, int]:
+    """Add bucket rows onto existing buckets, inserting the ones that do not exist yet."""
+    table = ActivityLog.__table__
+    fresh = []
+    merged = 0
+    for row in rows:
+        result = db.execute(
+            update(table)
+            .where(table.c.work_session_id == row["work_session_id"])
+            .where(table.c.minute_type == row["minute_type"])
+            .where(table.c.created_at == row["created_at"])
+            .values(duration_seconds=table.c.duration_seconds + row["duration_seconds"])
+        )
+        if result.rowcount:
+            merged += 1
+        else:
+            fresh.append(row)
+    if fresh:
+        _insert_rows(db, table, fresh)
+    return len(fresh), merged
+
+
+def _claim_batch(db: Session, batch: IngestBatch, now: datetime) -> bool:
+    """
+    Record ``batch.batch_id`` for its agent. False when it was already accepted;
+    a concurrent retry blocks on the unique index until the first one commits.
+    """
+    values = {
+        "company_id": batch.company_id,
+        "employee_id": batch.employee_id,
+        "work_session_id": batch.work_session_id,
+        "batch_id": batch.batch_id,
+        "sequence": batch.sequence,
+        "row_count": batch.row_count,
+        "created_at": now,
+    }
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        stmt = postgresql.insert(ActivityBatch.__table__).values(**values).on_conflict_do_nothing()
+    elif dialect == "sqlite":
+        stmt = sqlite.insert(ActivityBatch.__table__).values(**values).on_conflict_do_nothing()
+    else:
+        exists = (
+            db.query(ActivityBatch.id)
+            .filter(ActivityBatch.employee_id == batch.employee_id)
+            .filter(ActivityBatch.batch_id == batch.batch_id)
+            .first()
+        )
+        if exists:
+            return False
+        stmt = insert(ActivityBatch.__table__).values(**values)
+    return db.execute(stmt).rowcount == 1
+
+
+def claim_batches(db: Session, batches: Sequence[IngestBatch], now: datetime) -> List[IngestBatch]:
+    """Drop batches whose ``batch_id`` was already ingested; batches without an id always pass."""
+    return [b for b in batches if b.batch_id is None or _claim_batch(db, b, now)]
+
+
+def _copy_value(value) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    text = str(value)
+    return (
+        text.replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def _can_copy(db: Session, row_count: int) -> bool:
+    if not settings.INGEST_USE_COPY or row_count < settings.INGEST_COPY_MIN_ROWS:
+        return False
+    dialect = db.get_bind().dialect
+    return dialect.name == "postgresql" and dialect.driver in ("psycopg2", "asyncpg")
+
+
+def _copy_rows(db: Session, table: Table, rows: List[dict]) -> None:
+    columns = list(rows[0].keys())
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_value(row[c]) for c in columns))
+        buffer.write("\n")
+    buffer.seek(0)
+
+    # Reuse the connection the ORM session already holds so COPY joins its transaction.
+    pooled = db.connection().connection
+    if db.get_bind().dialect.driver == "asyncpg":
+        # Sync session driven by AsyncSession.run_sync: await the driver's COPY in place.
+        source = io.BytesIO(buffer.getvalue().encode("utf-8"))
+        await_only(pooled.driver_connection.copy_to_table(table.name, source=source, columns=columns, format="text"))
+        return
+    dbapi_connection = pooled.dbapi_connection
+    with dbapi_connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY {table.name} ({', '.join(columns)}) FROM STDIN", buffer)
+
+
+def _insert_rows(db: Session, table: Table, rows: List[dict]) -> None:
+    if _can_copy(db, len(rows)):
+        _copy_rows(db, table, rows)
+    else:
+        # executemany of a Core insert is rendered as batched multi-row VALUES.
+        db.execute(insert(table), rows)
+
+
+def ingest_activity(db: Session, batches: Sequence[IngestBatch]) -> Dict[str, int]:
+    """
+    Write application, website and activity rows for ``batches`` without building
+    ORM objects. With ``ACTIVITY_COMPACTION`` on, activity items are folded into
+    per-minute buckets first. Session counters and hourly heatmap buckets are
+    bumped in the same transaction, which the caller owns. Batches carrying an
+    already-seen ``batch_id`` are skipped. Returns inserted counts per table.
+    """
+    counts = _empty_counts()
+    now = datetime.utcnow()
+    fresh = claim_batches(db, batches, now)
+    counts["duplicate_batches"] = len(batches) - len(fresh)
+    batches = fresh
+    rows = build_rows(batches, now)
+    targets = {
+        "applications": ApplicationUsage.__table__,
+        "websites": WebsiteUsage.__table__,
+        "activities": ActivityLog.__table__,
+    }
+    # Per-minute buckets carry the agents' own timestamps, which the hourly heatmap needs.
+    buckets = bucket_activity_rows(batches, now)
+    if settings.ACTIVITY_COMPACTION:
+        targets.pop("activities")
+        if buckets:
+            counts["activities"], counts["activities_merged"] = _merge_activity_buckets(db, buckets)
+
+    for key, table in targets.items():
+        if rows[key]:
+            _insert_rows(db, table, rows[key])
+            counts[key] = len(rows[key])
+
+    bump_session_counters(db, batches)
+    bump_hourly_activity(db, buckets)
+    return counts
@@ -0,0 +1,155 @@
+"""
+Write-behind buffer for activity uploads (``INGEST_MODE=buffered``).
+
+The upload endpoint validates a payload, hands the resulting IngestBatch to the
+worker's buffer and replies 202. A flusher thread merges everything queued into
+one transaction every ``INGEST_FLUSH_INTERVAL_MS`` or as soon as
+``INGEST_FLUSH_MAX_ROWS`` rows are waiting. Queued rows are lost if the process
+dies before a flush; a clean shutdown drains the queue.
+"""
+import logging
+import threading
+import time
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .db import IngestSessionLocal
+from .ingest import IngestBatch, ingest_activity
+
+logger = logging.getLogger(__name__)
+
+
+class IngestBuffer:
+    """Bounded per-worker queue of IngestBatch objects with a background flusher."""
+
+    def __init__(self, flush_interval_ms: int, flush_max_rows: int, max_queued_rows: int, async_commit: bool) -> None:
+        self.flush_interval = max(flush_interval_ms, 1) / 1000.0
+        self.flush_max_rows = max(flush_max_rows, 1)
+        self.max_queued_rows = max(max_queued_rows, 1)
+        self.async_commit = async_commit
+        self._pending: List[IngestBatch] = []
+        self._pending_rows = 0
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self.accepted = 0
+        self.rejected = 0
+        self.flushes = 0
+        self.flushed_batches = 0
+        self.flushed_rows = 0
+        self.failed_batches = 0
+        self.last_flush_ms = 0.0
+
+    @property
+    def retry_after_seconds(self) -> int:
+        return max(1, int(self.flush_interval * 2 + 0.999))
+
+    def submit(self, batch: IngestBatch) -> bool:
+        """Queue ``batch``; False when the queue is full (or draining) and the agent should retry."""
+        with self._cond:
+            over_limit = self._pending and self._pending_rows + batch.row_count > self.max_queued_rows
+            if self._stopping or over_limit:
+                self.rejected += 1
+                return False
+            self._pending.append(batch)
+            self._pending_rows += batch.row_count
+            self.accepted += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ingest-flusher", daemon=True)
+                self._thread.start()
+            if self._pending_rows >= self.flush_max_rows:
+                self._cond.notify()
+        return True
+
+    def drain(self, timeout: float = 30.0) -> None:
+        """Stop accepting uploads and flush everything still queued."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self._flush(self._take())
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "mode": settings.INGEST_MODE,
+                "queued_batches": len(self._pending),
+                "queued_rows": self._pending_rows,
+                "max_queued_rows": self.max_queued_rows,
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "flushes": self.flushes,
+                "flushed_batches": self.flushed_batches,
+                "flushed_rows": self.flushed_rows,
+                "failed_batches": self.failed_batches,
+                "last_flush_ms": round(self.last_flush_ms, 2),
+            }
+
+    def _take(self) -> List[IngestBatch]:
+        with self._cond:
+            batches, self._pending, self._pending_rows = self._pending, [], 0
+        return batches
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while not self._stopping and self._pending_rows < self.flush_max_rows:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._stopping:
+                    return
+            self._flush(self._take())
+
+    def _write(self, batches: List[IngestBatch]) -> None:
+        db: Session = IngestSessionLocal()
+        try:
+            if self.async_commit and db.get_bind().dialect.name == "postgresql":
+                # Commit returns before the WAL fsync; a crash can lose the last few hundred ms.
+                db.execute(text("SET LOCAL synchronous_commit = off"))
+            ingest_activity(db, batches)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _flush(self, batches: List[IngestBatch]) -> None:
+        if not batches:
+            return
+        started = time.perf_counter()
+        try:
+            self._write(batches)
+            written = batches
+        except Exception:
+            # One bad upload (e.g. its session was deleted meanwhile) must not sink the rest.
+            logger.exception("Merged ingest flush of %d batches failed; retrying one by one", len(batches))
+            written = []
+            for batch in batches:
+                try:
+                    self._write([batch])
+                    written.append(batch)
+                except Exception:
+                    logger.exception("Dropping upload for work session %s", batch.work_session_id)
+        with self._cond:
+            self.flushes += 1
+            self.flushed_batches += len(written)
+            self.flushed_rows += sum(b.row_count for b in written)
+            self.failed_batches += len(batches) - len(written)
+            self.last_flush_ms = (time.perf_counter() - started) * 1000
+
+
+ingest_buffer = IngestBuffer(
+    settings.INGEST_FLUSH_INTERVAL_MS,
+    settings.INGEST_FLUSH_MAX_ROWS,
+    settings.INGEST_QUEUE_MAX_ROWS,
+    settings.INGEST_ASYNC_COMMIT,
+)
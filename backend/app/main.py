@@ -1,10 +1,36 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from starlette.middleware.sessions import SessionMiddleware
 from fastapi.staticfiles import StaticFiles
 from .config import settings
-from .routers import api, web
+from .db_async import async_engine
+from .events import event_broker
+from .fast_json import FastJSONResponse
+from .ingest_buffer import ingest_buffer
+from .presence import presence
+from .screenshot_media import screenshot_pipeline
+from .routers import api, media, web
 
-app = FastAPI(title="Employee Progress Tracker", debug=settings.DEBUG)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    event_broker.stop()
+    # Unstarted transcodes are left for `python -m app.screenshot_media`.
+    screenshot_pipeline.stop()
+    # Commit uploads still waiting in the write-behind buffer before the worker exits.
+    await run_in_threadpool(ingest_buffer.drain)
+    await run_in_threadpool(presence.stop)
+    await async_engine.dispose()
+
+
+app = FastAPI(
+    title="Employee Progress Tracker",
+    debug=settings.DEBUG,
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,
+)
 
 app.add_middleware(
     SessionMiddleware,
@@ -14,6 +40,8 @@ app.add_middleware(
 
 app.include_router(api.router, prefix="/api")
 app.include_router(web.router)
+# Before the media mount: packed screenshots are served out of their archives.
+app.include_router(media.router)
 
 if settings.STATIC_DIR.exists():
     app.mount("/static", StaticFiles(directory=str(settings.STATIC_DIR)), name="static")
@@ -0,0 +1,364 @@
+"""
+Content-addressed screenshot storage.
+
+Idle or static screens upload byte-identical screenshots. With ``MEDIA_DEDUPE``
+on, each file is stored once under ``blobs/ab/cd/<sha256>.<ext>`` and
+``core_mediablob`` counts the Screenshot columns (image, thumbnail, preview)
+that point at it. Uploads take a reference, replacing or deleting media drops
+one, and ``gc`` removes blobs nothing references any more, plus files no row
+points at (left by uploads that rolled back or died). ``gc`` trusts the counts;
+``--reconcile`` recounts them from every screenshot partition first, for rows
+deleted outside the app. Screenshot partitions
+detached for archiving (``app.partitions maintain --detach``) keep their
+references.
+
+Usage (from backend/):
+    python -m app.media_blobs report
+    python -m app.media_blobs gc --grace-hours 24
+    python -m app.media_blobs gc --loop --interval 3600
+    python -m app.media_blobs gc --reconcile
+"""
+import argparse
+from datetime import datetime, timedelta
+import os
+from pathlib import Path
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from sqlalchemy import column, delete, distinct, exists, func, insert, or_, select, table, text, union_all, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .db import SessionLocal
+from .models import Company, MediaBlob, Screenshot
+
+BLOB_DIR = "blobs"
+# Screenshot columns that may reference a blob.
+MEDIA_COLUMNS = (Screenshot.image, Screenshot.thumbnail, Screenshot.preview)
+
+
+def is_blob(path: Optional[str]) -> bool:
+    return bool(path) and path.startswith(BLOB_DIR + "/")
+
+
+def blob_rel_path(digest: str, extension: str) -> str:
+    return f"{BLOB_DIR}/{digest[:2]}/{digest[2:4]}/{digest}.{extension}"
+
+
+def incoming_path() -> Path:
+    """A scratch path on the media volume, so finished uploads move into place with a rename."""
+    path = settings.MEDIA_ROOT / BLOB_DIR / "incoming" / f"{uuid.uuid4().hex}.part"
+    os.makedirs(path.parent, exist_ok=True)
+    return path
+
+
+def _insert_blob(db: Session, values: dict) -> bool:
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        module = postgresql if dialect == "postgresql" else sqlite
+        statement = module.insert(MediaBlob).values(**values).on_conflict_do_nothing(index_elements=["sha256"])
+        return db.execute(statement).rowcount == 1
+    if db.scalar(select(MediaBlob.id).where(MediaBlob.sha256 == values["sha256"])) is not None:
+        return False
+    db.execute(insert(MediaBlob).values(**values))
+    return True
+
+
+def reference_blob(db: Session, digest: str) -> Optional[str]:
+    """Take one reference on an already stored blob; returns its path, or None if the content is new."""
+    return db.scalar(
+        update(MediaBlob)
+        .where(MediaBlob.sha256 == digest)
+        .values(ref_count=MediaBlob.ref_count + 1)
+        .returning(MediaBlob.path)
+    )
+
+
+def claim_blob(db: Session, digest: str, size: int, extension: str) -> str:
+    """
+    Take one reference on the blob with ``digest``, inserting its row if the
+    content is new, and return the blob's media path. Database only; follow
+    with ``place_blob`` (the file half). Runs in the caller's transaction.
+    """
+    # Database first, file second: a concurrent gc holds the row lock until its file is gone.
+    path = reference_blob(db, digest)
+    if path is None:
+        path = blob_rel_path(digest, extension)
+        values = {"sha256": digest, "path": path, "size": size, "ref_count": 1, "created_at": datetime.utcnow()}
+        if not _insert_blob(db, values):
+            # Lost an insert race with an identical upload.
+            path = reference_blob(db, digest)
+    return path
+
+
+def place_blob(source: Path, path: str) -> None:
+    """Move ``source`` to the blob at ``path``, or delete it if that content is already stored. Files only."""
+    target = settings.MEDIA_ROOT / path
+    if target.exists():
+        os.remove(source)
+        # Fresh mtime: the orphan sweep leaves young files alone until this transaction's row is visible.
+        os.utime(target)
+    else:
+        os.makedirs(target.parent, exist_ok=True)
+        os.replace(source, target)
+
+
+def store_blob(db: Session, source: Path, digest: str, size: int, extension: str) -> str:
+    """``claim_blob`` then ``place_blob``, for synchronous callers. Returns the blob's media path."""
+    path = claim_blob(db, digest, size, extension)
+    place_blob(source, path)
+    return path
+
+
+def release_blob(db: Session, path: Optional[str]) -> None:
+    """Drop one reference on the blob at ``path`` (no-op for non-blob paths); gc deletes the file later."""
+    if is_blob(path):
+        db.execute(
+            update(MediaBlob)
+            .where(MediaBlob.path == path, MediaBlob.ref_count > 0)
+            .values(ref_count=MediaBlob.ref_count - 1)
+        )
+
+
+def release_session_blobs(db: Session, session_id: int) -> None:
+    """Drop the references held by a work session's screenshots, before the session is deleted."""
+    for row in db.execute(select(*MEDIA_COLUMNS).where(Screenshot.work_session_id == session_id)):
+        for path in row:
+            release_blob(db, path)
+
+
+def release_partition_blobs(db: Session, relation: str) -> None:
+    """Drop the references held by every row of a core_screenshot partition, before it is dropped."""
+    part = table(relation, *(column(c.name) for c in MEDIA_COLUMNS))
+    paths = union_all(*(select(part.c[c.name].label("path")) for c in MEDIA_COLUMNS)).subquery()
+    counts = (
+        select(paths.c.path, func.count().label("n"))
+        .where(paths.c.path.like(BLOB_DIR + "/%"))
+        .group_by(paths.c.path)
+        .subquery()
+    )
+    db.execute(
+        update(MediaBlob)
+        .where(MediaBlob.path == counts.c.path)
+        .values(ref_count=func.greatest(MediaBlob.ref_count - counts.c.n, 0))
+    )
+
+
+def archived_screenshot_tables(db: Session) -> List[str]:
+    """Screenshot partitions detached for archiving; their rows still point at blobs."""
+    if db.get_bind().dialect.name != "postgresql":
+        return []
+    rows = db.execute(
+        text(
+            "SELECT relname FROM pg_class WHERE relkind = 'r' AND NOT relispartition "
+            "AND relname ~ '^core_screenshot_p[0-9]{4}_[0-9]{2}$' AND pg_table_is_visible(oid) ORDER BY relname"
+        )
+    )
+    return [row[0] for row in rows]
+
+
+def _referencing_columns(db: Session) -> list:
+    """MEDIA_COLUMNS, plus the same columns of every archived screenshot partition."""
+    columns = list(MEDIA_COLUMNS)
+    for relation in archived_screenshot_tables(db):
+        archived = table(relation, *(column(c.name) for c in MEDIA_COLUMNS))
+        columns += [archived.c[c.name] for c in MEDIA_COLUMNS]
+    return columns
+
+
+def _reference_count(path_column, columns):
+    return sum(
+        (select(func.count()).where(column == path_column).scalar_subquery() for column in columns),
+        start=0,
+    )
+
+
+def reconcile_ref_counts(db: Session) -> int:
+    """Recount references from Screenshot rows (covers rows deleted outside the app). Returns rows fixed."""
+    actual = _reference_count(MediaBlob.path, _referencing_columns(db))
+    result = db.execute(update(MediaBlob).where(MediaBlob.ref_count != actual).values(ref_count=actual))
+    db.commit()
+    return result.rowcount
+
+
+def collect_garbage(db: Session, grace: timedelta, limit: int = 1000) -> Dict[str, int]:
+    """Delete unreferenced blobs older than ``grace``, one transaction per blob."""
+    stats = {"blobs": 0, "bytes": 0}
+    referenced = or_(*(exists().where(column == MediaBlob.path) for column in _referencing_columns(db)))
+    candidates = db.execute(
+        select(MediaBlob.id, MediaBlob.path, MediaBlob.size)
+        .where(MediaBlob.ref_count <= 0, MediaBlob.created_at < datetime.utcnow() - grace)
+        .order_by(MediaBlob.id)
+        .limit(limit)
+    ).all()
+    for blob_id, path, size in candidates:
+        # Re-checked under the row lock: a reference taken since the scan wins.
+        deleted = db.execute(
+            delete(MediaBlob).where(MediaBlob.id == blob_id, MediaBlob.ref_count <= 0, ~referenced)
+        ).rowcount
+        if deleted:
+            try:
+                os.remove(settings.MEDIA_ROOT / path)
+            except FileNotFoundError:
+                pass
+            stats["blobs"] += 1
+            stats["bytes"] += size or 0
+        db.commit()
+    return stats
+
+
+def sweep_orphan_files(db: Session, grace: timedelta, batch: int = 1000) -> Dict[str, int]:
+    """
+    Delete files under ``blobs/`` older than ``grace`` that no ``core_mediablob``
+    row points at: stored by a transaction that then rolled back, or scratch files
+    of an upload that died.
+    """
+    stats = {"files": 0, "bytes": 0}
+    cutoff = time.time() - grace.total_seconds()
+    candidates: Dict[str, Path] = {}
+
+    def sweep() -> None:
+        known = set(db.scalars(select(MediaBlob.path).where(MediaBlob.path.in_(list(candidates)))))
+        db.rollback()  # end the read transaction between batches
+        for rel_path, full_path in candidates.items():
+            if rel_path in known:
+                continue
+            try:
+                stat = full_path.stat()
+                if stat.st_mtime >= cutoff:
+                    continue  # reused since the scan
+                os.remove(full_path)
+            except FileNotFoundError:
+                continue
+            stats["files"] += 1
+            stats["bytes"] += stat.st_size
+        candidates.clear()
+
+    for directory, _, names in os.walk(settings.MEDIA_ROOT / BLOB_DIR):
+        for name in names:
+            full_path = Path(directory) / name
+            try:
+                if full_path.stat().st_mtime >= cutoff:
+                    continue
+            except FileNotFoundError:
+                continue
+            candidates[full_path.relative_to(settings.MEDIA_ROOT).as_posix()] = full_path
+            if len(candidates) >= batch:
+                sweep()
+    if candidates:
+        sweep()
+    return stats
+
+
+def dedupe_report(db: Session, company_id: Optional[int] = None) -> List[dict]:
+    """
+    Per company: media references, distinct blobs, logical vs. stored bytes and
+    the dedupe ratio (logical / stored).
+    """
+    selects = []
+    for column in MEDIA_COLUMNS:
+        query = select(
+            Screenshot.company_id.label("company_id"), MediaBlob.id.label("blob_id"), MediaBlob.size.label("size")
+        ).join(MediaBlob, MediaBlob.path == column)
+        if company_id is not None:
+            query = query.where(Screenshot.company_id == company_id)
+        selects.append(query)
+    references = union_all(*selects).subquery()
+    logical = dict(
+        (row.company_id, row)
+        for row in db.execute(
+            select(references.c.company_id, func.count().label("references"), func.sum(references.c.size).label("bytes"))
+            .group_by(references.c.company_id)
+        )
+    )
+    distinct_blobs = (
+        select(references.c.company_id, references.c.blob_id, references.c.size)
+        .distinct()
+        .subquery()
+    )
+    stored = dict(
+        (row.company_id, row)
+        for row in db.execute(
+            select(
+                distinct_blobs.c.company_id,
+                func.count(distinct(distinct_blobs.c.blob_id)).label("blobs"),
+                func.sum(distinct_blobs.c.size).label("bytes"),
+            ).group_by(distinct_blobs.c.company_id)
+        )
+    )
+    names = dict(db.execute(select(Company.id, Company.name).where(Company.id.in_(list(logical)))).all())
+
+    report = []
+    for cid, row in sorted(logical.items(), key=lambda item: (item[0] is None, item[0])):
+        stored_bytes = int(stored[cid].bytes or 0)
+        logical_bytes = int(row.bytes or 0)
+        report.append(
+            {
+                "company_id": cid,
+                "company": names.get(cid),
+                "references": row.references,
+                "blobs": stored[cid].blobs,
+                "logical_bytes": logical_bytes,
+                "stored_bytes": stored_bytes,
+                "dedupe_ratio": round(logical_bytes / stored_bytes, 3) if stored_bytes else 1.0,
+            }
+        )
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Content-addressed screenshot storage maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+    report_parser = commands.add_parser("report", help="dedupe ratio per company")
+    report_parser.add_argument("--company-id", type=int, default=None)
+    gc_parser = commands.add_parser("gc", help="delete unreferenced blobs and orphaned files")
+    gc_parser.add_argument("--grace-hours", type=int, default=24, help="keep unreferenced blobs at least this long")
+    gc_parser.add_argument("--limit", type=int, default=1000, help="blobs deleted per pass")
+    gc_parser.add_argument(
+        "--reconcile", action="store_true", help="recount references from all screenshots first (full scan)"
+    )
+    gc_parser.add_argument("--loop", action="store_true", help="keep running, one pass per interval")
+    gc_parser.add_argument("--interval", type=int, default=3600, help="seconds between passes with --loop")
+    args = parser.parse_args()
+
+    if args.command == "report":
+        db = SessionLocal()
+        try:
+            for row in dedupe_report(db, args.company_id):
+                print(
+                    f"[media_blobs] company={row['company_id']} ({row['company'] or '-'}) "
+                    f"references={row['references']} blobs={row['blobs']} "
+                    f"bytes {row['logical_bytes']} -> {row['stored_bytes']} ratio={row['dedupe_ratio']}"
+                )
+        finally:
+            db.close()
+        return
+
+    if args.reconcile:
+        # Once, not per pass: the recount scans every screenshot partition.
+        db = SessionLocal()
+        try:
+            print(f"[media_blobs] recounted={reconcile_ref_counts(db)}")
+        finally:
+            db.close()
+
+    while True:
+        db = SessionLocal()
+        try:
+            stats = collect_garbage(db, timedelta(hours=args.grace_hours), args.limit)
+            orphans = sweep_orphan_files(db, timedelta(hours=args.grace_hours))
+        finally:
+            db.close()
+        print(
+            f"[media_blobs] deleted={stats['blobs']} bytes={stats['bytes']} "
+            f"orphan_files={orphans['files']} orphan_bytes={orphans['bytes']}"
+        )
+        if not args.loop:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,16 @@
 from sqlalchemy import (
+    BigInteger,
     Column,
+    Date,
     Integer,
+    SmallInteger,
     String,
     DateTime,
     Boolean,
     ForeignKey,
+    Index,
     Text,
+    UniqueConstraint,
 )
 from sqlalchemy.orm import relationship
 from .db import Base
@@ -48,6 +53,10 @@ class User(Base):
 
 class WorkSession(Base):
     __tablename__ = "core_worksession"
+    __table_args__ = (
+        Index("core_worksession_employee_start_idx", "employee_id", "start_time"),
+        Index("core_worksession_company_start_idx", "company_id", "start_time"),
+    )
 
     id = Column(Integer, primary_key=True)
     company_id = Column(Integer, ForeignKey("core_company.id"))
@@ -62,6 +71,10 @@ class WorkSession(Base):
 
 class ApplicationUsage(Base):
     __tablename__ = "core_applicationusage"
+    __table_args__ = (
+        Index("core_applicationusage_employee_created_idx", "employee_id", "created_at"),
+        Index("core_applicationusage_company_created_idx", "company_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True)
     company_id = Column(Integer, ForeignKey("core_company.id"))
@@ -75,6 +88,10 @@ class ApplicationUsage(Base):
 
 class WebsiteUsage(Base):
     __tablename__ = "core_websiteusage"
+    __table_args__ = (
+        Index("core_websiteusage_employee_created_idx", "employee_id", "created_at"),
+        Index("core_websiteusage_company_created_idx", "company_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True)
     company_id = Column(Integer, ForeignKey("core_company.id"))
@@ -88,6 +105,11 @@ class WebsiteUsage(Base):
 
 class ActivityLog(Base):
     __tablename__ = "core_activitylog"
+    __table_args__ = (
+        Index("core_activitylog_session_type_idx", "work_session_id", "minute_type"),
+        Index("core_activitylog_employee_created_idx", "employee_id", "created_at"),
+        Index("core_activitylog_company_created_idx", "company_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True)
     company_id = Column(Integer, ForeignKey("core_company.id"))
@@ -98,16 +120,73 @@ class ActivityLog(Base):
     created_at = Column(DateTime)
 
 
+class ActivityHourly(Base):
+    """Active / idle seconds per employee and UTC hour, kept current at ingest for heatmaps."""
+
+    __tablename__ = "core_activityhourly"
+    __table_args__ = (
+        UniqueConstraint("employee_id", "date", "hour", name="core_activityhourly_employee_hour_uniq"),
+        Index("core_activityhourly_company_date_idx", "company_id", "date"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    company_id = Column(Integer, ForeignKey("core_company.id"))
+    employee_id = Column(Integer, ForeignKey("core_user.id"), nullable=False)
+    date = Column(Date, nullable=False)
+    hour = Column(SmallInteger, nullable=False)
+    active_seconds = Column(Integer, nullable=False, default=0)
+    idle_seconds = Column(Integer, nullable=False, default=0)
+
+
+class ActivityBatch(Base):
+    """One accepted agent upload, keyed by the agent's batch id so retries are no-ops."""
+
+    __tablename__ = "core_activitybatch"
+    __table_args__ = (
+        UniqueConstraint("employee_id", "batch_id", name="core_activitybatch_employee_batch_uniq"),
+        Index("core_activitybatch_company_created_idx", "company_id", "created_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    company_id = Column(Integer, ForeignKey("core_company.id"))
+    employee_id = Column(Integer, ForeignKey("core_user.id"))
+    work_session_id = Column(Integer, ForeignKey("core_worksession.id"))
+    batch_id = Column(String(64))
+    sequence = Column(Integer)
+    row_count = Column(Integer)
+    created_at = Column(DateTime)
+
+
+class MediaBlob(Base):
+    """One stored media file, addressed by its SHA-256; ``ref_count`` counts Screenshot columns pointing at it."""
+
+    __tablename__ = "core_mediablob"
+
+    id = Column(Integer, primary_key=True)
+    sha256 = Column(String(64), unique=True, nullable=False)
+    path = Column(String(100), nullable=False, index=True)
+    size = Column(BigInteger)
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime)
+
+
 class Screenshot(Base):
     __tablename__ = "core_screenshot"
+    __table_args__ = (
+        Index("core_screenshot_employee_capture_idx", "employee_id", "capture_time"),
+        Index("core_screenshot_company_created_idx", "company_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True)
     company_id = Column(Integer, ForeignKey("core_company.id"))
     work_session_id = Column(Integer, ForeignKey("core_worksession.id"))
     employee_id = Column(Integer, ForeignKey("core_user.id"))
     image = Column(String(100))
+    thumbnail = Column(String(100))
+    preview = Column(String(100))
     capture_time = Column(DateTime)
     created_at = Column(DateTime)
+    processed_at = Column(DateTime)
 
 
 class Task(Base):
@@ -250,6 +329,7 @@ class Team(Base):
 
 class ProductivityMetric(Base):
     __tablename__ = "core_productivitymetric"
+    __table_args__ = (Index("core_productivitymetric_company_level_date_idx", "company_id", "metric_level", "date"),)
 
     id = Column(Integer, primary_key=True)
     company_id = Column(Integer, ForeignKey("core_company.id"))
@@ -0,0 +1,218 @@
+"""
+Monthly partitions for the append-only time series (PostgreSQL).
+
+After ``database/migrations/0005_partition_time_series.sql``, core_activitylog,
+core_applicationusage, core_websiteusage and core_screenshot are range-partitioned
+by ``created_at``, one partition per month (``<table>_pYYYY_MM``) plus a default
+partition for stray timestamps. Queries bounded on ``created_at`` only scan the
+months they cover. Filters on another timestamp (``Screenshot.capture_time``)
+need a ``created_at`` bound too, e.g. ``date_ranges.captured_in``. Expiring a month is a ``DROP TABLE`` (or a
+``DETACH`` to archive it) instead of a long ``DELETE``.
+
+``maintain`` creates the next months ahead of time and expires months older than
+the retention. Rows that landed in the default partition for a month that gets a
+partition later are moved into it.
+
+Usage (from backend/):
+    python -m app.partitions status
+    python -m app.partitions maintain --months-ahead 3 --retention-months 24
+    python -m app.partitions maintain --loop --interval 86400
+"""
+import argparse
+from datetime import date, datetime
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .db import SessionLocal
+from .media_blobs import release_partition_blobs
+
+PARTITIONED_TABLES = ("core_activitylog", "core_applicationusage", "core_websiteusage", "core_screenshot")
+PARTITION_KEY = "created_at"
+_MONTH_SUFFIX = re.compile(r"_p(\d{4})_(\d{2})$")
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y_%m}"
+
+
+def partition_month(name: str) -> Optional[date]:
+    """The month a ``<table>_pYYYY_MM`` partition holds; None for the default partition."""
+    match = _MONTH_SUFFIX.search(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def _quote(db: Session, name: str) -> str:
+    return db.get_bind().dialect.identifier_preparer.quote(name)
+
+
+def is_partitioned(db: Session, table: str) -> bool:
+    if db.get_bind().dialect.name != "postgresql":
+        return False
+    return bool(
+        db.execute(
+            text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)"), {"table": table}
+        ).first()
+    )
+
+
+def list_partitions(db: Session, table: str) -> List[str]:
+    rows = db.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(:table) ORDER BY c.relname"
+        ),
+        {"table": table},
+    )
+    return [row[0] for row in rows]
+
+
+def _create_partition(db: Session, table: str, month: date, partitions: List[str]) -> None:
+    """One transaction: create ``month``'s partition, moving any of its rows out of the default partition."""
+    name, default = partition_name(table, month), f"{table}_default"
+    bounds = {"lo": month, "hi": add_months(month, 1)}
+    qt, qn, qd = _quote(db, table), _quote(db, name), _quote(db, default)
+    in_month = f"{PARTITION_KEY} >= :lo AND {PARTITION_KEY} < :hi"
+
+    stray = default in partitions and db.execute(text(f"SELECT 1 FROM {qd} WHERE {in_month} LIMIT 1"), bounds).first()
+    if stray:
+        # PostgreSQL refuses a partition whose rows sit in the default one; move them across.
+        db.execute(text(f"ALTER TABLE {qt} DETACH PARTITION {qd}"))
+    db.execute(text(f"CREATE TABLE {qn} PARTITION OF {qt} FOR VALUES FROM ('{bounds['lo']}') TO ('{bounds['hi']}')"))
+    if stray:
+        db.execute(text(f"INSERT INTO {qn} SELECT * FROM {qd} WHERE {in_month}"), bounds)
+        db.execute(text(f"DELETE FROM {qd} WHERE {in_month}"), bounds)
+        db.execute(text(f"ALTER TABLE {qt} ATTACH PARTITION {qd} DEFAULT"))
+    db.commit()
+
+
+def ensure_partitions(db: Session, table: str, months_ahead: int, today: Optional[date] = None) -> List[str]:
+    """Create the partitions for the current month and ``months_ahead`` more. Returns those created."""
+    current = month_start(today or datetime.utcnow().date())
+    partitions = list_partitions(db, table)
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if partition_name(table, month) not in partitions:
+            _create_partition(db, table, month, partitions)
+            created.append(partition_name(table, month))
+    return created
+
+
+def expire_partitions(
+    db: Session, table: str, retention_months: int, detach: bool = False, today: Optional[date] = None
+) -> List[str]:
+    """
+    Drop (or detach, to archive) the partitions of months entirely older than
+    ``retention_months``. Dropped screenshot partitions release their media blobs
+    first, and gc removes the files. Detached ones keep their references, so an
+    archived partition's media stays on disk. Returns the partitions expired.
+    """
+    if retention_months <= 0:
+        return []
+    cutoff = add_months(month_start(today or datetime.utcnow().date()), -retention_months)
+    expired = []
+    for name in list_partitions(db, table):
+        month = partition_month(name)
+        if month is None or month >= cutoff:
+            continue
+        if table == "core_screenshot" and not detach:
+            release_partition_blobs(db, name)
+        if detach:
+            db.execute(text(f"ALTER TABLE {_quote(db, table)} DETACH PARTITION {_quote(db, name)}"))
+        else:
+            db.execute(text(f"DROP TABLE {_quote(db, name)}"))
+        db.commit()
+        expired.append(name)
+    return expired
+
+
+def maintain(
+    db: Session, months_ahead: int, retention_months: int, detach: bool = False
+) -> Dict[str, Dict[str, List[str]]]:
+    report = {}
+    for table in PARTITIONED_TABLES:
+        if not is_partitioned(db, table):
+            continue
+        report[table] = {
+            "created": ensure_partitions(db, table, months_ahead),
+            "expired": expire_partitions(db, table, retention_months, detach),
+        }
+    return report
+
+
+def partition_status(db: Session) -> List[Tuple[str, str, int, int]]:
+    """(table, partition, estimated rows, bytes) for every partition."""
+    rows = []
+    for table in PARTITIONED_TABLES:
+        if not is_partitioned(db, table):
+            continue
+        for name in list_partitions(db, table):
+            estimate, size = db.execute(
+                text(
+                    "SELECT GREATEST(reltuples, 0)::bigint, pg_total_relation_size(oid) "
+                    "FROM pg_class WHERE oid = to_regclass(:name)"
+                ),
+                {"name": name},
+            ).one()
+            rows.append((table, name, estimate, size))
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Monthly partition maintenance (PostgreSQL)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="partitions with estimated rows and size")
+    maintain_parser = commands.add_parser("maintain", help="create upcoming months, expire old ones")
+    maintain_parser.add_argument("--months-ahead", type=int, default=settings.PARTITION_MONTHS_AHEAD)
+    maintain_parser.add_argument(
+        "--retention-months", type=int, default=settings.PARTITION_RETENTION_MONTHS, help="0 keeps every month"
+    )
+    maintain_parser.add_argument("--detach", action="store_true", help="detach expired months instead of dropping")
+    maintain_parser.add_argument("--loop", action="store_true", help="keep running, one pass per interval")
+    maintain_parser.add_argument("--interval", type=int, default=86400, help="seconds between passes with --loop")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if not any(is_partitioned(db, table) for table in PARTITIONED_TABLES):
+            print("[partitions] no partitioned tables (PostgreSQL with migration 0005 required)")
+            return
+        if args.command == "status":
+            for table, name, estimate, size in partition_status(db):
+                print(f"[partitions] table={table} partition={name} rows~{estimate} bytes={size}")
+            return
+    finally:
+        db.close()
+
+    while True:
+        db = SessionLocal()
+        try:
+            report = maintain(db, args.months_ahead, args.retention_months, args.detach)
+        finally:
+            db.close()
+        for table, changes in report.items():
+            print(
+                f"[partitions] table={table} created={len(changes['created'])} "
+                f"{'detached' if args.detach else 'dropped'}={len(changes['expired'])}"
+            )
+        if not args.loop:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+from dataclasses import dataclass
+from functools import cached_property
+import hashlib
+import json
+import threading
+import time
+from typing import Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .models import Company, CompanyPolicy
+
+
+@dataclass(frozen=True)
+class PolicySnapshot:
+    """A company's rendered tracker config plus the company block of /employee-config/."""
+
+    company_id: Optional[int]
+    config: dict
+    company: dict
+
+    @property
+    def config_version(self) -> Optional[int]:
+        return self.config.get("config_version")
+
+    @cached_property
+    def etag(self) -> str:
+        # Hash of everything /employee-config/ serves, so company renames change it as well as policy edits.
+        body = json.dumps({"config": self.config, "company": self.company}, sort_keys=True, default=str)
+        return f'W/"cfg-{self.company_id}-{hashlib.sha1(body.encode("utf-8")).hexdigest()[:16]}"'
+
+
+def get_or_create_policy(db: Session, company_id: Optional[int]) -> CompanyPolicy:
+    policy = db.query(CompanyPolicy).filter(CompanyPolicy.company_id == company_id).first()
+    if not policy:
+        policy = CompanyPolicy(company_id=company_id, config_version=1)
+        db.add(policy)
+        db.commit()
+        db.refresh(policy)
+    return policy
+
+
+def policy_config(policy: CompanyPolicy) -> dict:
+    return {
+        "screenshots_enabled": bool(policy.screenshots_enabled),
+        "website_tracking_enabled": bool(policy.website_tracking_enabled),
+        "app_tracking_enabled": bool(policy.app_tracking_enabled),
+        "screenshot_interval_seconds": policy.screenshot_interval_seconds,
+        "idle_threshold_seconds": policy.idle_threshold_seconds,
+        "config_sync_interval_seconds": policy.config_sync_interval_seconds,
+        "max_screenshot_size_mb": policy.max_screenshot_size_mb,
+        "screenshot_quality": policy.screenshot_quality,
+        "enable_keyboard_tracking": bool(policy.enable_keyboard_tracking),
+        "enable_mouse_tracking": bool(policy.enable_mouse_tracking),
+        "enable_idle_detection": bool(policy.enable_idle_detection),
+        "show_tracker_notification": bool(policy.show_tracker_notification),
+        "notification_interval_minutes": policy.notification_interval_minutes,
+        "local_data_retention_days": policy.local_data_retention_days,
+        "config_version": policy.config_version,
+        "updated_at": policy.updated_at.isoformat() if policy.updated_at else None,
+    }
+
+
+class PolicyCache:
+    """
+    Per-worker cache of company_id -> PolicySnapshot.
+
+    Policy edits invalidate the local worker immediately; other workers reload
+    once the entry's TTL expires.
+    """
+
+    def __init__(self, ttl_seconds: int) -> None:
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[Optional[int], tuple] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, db: Session, company_id: Optional[int]) -> PolicySnapshot:
+        with self._lock:
+            entry = self._entries.get(company_id)
+            if entry is not None and entry[1] > time.monotonic():
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        snapshot = self._load(db, company_id)
+        if self.ttl_seconds > 0:
+            with self._lock:
+                self._entries[company_id] = (snapshot, time.monotonic() + self.ttl_seconds)
+        return snapshot
+
+    def invalidate(self, company_id: Optional[int]) -> None:
+        with self._lock:
+            if self._entries.pop(company_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+    @staticmethod
+    def _load(db: Session, company_id: Optional[int]) -> PolicySnapshot:
+        policy = get_or_create_policy(db, company_id)
+        company = db.get(Company, company_id) if company_id else None
+        return PolicySnapshot(
+            company_id=company_id,
+            config=policy_config(policy),
+            company={
+                "name": company.name if company else None,
+                "status": company.status if company else None,
+                "is_active": True,
+            },
+        )
+
+
+policy_cache = PolicyCache(settings.POLICY_CACHE_TTL_SECONDS)
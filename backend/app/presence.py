@@ -0,0 +1,117 @@
+"""
+Coalesced agent presence (``User.last_agent_sync_at``).
+
+Every authenticated agent call records a last-seen time in memory. A background
+thread writes all of them in one UPDATE every ``PRESENCE_FLUSH_SECONDS``, so
+``core_user`` rows are not locked per request. Views overlay the worker's live
+snapshot on the stored column, so the local worker's view is never stale.
+
+The views still read the column. They list every agent, including those never
+seen, and each worker's snapshot only holds its own agents from the last hour.
+The column carries the rest (other workers, older sightings, restarts).
+"""
+from datetime import datetime, timedelta
+import logging
+import threading
+from typing import Dict, Optional
+
+from sqlalchemy import case, update
+
+from .config import settings
+from .db import IngestSessionLocal
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+
+class PresenceTracker:
+    def __init__(self, flush_seconds: int) -> None:
+        self.flush_seconds = max(flush_seconds, 1)
+        self._pending: Dict[int, datetime] = {}
+        self._seen: Dict[int, datetime] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self.touches = 0
+        self.flushes = 0
+        self.rows_written = 0
+
+    def touch(self, user_id: int, when: Optional[datetime] = None) -> None:
+        when = when or datetime.utcnow()
+        with self._lock:
+            self.touches += 1
+            self._pending[user_id] = when
+            self._seen[user_id] = when
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="presence-flusher", daemon=True)
+                self._thread.start()
+
+    def last_seen(self, user_id: int, stored: Optional[datetime] = None) -> Optional[datetime]:
+        """The later of the stored column value and this worker's in-memory sighting."""
+        with self._lock:
+            live = self._seen.get(user_id)
+        if live is None or (stored is not None and stored >= live):
+            return stored
+        return live
+
+    def snapshot(self) -> Dict[int, datetime]:
+        with self._lock:
+            return dict(self._seen)
+
+    def flush(self) -> int:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            # Older sightings are in the DB by now; keep the snapshot bounded.
+            cutoff = datetime.utcnow() - timedelta(hours=1)
+            self._seen = {uid: seen for uid, seen in self._seen.items() if seen >= cutoff}
+        if not pending:
+            return 0
+
+        db = IngestSessionLocal()
+        try:
+            db.execute(
+                update(User)
+                .where(User.id.in_(list(pending)))
+                .values(last_agent_sync_at=case(pending, value=User.id))
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            with self._lock:
+                # Retry next round unless a newer sighting arrived meanwhile.
+                for uid, seen in pending.items():
+                    self._pending.setdefault(uid, seen)
+            raise
+        finally:
+            db.close()
+        with self._lock:
+            self.flushes += 1
+            self.rows_written += len(pending)
+        return len(pending)
+
+    def stop(self) -> None:
+        """Stop the flusher and write whatever is still pending."""
+        self._stopping.set()
+        self.flush()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "tracked_agents": len(self._seen),
+                "pending_agents": len(self._pending),
+                "flush_seconds": self.flush_seconds,
+                "touches": self.touches,
+                "flushes": self.flushes,
+                "rows_written": self.rows_written,
+            }
+
+    def _run(self) -> None:
+        while not self._stopping.wait(self.flush_seconds):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Presence flush failed; will retry")
+
+
+presence = PresenceTracker(settings.PRESENCE_FLUSH_SECONDS)
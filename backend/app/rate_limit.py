@@ -0,0 +1,139 @@
+"""
+Token-bucket rate limits for tracker uploads, per agent and per company.
+
+Each upload kind ("activity", "screenshot") has one bucket per agent and one per
+company. A request spends a token from both or from neither. Rejected requests
+get ``429`` with ``Retry-After`` set to when both buckets will have a token
+again, so one company's runaway agents back off instead of filling the shared
+workers and database.
+
+Buckets live in the worker process, like the identity cache: with N API workers
+a company can reach N times the configured rate.
+"""
+from collections import OrderedDict
+import math
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException
+
+from .config import settings
+
+
+class TokenBucket:
+    """``capacity`` tokens, refilled continuously at ``rate`` tokens per second."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated_at")
+
+    def __init__(self, rate: float, capacity: float, now: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = now
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_seconds(self, cost: float = 1.0) -> float:
+        """Seconds until ``cost`` tokens are available (0 if they are now)."""
+        missing = cost - self.tokens
+        return 0.0 if missing <= 0 else missing / self.rate
+
+
+class UploadRateLimiter:
+    """Per-worker agent and company buckets, LRU-bounded to ``max_buckets``."""
+
+    def __init__(
+        self,
+        agent_per_minute: int,
+        agent_burst: int,
+        company_per_minute: int,
+        company_burst: int,
+        max_buckets: int,
+    ) -> None:
+        self.limits = {
+            "agent": (agent_per_minute / 60.0, max(agent_burst, 1)),
+            "company": (company_per_minute / 60.0, max(company_burst, 1)),
+        }
+        self.max_buckets = max_buckets
+        self._buckets: "OrderedDict[Tuple[str, str, int], TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.limited = {"agent": 0, "company": 0}
+        self.limited_by_company: Dict[Optional[int], int] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return settings.RATE_LIMIT_ENABLED and any(rate > 0 for rate, _ in self.limits.values())
+
+    def _bucket(self, kind: str, scope: str, key: int, now: float) -> Optional[TokenBucket]:
+        rate, capacity = self.limits[scope]
+        if rate <= 0:
+            return None
+        bucket_key = (kind, scope, key)
+        bucket = self._buckets.get(bucket_key)
+        if bucket is None:
+            bucket = self._buckets[bucket_key] = TokenBucket(rate, capacity, now)
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)  # a dropped bucket comes back full
+        else:
+            self._buckets.move_to_end(bucket_key)
+            bucket.refill(now)
+        return bucket
+
+    def acquire(self, kind: str, agent_id: int, company_id: Optional[int]) -> float:
+        """Take one ``kind`` token for the agent and its company; returns 0, or seconds to wait."""
+        if not self.enabled:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            buckets = {"agent": self._bucket(kind, "agent", agent_id, now)}
+            if company_id is not None:
+                buckets["company"] = self._bucket(kind, "company", company_id, now)
+            waits = {scope: bucket.wait_seconds() for scope, bucket in buckets.items() if bucket is not None}
+            blocked = {scope: wait for scope, wait in waits.items() if wait > 0}
+            if not blocked:
+                for bucket in buckets.values():
+                    if bucket is not None:
+                        bucket.tokens -= 1
+                self.allowed += 1
+                return 0.0
+            for scope in blocked:
+                self.limited[scope] += 1
+            self.limited_by_company[company_id] = self.limited_by_company.get(company_id, 0) + 1
+            return max(blocked.values())
+
+    def check(self, kind: str, agent_id: int, company_id: Optional[int]) -> None:
+        """Raise 429 with ``Retry-After`` when the agent or its company is over its ``kind`` rate."""
+        wait = self.acquire(kind, agent_id, company_id)
+        if wait > 0:
+            raise HTTPException(
+                status_code=429,
+                detail="Upload rate limit exceeded",
+                headers={"Retry-After": str(max(1, math.ceil(wait)))},
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            top = sorted(self.limited_by_company.items(), key=lambda item: item[1], reverse=True)[:10]
+            return {
+                "enabled": self.enabled,
+                "agent_per_minute": settings.RATE_LIMIT_AGENT_PER_MINUTE,
+                "company_per_minute": settings.RATE_LIMIT_COMPANY_PER_MINUTE,
+                "buckets": len(self._buckets),
+                "allowed": self.allowed,
+                "limited_agent": self.limited["agent"],
+                "limited_company": self.limited["company"],
+                "top_limited_companies": [{"company_id": cid, "limited": count} for cid, count in top],
+            }
+
+
+upload_rate_limiter = UploadRateLimiter(
+    settings.RATE_LIMIT_AGENT_PER_MINUTE,
+    settings.RATE_LIMIT_AGENT_BURST,
+    settings.RATE_LIMIT_COMPANY_PER_MINUTE,
+    settings.RATE_LIMIT_COMPANY_BURST,
+    settings.RATE_LIMIT_MAX_BUCKETS,
+)
@@ -0,0 +1,138 @@
+"""
+Request body decoding for tracker endpoints.
+
+Agents may send ``Content-Encoding: gzip`` (or ``zstd`` when the ``zstandard``
+package is installed) and ``Content-Type: application/msgpack`` (when ``msgpack``
+is installed) instead of plain JSON. The body is decoded before FastAPI parses it,
+with caps on both the wire size and the decoded size. JSON is parsed, and plain
+dict/list results are rendered, with orjson when available (``fast_json``).
+"""
+import functools
+import gzip
+import inspect
+import io
+import zlib
+
+from fastapi import HTTPException, Request
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.routing import APIRoute
+
+from .config import settings
+from .fast_json import FastJSONResponse, loads
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_TYPES = {"application/msgpack", "application/x-msgpack", "application/vnd.msgpack"}
+
+
+def _too_large(limit: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Request body exceeds {limit} bytes")
+
+
+def _bounded_read(stream, limit: int) -> bytes:
+    # Read one byte past the limit so a decompression bomb is detected without inflating it.
+    data = stream.read(limit + 1)
+    if len(data) > limit:
+        raise _too_large(limit)
+    return data
+
+
+def decode_body(raw: bytes, encoding: str) -> bytes:
+    limit = settings.AGENT_BODY_MAX_DECODED_BYTES
+    try:
+        if encoding in ("gzip", "x-gzip"):
+            with gzip.GzipFile(fileobj=io.BytesIO(raw)) as stream:
+                return _bounded_read(stream, limit)
+        if encoding == "deflate":
+            data = zlib.decompressobj().decompress(raw, limit + 1)
+            if len(data) > limit:
+                raise _too_large(limit)
+            return data
+        if encoding == "zstd" and zstandard is not None:
+            with zstandard.ZstdDecompressor().stream_reader(io.BytesIO(raw)) as stream:
+                return _bounded_read(stream, limit)
+    except HTTPException:
+        raise
+    except Exception as exc:
+        raise HTTPException(status_code=400, detail=f"Invalid {encoding} body: {exc}")
+    raise HTTPException(status_code=415, detail=f"Unsupported Content-Encoding: {encoding}")
+
+
+class AgentRequest(Request):
+    """Request whose body()/json() transparently undo Content-Encoding and msgpack."""
+
+    async def body(self) -> bytes:
+        if not hasattr(self, "_body"):
+            encoding = self.headers.get("content-encoding", "identity").strip().lower()
+            if encoding == "identity":
+                self._body = await super().body()
+            else:
+                limit = settings.AGENT_BODY_MAX_BYTES
+                chunks = []
+                received = 0
+                async for chunk in self.stream():
+                    received += len(chunk)
+                    if received > limit:
+                        raise _too_large(limit)
+                    chunks.append(chunk)
+                self._body = decode_body(b"".join(chunks), encoding)
+        return self._body
+
+    async def json(self):
+        if not hasattr(self, "_json"):
+            body = await self.body()
+            if self.scope.get("agent_body_format") == "msgpack":
+                try:
+                    self._json = msgpack.unpackb(body, raw=False)
+                except Exception as exc:
+                    raise HTTPException(status_code=400, detail=f"Invalid msgpack body: {exc}")
+            else:
+                self._json = loads(body)
+        return self._json
+
+
+def _fast_json_endpoint(endpoint):
+    @functools.wraps(endpoint)
+    async def endpoint_with_fast_json(*args, **kwargs):
+        result = await endpoint(*args, **kwargs)
+        # A Response is returned as is; FastAPI would run dicts through jsonable_encoder first.
+        if isinstance(result, (dict, list)):
+            return FastJSONResponse(result)
+        return result
+
+    return endpoint_with_fast_json
+
+
+class AgentRoute(APIRoute):
+    def __init__(self, path: str, endpoint, **kwargs) -> None:
+        response_model = kwargs.get("response_model")
+        # Routes with an explicit response_model keep FastAPI's own (pydantic) serialization.
+        if inspect.iscoroutinefunction(endpoint) and (response_model is None or isinstance(response_model, DefaultPlaceholder)):
+            endpoint = _fast_json_endpoint(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def agent_route_handler(request: Request):
+            content_type = request.headers.get("content-type", "").split(";", 1)[0].strip().lower()
+            if content_type in MSGPACK_TYPES:
+                if msgpack is None:
+                    raise HTTPException(status_code=415, detail="msgpack bodies are not supported by this server")
+                # FastAPI only parses bodies it sees as JSON; json() above decodes msgpack instead.
+                request.scope["agent_body_format"] = "msgpack"
+                request.scope["headers"] = [
+                    (key, b"application/json" if key == b"content-type" else value)
+                    for key, value in request.scope["headers"]
+                ]
+            return await handler(AgentRequest(request.scope, request.receive))
+
+        return agent_route_handler
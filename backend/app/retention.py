@@ -0,0 +1,280 @@
+"""
+Per-company retention: purge expired screenshots, usage rows and activity logs.
+
+Each company's cutoffs come from its plan and policy:
+
+- screenshots: ``SubscriptionTier.screenshot_retention_days`` of the company's
+  subscription (``RETENTION_DEFAULT_SCREENSHOT_DAYS`` without one)
+- application / website usage, activity logs and accepted upload ids:
+  ``CompanyPolicy.local_data_retention_days``
+
+Empty or 0 keeps everything, and no cutoff is ever closer than
+``RETENTION_MIN_DAYS``. Rows go in batches of ``RETENTION_BATCH_SIZE``. Each
+batch is its own short transaction, followed by a ``RETENTION_BATCH_PAUSE_MS``
+pause, so a purge never holds locks for long. With ``RETENTION_WINDOW_HOURS``
+(e.g. ``20-6``, UTC), a pass stops at the end of the window and resumes in the
+next one. Screenshot rows release their media blobs, and their loose files and
+emptied packs are deleted after the batch commits. Daily rollups and hourly
+heatmap aggregates are kept.
+
+Usage (from backend/):
+    python -m app.retention report                   # expired rows per company
+    python -m app.retention purge --window 20-6
+    python -m app.retention purge --loop --interval 3600
+"""
+import argparse
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import os
+import time
+from typing import Callable, Dict, List, Optional, Set
+
+from sqlalchemy import delete, func, or_, select
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .db import SessionLocal
+from .media_blobs import MEDIA_COLUMNS, is_blob, release_blob
+from .models import (
+    ActivityBatch,
+    ActivityLog,
+    ApplicationUsage,
+    Company,
+    CompanyPolicy,
+    Screenshot,
+    StripeBillingSubscription,
+    SubscriptionTier,
+    WebsiteUsage,
+)
+from .screenshot_packs import is_packed, parse_member
+
+# Purged with the policy's data retention, in this order.
+DATA_MODELS = (ActivityLog, ApplicationUsage, WebsiteUsage, ActivityBatch)
+
+
+@dataclass
+class RetentionPolicy:
+    company_id: int
+    screenshot_days: Optional[int]
+    data_days: Optional[int]
+
+    def cutoff(self, days: Optional[int], now: datetime) -> Optional[datetime]:
+        if not days or days <= 0:
+            return None
+        return now - timedelta(days=max(days, settings.RETENTION_MIN_DAYS))
+
+
+def company_policies(db: Session, company_id: Optional[int] = None) -> List[RetentionPolicy]:
+    # One subscription per company, as on the billing pages; the newest wins if there are several.
+    latest = (
+        select(StripeBillingSubscription.company_id, func.max(StripeBillingSubscription.id).label("id"))
+        .group_by(StripeBillingSubscription.company_id)
+        .subquery()
+    )
+    tiers = dict(
+        db.execute(
+            select(latest.c.company_id, SubscriptionTier.screenshot_retention_days)
+            .join(StripeBillingSubscription, StripeBillingSubscription.id == latest.c.id)
+            .join(SubscriptionTier, SubscriptionTier.id == StripeBillingSubscription.tier_id)
+        ).all()
+    )
+    data_days = dict(db.execute(select(CompanyPolicy.company_id, CompanyPolicy.local_data_retention_days)).all())
+    companies = select(Company.id).order_by(Company.id)
+    if company_id is not None:
+        companies = companies.where(Company.id == company_id)
+    return [
+        RetentionPolicy(
+            company_id=cid,
+            screenshot_days=tiers.get(cid, settings.RETENTION_DEFAULT_SCREENSHOT_DAYS),
+            data_days=data_days.get(cid),
+        )
+        for cid in db.scalars(companies)
+    ]
+
+
+def parse_window(window: str) -> Optional[Set[int]]:
+    """UTC hours allowed by ``"20-6"`` (wrapping past midnight); None means any hour."""
+    if not window:
+        return None
+    start, _, end = window.partition("-")
+    start, end = int(start) % 24, int(end or start) % 24
+    if start == end:
+        return None
+    hours, hour = set(), start
+    while hour != end:
+        hours.add(hour)
+        hour = (hour + 1) % 24
+    return hours
+
+
+def _expired(model, company_id: int, cutoff: datetime):
+    return (model.company_id == company_id, model.created_at < cutoff)
+
+
+def _remove_media(paths: Set[str], packs: Set[str], db: Session) -> None:
+    """Delete loose files and packs no remaining screenshot points into (blobs are left to gc)."""
+    for rel_path in paths:
+        try:
+            os.remove(settings.MEDIA_ROOT / rel_path)
+        except FileNotFoundError:
+            pass
+    for pack in packs:
+        members = or_(*(column.like(pack + "/%") for column in MEDIA_COLUMNS))
+        if db.scalar(select(Screenshot.id).where(members).limit(1)) is None:
+            try:
+                os.remove(settings.MEDIA_ROOT / pack)
+            except FileNotFoundError:
+                pass
+
+
+def _purge_screenshot_batch(db: Session, company_id: int, cutoff: datetime, limit: int) -> int:
+    rows = db.execute(
+        select(Screenshot.id, *MEDIA_COLUMNS).where(*_expired(Screenshot, company_id, cutoff)).limit(limit)
+    ).all()
+    if not rows:
+        return 0
+    loose, packs = set(), set()
+    for row in rows:
+        for path in row[1:]:
+            if not path:
+                continue
+            if is_blob(path):
+                release_blob(db, path)
+            elif is_packed(path):
+                member = parse_member(path)
+                if member:
+                    packs.add(member[0])
+            else:
+                loose.add(path)
+    # The created_at bound keeps the delete to the expired partitions when the table is partitioned.
+    db.execute(
+        delete(Screenshot).where(Screenshot.id.in_([row[0] for row in rows]), Screenshot.created_at < cutoff)
+    )
+    db.commit()
+    _remove_media(loose, packs, db)
+    return len(rows)
+
+
+def _purge_data_batch(db: Session, model, company_id: int, cutoff: datetime, limit: int) -> int:
+    ids = db.scalars(select(model.id).where(*_expired(model, company_id, cutoff)).limit(limit)).all()
+    if not ids:
+        return 0
+    db.execute(delete(model).where(model.id.in_(ids), model.created_at < cutoff))
+    db.commit()
+    return len(ids)
+
+
+def purge_company(
+    db: Session,
+    policy: RetentionPolicy,
+    batch_size: int,
+    pause: float,
+    allowed: Callable[[], bool],
+    progress: Callable[[str, int], None] = lambda table, deleted: None,
+) -> Dict[str, int]:
+    """Purge one company's expired rows batch by batch; stops early once ``allowed()`` turns False."""
+    now = datetime.utcnow()
+    plan = [(Screenshot, policy.cutoff(policy.screenshot_days, now))]
+    plan += [(model, policy.cutoff(policy.data_days, now)) for model in DATA_MODELS]
+    deleted: Dict[str, int] = {}
+    for model, cutoff in plan:
+        if cutoff is None:
+            continue
+        table = model.__tablename__
+        while allowed():
+            if model is Screenshot:
+                count = _purge_screenshot_batch(db, policy.company_id, cutoff, batch_size)
+            else:
+                count = _purge_data_batch(db, model, policy.company_id, cutoff, batch_size)
+            if not count:
+                break
+            deleted[table] = deleted.get(table, 0) + count
+            progress(table, deleted[table])
+            time.sleep(pause)
+    return deleted
+
+
+def expired_report(db: Session, company_id: Optional[int] = None) -> List[dict]:
+    """Rows past their cutoff, per company and table, without deleting anything."""
+    now = datetime.utcnow()
+    report = []
+    for policy in company_policies(db, company_id):
+        row = {
+            "company_id": policy.company_id,
+            "screenshot_days": policy.screenshot_days,
+            "data_days": policy.data_days,
+        }
+        for model, days in [(Screenshot, policy.screenshot_days)] + [(m, policy.data_days) for m in DATA_MODELS]:
+            cutoff = policy.cutoff(days, now)
+            row[model.__tablename__] = (
+                db.scalar(select(func.count(model.id)).where(*_expired(model, policy.company_id, cutoff)))
+                if cutoff
+                else 0
+            )
+        report.append(row)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Purge expired data per company retention")
+    commands = parser.add_subparsers(dest="command", required=True)
+    report_parser = commands.add_parser("report", help="expired rows per company, nothing deleted")
+    report_parser.add_argument("--company-id", type=int, default=None)
+    purge_parser = commands.add_parser("purge", help="delete expired rows in throttled batches")
+    purge_parser.add_argument("--company-id", type=int, default=None)
+    purge_parser.add_argument("--batch-size", type=int, default=settings.RETENTION_BATCH_SIZE)
+    purge_parser.add_argument("--pause-ms", type=int, default=settings.RETENTION_BATCH_PAUSE_MS)
+    purge_parser.add_argument(
+        "--window", default=settings.RETENTION_WINDOW_HOURS, help='UTC hours to run in, e.g. "20-6" (default: any)'
+    )
+    purge_parser.add_argument("--loop", action="store_true", help="keep running, one pass per interval")
+    purge_parser.add_argument("--interval", type=int, default=3600, help="seconds between passes with --loop")
+    args = parser.parse_args()
+
+    if args.command == "report":
+        db = SessionLocal()
+        try:
+            for row in expired_report(db, args.company_id):
+                counts = " ".join(f"{m.__tablename__}={row[m.__tablename__]}" for m in (Screenshot,) + DATA_MODELS)
+                print(
+                    f"[retention] company={row['company_id']} screenshot_days={row['screenshot_days'] or '-'} "
+                    f"data_days={row['data_days'] or '-'} expired: {counts}"
+                )
+        finally:
+            db.close()
+        return
+
+    hours = parse_window(args.window)
+
+    def allowed() -> bool:
+        return hours is None or datetime.utcnow().hour in hours
+
+    while True:
+        if allowed():
+            db = SessionLocal()
+            try:
+                for policy in company_policies(db, args.company_id):
+                    if not allowed():
+                        print("[retention] outside the purge window; resuming in the next one")
+                        break
+                    deleted = purge_company(
+                        db,
+                        policy,
+                        args.batch_size,
+                        args.pause_ms / 1000,
+                        allowed,
+                        lambda table, total, cid=policy.company_id: print(
+                            f"[retention] company={cid} table={table} deleted={total}"
+                        ),
+                    )
+                    if deleted:
+                        print(f"[retention] company={policy.company_id} done: {deleted}")
+            finally:
+                db.close()
+        if not args.loop:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+Daily ProductivityMetric rollups.
+
+One USER row per (employee, day) from WorkSession, ActivityLog and the usage
+tables, rolled up to TEAM, DEPARTMENT and COMPANY rows for the same day. A day's
+figures belong to the day its sessions started (UTC), as on the dashboards.
+
+Runs are incremental. Only (employee, day) pairs touched since the last run are
+recomputed: sessions started, ended or still open, and sessions that received an
+upload (``core_activitybatch``). The watermark is the newest USER row's
+``updated_at``, less a small overlap, so no extra state table is needed.
+Recomputing a pair is idempotent. ``--days`` recomputes whole days, e.g. after a
+backfill.
+
+TEAM rows need Django's team membership table (``core_team_members``); without
+it, that level is skipped.
+
+Usage (from backend/):
+    python -m app.rollups                     # pairs touched since the last run
+    python -m app.rollups --days 30           # recompute the last 30 days
+    python -m app.rollups --loop --interval 900
+"""
+import argparse
+from collections import defaultdict
+from datetime import date, datetime, time as dt_time, timedelta
+import time
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from sqlalchemy import case, column, func, inspect, or_, select, table
+from sqlalchemy.orm import Session
+
+from .date_ranges import on_day
+from .db import SessionLocal
+from .models import ActivityBatch, ActivityLog, ApplicationUsage, ProductivityMetric, User, WebsiteUsage, WorkSession
+
+# Re-read a little before the watermark: uploads committed while the last run was reading.
+WATERMARK_OVERLAP = timedelta(minutes=5)
+METRIC_FIELDS = (
+    "total_work_time",
+    "productive_time",
+    "idle_time",
+    "break_time",
+    "total_activities",
+    "app_switches",
+    "website_visits",
+)
+TEAM_MEMBERS = table("core_team_members", column("team_id"), column("user_id"))
+
+Pair = Tuple[int, date]
+
+
+def has_team_members(db: Session) -> bool:
+    """Whether Django's team membership table exists (TEAM rows and team filters need it)."""
+    return inspect(db.get_bind()).has_table(TEAM_MEMBERS.name)
+
+
+def _day_start(day: date) -> datetime:
+    return datetime.combine(day, dt_time.min)
+
+
+def _score(productive: int, total: int) -> int:
+    return round(productive * 100 / total) if total > 0 else 0
+
+
+def watermark(db: Session) -> Optional[datetime]:
+    latest = db.scalar(select(func.max(ProductivityMetric.updated_at)).where(ProductivityMetric.metric_level == "USER"))
+    return latest - WATERMARK_OVERLAP if latest else None
+
+
+def dirty_pairs(db: Session, since: Optional[datetime], days: Optional[int] = None) -> Set[Pair]:
+    """(employee, session start day) pairs to recompute; everything when there is no watermark yet."""
+    query = select(WorkSession.employee_id, WorkSession.start_time).where(
+        WorkSession.employee_id.is_not(None), WorkSession.start_time.is_not(None)
+    )
+    if days is not None:
+        query = query.where(WorkSession.start_time >= _day_start(datetime.utcnow().date() - timedelta(days=days - 1)))
+    elif since is not None:
+        uploaded = select(ActivityBatch.work_session_id).where(ActivityBatch.created_at >= since)
+        query = query.where(
+            or_(
+                WorkSession.start_time >= since,
+                WorkSession.end_time >= since,
+                WorkSession.end_time.is_(None),
+                WorkSession.id.in_(uploaded),
+            )
+        )
+    return {(employee_id, start.date()) for employee_id, start in db.execute(query)}
+
+
+def _user_figures(db: Session, employee_id: int, day: date) -> Optional[Dict[str, int]]:
+    sessions = select(WorkSession.id).where(WorkSession.employee_id == employee_id, on_day(WorkSession.start_time, day))
+    tracked = func.coalesce(WorkSession.active_seconds, 0) + func.coalesce(WorkSession.idle_seconds, 0)
+    # An open session has no total yet; count what it has tracked so far.
+    worked = case((WorkSession.end_time.is_(None), tracked), else_=func.coalesce(WorkSession.total_seconds, tracked))
+    total, active, idle, count = db.execute(
+        select(
+            func.coalesce(func.sum(worked), 0),
+            func.coalesce(func.sum(WorkSession.active_seconds), 0),
+            func.coalesce(func.sum(WorkSession.idle_seconds), 0),
+            func.count(WorkSession.id),
+        ).where(WorkSession.id.in_(sessions))
+    ).one()
+    if not count:
+        return None
+
+    def rows(model) -> int:
+        return db.scalar(select(func.count(model.id)).where(model.work_session_id.in_(sessions))) or 0
+
+    return {
+        "total_work_time": int(total),
+        "productive_time": int(active),
+        "idle_time": int(idle),
+        "break_time": 0,  # agents do not report breaks
+        "total_activities": rows(ActivityLog),
+        # Each usage row is one stretch in one app / on one site.
+        "app_switches": rows(ApplicationUsage),
+        "website_visits": rows(WebsiteUsage),
+    }
+
+
+def _sum_figures(figures: Iterable[Dict[str, int]]) -> Dict[str, int]:
+    totals = dict.fromkeys(METRIC_FIELDS, 0)
+    for row in figures:
+        for field in METRIC_FIELDS:
+            totals[field] += row[field] or 0
+    return totals
+
+
+def _upsert(db: Session, existing: Dict[tuple, ProductivityMetric], key: tuple, figures: Dict[str, int], now: datetime):
+    company_id, level, user_id, team_id, department_id, day = key
+    metric = existing.get(key)
+    if metric is None:
+        metric = ProductivityMetric(
+            company_id=company_id,
+            metric_level=level,
+            user_id=user_id,
+            team_id=team_id,
+            department_id=department_id,
+            date=_day_start(day),
+            created_at=now,
+        )
+        db.add(metric)
+        existing[key] = metric
+    for field in METRIC_FIELDS:
+        setattr(metric, field, figures[field])
+    metric.productivity_score = _score(figures["productive_time"], figures["total_work_time"])
+    metric.updated_at = now
+
+
+def _metric_key(metric: ProductivityMetric) -> tuple:
+    return (
+        metric.company_id,
+        metric.metric_level,
+        metric.user_id,
+        metric.team_id,
+        metric.department_id,
+        metric.date.date(),
+    )
+
+
+def rollup(db: Session, pairs: Set[Pair]) -> Dict[str, int]:
+    """Recompute ``pairs`` and every group row of the company-days they fall in."""
+    stats = {"users": 0, "days": 0, "rows": 0}
+    if not pairs:
+        return stats
+    now = datetime.utcnow()
+    users = {
+        row.id: row
+        for row in db.execute(
+            select(User.id, User.company_id, User.department_id).where(User.id.in_({u for u, _ in pairs}))
+        )
+    }
+    days = {day for _, day in pairs}
+    companies = {users[u].company_id for u, _ in pairs if u in users}
+    existing = {
+        _metric_key(metric): metric
+        for metric in db.scalars(
+            select(ProductivityMetric).where(
+                ProductivityMetric.company_id.in_(companies),
+                ProductivityMetric.date.in_([_day_start(day) for day in days]),
+            )
+        )
+    }
+
+    for employee_id, day in pairs:
+        user = users.get(employee_id)
+        if user is None:
+            continue
+        key = (user.company_id, "USER", employee_id, None, None, day)
+        figures = _user_figures(db, employee_id, day)
+        if figures is None:
+            if key in existing:
+                db.delete(existing.pop(key))
+            continue
+        _upsert(db, existing, key, figures, now)
+        stats["rows"] += 1
+    db.flush()
+
+    # Group levels: rebuilt from the day's USER rows, touched or not.
+    user_rows = defaultdict(list)
+    for key, metric in existing.items():
+        if key[1] == "USER":
+            user_rows[(key[0], key[5])].append(metric)
+    departments = dict(db.execute(select(User.id, User.department_id).where(User.company_id.in_(companies))).all())
+    teams = defaultdict(set)
+    if has_team_members(db):
+        for team_id, user_id in db.execute(select(TEAM_MEMBERS.c.team_id, TEAM_MEMBERS.c.user_id)):
+            teams[user_id].add(team_id)
+
+    for (company_id, day), rows in user_rows.items():
+        if day not in days:
+            continue
+        groups = defaultdict(list)
+        for metric in rows:
+            figures = {field: getattr(metric, field) for field in METRIC_FIELDS}
+            groups[(company_id, "COMPANY", None, None, None, day)].append(figures)
+            if departments.get(metric.user_id):
+                groups[(company_id, "DEPARTMENT", None, None, departments[metric.user_id], day)].append(figures)
+            for team_id in teams.get(metric.user_id, ()):
+                groups[(company_id, "TEAM", None, team_id, None, day)].append(figures)
+        for key, members in groups.items():
+            _upsert(db, existing, key, _sum_figures(members), now)
+            stats["rows"] += 1
+    # Group rows left without members (e.g. someone changed department) are stale.
+    for key in [k for k, m in existing.items() if k[1] != "USER" and k[5] in days and m.updated_at != now]:
+        if key[0] in companies:
+            db.delete(existing.pop(key))
+
+    db.commit()
+    stats["users"] = len({u for u, _ in pairs})
+    stats["days"] = len(days)
+    return stats
+
+
+def run_once(db: Session, days: Optional[int] = None) -> Dict[str, int]:
+    return rollup(db, dirty_pairs(db, watermark(db), days))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Roll activity up into daily ProductivityMetric rows")
+    parser.add_argument("--days", type=int, default=None, help="recompute the last N days instead of what changed")
+    parser.add_argument("--loop", action="store_true", help="keep running, one pass per interval")
+    parser.add_argument("--interval", type=int, default=900, help="seconds between passes with --loop")
+    args = parser.parse_args()
+
+    while True:
+        db = SessionLocal()
+        try:
+            stats = run_once(db, args.days)
+        finally:
+            db.close()
+        print(f"[rollups] users={stats['users']} days={stats['days']} rows={stats['rows']}")
+        if not args.loop:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,24 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+import asyncio
 import base64
+import hashlib
+import json
 import os
+from typing import List, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import select
 from fastapi import APIRouter, Depends, HTTPException, Request
-from fastapi.responses import JSONResponse
-from ..db import get_db
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from ..date_ranges import on_day
+from ..db_async import AsyncSessionLocal, get_async_db
 from ..models import (
     User,
     WorkSession,
-    ApplicationUsage,
-    WebsiteUsage,
-    ActivityLog,
     Screenshot,
     Task,
-    CompanyPolicy,
+    ActivityBatch,
 )
 from ..schemas import (
     LoginRequest,
@@ -23,15 +27,30 @@ from ..schemas import (
     StopSessionRequest,
     CheckSessionActiveRequest,
     UploadActivityRequest,
+    AgentHeartbeatRequest,
     UploadScreenshotRequest,
     GetTasksRequest,
     UpdateTaskStatusRequest,
     UpdateCompanyPolicyRequest,
+    ReplaySessionRequest,
 )
-from ..auth import verify_password, parse_auth_token, get_user_by_tracker_token
+from ..ingest import IngestBatch, ingest_activity, to_utc_naive
+from ..ingest_buffer import ingest_buffer
+from ..session_counters import close_session, live_totals
+from ..auth import verify_password, parse_auth_token
+from ..identity_cache import AgentIdentity, resolve_agent
+from ..policy_cache import get_or_create_policy, policy_cache
+from ..task_cache import assigned_task_cache
+from ..events import event_broker, publish_to_company
+from ..presence import presence
 from ..config import settings
+from ..request_codec import AgentRoute
+from ..fast_json import FastJSONResponse, dumps
+from ..screenshot_media import screenshot_pipeline
+from ..media_blobs import claim_blob, incoming_path, place_blob, reference_blob
+from ..rate_limit import upload_rate_limiter
 
-router = APIRouter()
+router = APIRouter(route_class=AgentRoute)
 
 
 def _format_time(seconds: int) -> str:
@@ -41,43 +60,57 @@ def _format_time(seconds: int) -> str:
     return f"{h:02d}:{m:02d}:{s:02d}"
 
 
-def _get_user_from_token(db: Session, request: Request) -> User:
+async def _resolve_agent(db: AsyncSession, token: Optional[str], employee_id: Optional[int] = None) -> Optional[AgentIdentity]:
+    # Cache hits never touch the connection; misses run the shared sync lookup on the async connection.
+    return await db.run_sync(resolve_agent, token, employee_id)
+
+
+async def _agent_session(db: AsyncSession, session_id: int, user_id: int) -> Optional[WorkSession]:
+    return await db.scalar(
+        select(WorkSession).where(WorkSession.id == session_id, WorkSession.employee_id == user_id)
+    )
+
+
+async def _get_user_from_token(db: AsyncSession, request: Request) -> AgentIdentity:
     token = parse_auth_token(request.headers.get("Authorization"))
     if not token:
         raise HTTPException(status_code=403, detail="Missing auth token")
-    user = get_user_by_tracker_token(db, token)
-    if not user or not user.is_active or not user.is_active_employee:
+    user = await _resolve_agent(db, token)
+    if not user:
         raise HTTPException(status_code=403, detail="Invalid token or inactive user")
     return user
 
 
 @router.post("/login")
-def login(payload: LoginRequest, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == payload.email).first()
-    if not user or not verify_password(payload.password, user.password):
-        return JSONResponse({"status": False, "message": "Invalid credentials"}, status_code=401)
+async def login(payload: LoginRequest, db: AsyncSession = Depends(get_async_db)):
+    user = await db.scalar(select(User).where(User.email == payload.email).limit(1))
+    # Password hashing is CPU-bound; keep it off the event loop.
+    if not user or not await run_in_threadpool(verify_password, payload.password, user.password):
+        return FastJSONResponse({"status": False, "message": "Invalid credentials"}, status_code=401)
 
     if not user.is_active or not user.is_active_employee:
-        return JSONResponse({"status": False, "message": "Account is inactive"}, status_code=403)
+        return FastJSONResponse({"status": False, "message": "Account is inactive"}, status_code=403)
 
     today = datetime.utcnow().date()
     sessions = (
-        db.query(WorkSession)
-        .filter(WorkSession.employee_id == user.id)
-        .filter(func.date(WorkSession.start_time) == today)
-        .all()
-    )
+        await db.scalars(
+            select(WorkSession)
+            .where(WorkSession.employee_id == user.id)
+            .where(on_day(WorkSession.start_time, today))
+        )
+    ).all()
 
     total_worked = sum(s.total_seconds or 0 for s in sessions)
     active_time = sum(s.active_seconds or 0 for s in sessions)
     inactive_time = sum(s.idle_seconds or 0 for s in sessions)
 
     open_tasks = (
-        db.query(Task)
-        .filter(Task.assigned_to_id == user.id)
-        .filter(Task.status.in_(["OPEN", "IN_PROGRESS"]))
-        .all()
-    )
+        await db.scalars(
+            select(Task)
+            .where(Task.assigned_to_id == user.id)
+            .where(Task.status.in_(["OPEN", "IN_PROGRESS"]))
+        )
+    ).all()
     task_note = "\n".join([f"- {t.title}" for t in open_tasks])
 
     data = {
@@ -95,29 +128,14 @@ def login(payload: LoginRequest, db: Session = Depends(get_db)):
 
 
 @router.post("/login-check")
-def login_check(payload: LoginCheckRequest, db: Session = Depends(get_db)):
-    exists = (
-        db.query(User)
-        .filter(User.id == payload.id)
-        .filter(User.tracker_token == payload.token)
-        .filter(User.is_active == True)
-        .filter(User.is_active_employee == True)
-        .count()
-        > 0
-    )
+async def login_check(payload: LoginCheckRequest, db: AsyncSession = Depends(get_async_db)):
+    exists = await _resolve_agent(db, payload.token, payload.id) is not None
     return {"status": exists}
 
 
 @router.post("/work-session/create")
-def start_session(payload: StartSessionRequest, db: Session = Depends(get_db)):
-    user = (
-        db.query(User)
-        .filter(User.id == payload.employee_id)
-        .filter(User.tracker_token == payload.active_token)
-        .filter(User.is_active_employee == True)
-        .filter(User.is_active == True)
-        .first()
-    )
+async def start_session(payload: StartSessionRequest, db: AsyncSession = Depends(get_async_db)):
+    user = await _resolve_agent(db, payload.active_token, payload.employee_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -130,75 +148,156 @@ def start_session(payload: StartSessionRequest, db: Session = Depends(get_db)):
         idle_seconds=0,
     )
     db.add(session)
-    db.commit()
-    db.refresh(session)
+    await db.commit()
     return {"status": True, "message": "Session started", "data": {"id": session.id}}
 
 
 @router.post("/work-session/stop")
-def stop_session(payload: StopSessionRequest, db: Session = Depends(get_db)):
-    user = (
-        db.query(User)
-        .filter(User.id == payload.employee_id)
-        .filter(User.tracker_token == payload.active_token)
-        .filter(User.is_active_employee == True)
-        .filter(User.is_active == True)
-        .first()
-    )
+async def stop_session(payload: StopSessionRequest, db: AsyncSession = Depends(get_async_db)):
+    user = await _resolve_agent(db, payload.active_token, payload.employee_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    session = (
-        db.query(WorkSession)
-        .filter(WorkSession.id == payload.session_id)
-        .filter(WorkSession.employee_id == user.id)
-        .first()
-    )
+    session = await _agent_session(db, payload.session_id, user.id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
     if session.end_time:
-        return JSONResponse({"status": False, "message": "Session already stopped"}, status_code=400)
+        return FastJSONResponse({"status": False, "message": "Session already stopped"}, status_code=400)
 
-    session.end_time = datetime.utcnow()
-    duration = (session.end_time - session.start_time).total_seconds()
-    session.total_seconds = int(duration)
+    close_session(session, datetime.utcnow())
+    await db.commit()
+    return {"status": True, "message": "Session stopped"}
 
-    active_logs = (
-        db.query(ActivityLog)
-        .filter(ActivityLog.work_session_id == session.id)
-        .filter(ActivityLog.minute_type == "ACTIVE")
-        .all()
-    )
-    active_sec = sum(log.duration_seconds or 0 for log in active_logs)
-    session.active_seconds = int(active_sec)
-    session.idle_seconds = max(0, session.total_seconds - session.active_seconds)
 
+def _replay_screenshots(db: Session, session_id: int, user: AgentIdentity, entries) -> Tuple[List[str], List[str], List[Screenshot]]:
+    """
+    Match a replayed session's screenshot manifest: (attached local ids, local ids
+    to upload, new Screenshot rows). Screenshots already on the session count as
+    attached; with MEDIA_DEDUPE, content the server already stores is attached
+    without an upload.
+    """
+    stored = set(db.scalars(select(Screenshot.capture_time).where(Screenshot.work_session_id == session_id)))
+    attached, upload, created = [], [], []
+    for entry in entries:
+        capture_time = to_utc_naive(entry.capture_time)
+        if capture_time in stored:
+            attached.append(entry.local_id)
+            continue
+        path = reference_blob(db, entry.sha256.lower()) if settings.MEDIA_DEDUPE and entry.sha256 else None
+        if path is None:
+            upload.append(entry.local_id)
+            continue
+        screenshot = Screenshot(
+            company_id=user.company_id,
+            work_session_id=session_id,
+            employee_id=user.id,
+            image=path,
+            capture_time=capture_time,
+            created_at=datetime.utcnow(),
+        )
+        db.add(screenshot)
+        created.append(screenshot)
+        stored.add(capture_time)
+        attached.append(entry.local_id)
+    return attached, upload, created
+
+
+def _replay_session(db: Session, payload: ReplaySessionRequest, user: AgentIdentity) -> Tuple[dict, List[int]]:
+    """
+    Create an offline session with its activity and known screenshots in one
+    transaction, which this commits; returns (response data, new screenshot ids).
+    Sync for ``run_sync``, like ``_ingest_upload``.
+    """
+    batch_id = f"replay:{payload.local_session_id}"
+    session_id = db.scalar(
+        select(ActivityBatch.work_session_id)
+        .where(ActivityBatch.employee_id == user.id)
+        .where(ActivityBatch.batch_id == batch_id)
+    )
+    duplicate = session_id is not None
+    counts = None
+    if not duplicate:
+        now = datetime.utcnow()
+        start_time = to_utc_naive(payload.start_time)
+        end_time = min(to_utc_naive(payload.end_time), now)
+        # A session stopped within the second it started is empty, not invalid.
+        if start_time > end_time:
+            raise HTTPException(status_code=400, detail="end_time must not be before start_time")
+        if start_time < now - timedelta(days=settings.SESSION_REPLAY_MAX_DAYS):
+            # 410, unlike 400: the only rejection after which agents drop the session.
+            raise HTTPException(status_code=410, detail=f"Sessions older than {settings.SESSION_REPLAY_MAX_DAYS} days cannot be replayed")
+
+        session = WorkSession(
+            company_id=user.company_id,
+            employee_id=user.id,
+            start_time=start_time,
+            total_seconds=0,
+            active_seconds=0,
+            idle_seconds=0,
+        )
+        db.add(session)
+        db.flush()
+        batch = IngestBatch(
+            company_id=user.company_id,
+            employee_id=user.id,
+            work_session_id=session.id,
+            applications=list(payload.applications),
+            websites=list(payload.websites),
+            activities=list(payload.activities),
+            batch_id=batch_id,
+            recorded_at=end_time,
+        )
+        # Always written inline, whatever INGEST_MODE says: the replay is one transaction.
+        counts = ingest_activity(db, [batch])
+        if counts["duplicate_batches"]:
+            # A concurrent replay of the same session committed first.
+            db.rollback()
+            return _replay_session(db, payload, user)
+        close_session(session, end_time)
+        session_id = session.id
+
+    attached, upload, created = _replay_screenshots(db, session_id, user, payload.screenshots)
     db.commit()
-    return {"status": True, "message": "Session stopped"}
+    data = {
+        "id": session_id,
+        "local_session_id": payload.local_session_id,
+        "duplicate": duplicate,
+        "inserted": counts,
+        "screenshots": {"attached": attached, "upload": upload},
+    }
+    return data, [screenshot.id for screenshot in created]
+
+
+@router.post("/work-session/replay")
+async def replay_session(payload: ReplaySessionRequest, db: AsyncSession = Depends(get_async_db)):
+    """
+    A whole session recorded offline (start, end, usage, activity and a
+    screenshot manifest), stored in one transaction. Idempotent per
+    ``local_session_id``. Screenshots listed under ``upload`` are then sent to
+    /screenshot/upload-binary with the returned session id.
+    """
+    user = await _resolve_agent(db, payload.active_token, payload.employee_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    upload_rate_limiter.check("activity", user.id, user.company_id)
+
+    data, screenshot_ids = await db.run_sync(_replay_session, payload, user)
+    for screenshot_id in screenshot_ids:
+        screenshot_pipeline.submit(screenshot_id)
+    message = "Session already replayed" if data["duplicate"] else "Session replayed"
+    return {"status": True, "message": message, "data": data}
 
 
 @router.post("/check-session-active")
-def check_session_active(payload: CheckSessionActiveRequest, db: Session = Depends(get_db)):
-    user = (
-        db.query(User)
-        .filter(User.id == payload.employee_id)
-        .filter(User.tracker_token == payload.active_token)
-        .filter(User.is_active_employee == True)
-        .filter(User.is_active == True)
-        .first()
-    )
+async def check_session_active(payload: CheckSessionActiveRequest, db: AsyncSession = Depends(get_async_db)):
+    user = await _resolve_agent(db, payload.active_token, payload.employee_id)
     if not user:
-        return JSONResponse({"status": False, "message": "Invalid user"}, status_code=400)
+        return FastJSONResponse({"status": False, "message": "Invalid user"}, status_code=400)
 
-    session = (
-        db.query(WorkSession)
-        .filter(WorkSession.id == payload.session_id)
-        .filter(WorkSession.employee_id == user.id)
-        .first()
-    )
+    session = await _agent_session(db, payload.session_id, user.id)
     if not session:
-        return JSONResponse({"status": False, "message": "Session not found"}, status_code=400)
+        return FastJSONResponse({"status": False, "message": "Session not found"}, status_code=400)
 
     if session.end_time:
         return {
@@ -210,19 +309,11 @@ def check_session_active(payload: CheckSessionActiveRequest, db: Session = Depen
     return {"status": True, "message": "Session is still active"}
 
 
-@router.post("/upload/employee-activity")
-def upload_activity(payload: UploadActivityRequest, db: Session = Depends(get_db)):
-    user = (
-        db.query(User)
-        .filter(User.id == payload.employee_id)
-        .filter(User.tracker_token == payload.active_token)
-        .filter(User.is_active_employee == True)
-        .filter(User.is_active == True)
-        .first()
-    )
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
+def _ingest_upload(db: Session, payload, user: AgentIdentity) -> Tuple[int, dict]:
+    """
+    Store (or queue) one activity upload; returns (HTTP status, response body).
+    Sync so the ingest engine is shared with the buffer flusher; call it via ``run_sync``.
+    """
     session = (
         db.query(WorkSession)
         .filter(WorkSession.id == payload.work_session_id)
@@ -232,123 +323,240 @@ def upload_activity(payload: UploadActivityRequest, db: Session = Depends(get_db
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    for app in payload.applications:
-        db.add(
-            ApplicationUsage(
-                company_id=user.company_id,
-                work_session_id=session.id,
-                employee_id=user.id,
-                app_name=app.app_name,
-                window_title=app.window_title,
-                active_seconds=app.active_seconds or 0,
-                created_at=datetime.utcnow(),
+    batch = IngestBatch.from_payload(payload, user, session.id)
+    if settings.INGEST_MODE == "buffered":
+        if not ingest_buffer.submit(batch):
+            raise HTTPException(
+                status_code=503,
+                detail="Ingest queue full",
+                headers={"Retry-After": str(ingest_buffer.retry_after_seconds)},
             )
-        )
+        return 202, {"status": True, "message": "Data queued", "data": {"queued": batch.row_count}}
 
-    for site in payload.websites:
-        db.add(
-            WebsiteUsage(
-                company_id=user.company_id,
-                work_session_id=session.id,
-                employee_id=user.id,
-                domain=site.domain,
-                url=site.url,
-                active_seconds=site.active_seconds or 0,
-                created_at=datetime.utcnow(),
-            )
-        )
+    counts = ingest_activity(db, [batch])
+    db.commit()
+    if counts["duplicate_batches"]:
+        return 200, {"status": True, "message": "Batch already synced", "data": {"inserted": counts, "duplicate": True}}
+    return 200, {"status": True, "message": "Data synced", "data": {"inserted": counts}}
 
-    for log in payload.activities:
-        db.add(
-            ActivityLog(
-                company_id=user.company_id,
-                work_session_id=session.id,
-                employee_id=user.id,
-                minute_type=log.minute_type,
-                duration_seconds=log.duration_seconds or 0,
-                created_at=datetime.utcnow(),
-            )
-        )
 
-    db.commit()
-    return {"status": True, "message": "Data synced"}
+@router.post("/upload/employee-activity")
+async def upload_activity(payload: UploadActivityRequest, db: AsyncSession = Depends(get_async_db)):
+    user = await _resolve_agent(db, payload.active_token, payload.employee_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    upload_rate_limiter.check("activity", user.id, user.company_id)
+
+    status_code, body = await db.run_sync(_ingest_upload, payload, user)
+    if status_code != 200:
+        return FastJSONResponse(status_code=status_code, content=body)
+    return body
+
+
+SCREENSHOT_EXTENSIONS = {"image/png": "png", "image/jpeg": "jpg", "image/webp": "webp"}
+
+
+def _screenshot_rel_path(session_id: int, capture_time: datetime, extension: str = "png") -> str:
+    filename = f"ss_{session_id}_{datetime.utcnow().timestamp()}.{extension}"
+    return os.path.join("screenshots", capture_time.strftime("%Y/%m/%d"), filename)
+
+
+async def _max_screenshot_bytes(db: AsyncSession, company_id: Optional[int]) -> int:
+    snapshot = await db.run_sync(policy_cache.get, company_id)
+    max_mb = snapshot.config.get("max_screenshot_size_mb") or 5
+    return max_mb * 1024 * 1024
+
+
+def _write_file(path, data: bytes) -> None:
+    os.makedirs(path.parent, exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _discard_file(path) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _decode_photo(photo: str) -> Tuple[bytes, str]:
+    """Base64 screenshot (optionally a data URL) to (bytes, sha256 hex); CPU-bound, run off the event loop."""
+    imgstr = photo.split(",", 1)[1] if "," in photo else photo
+    data = base64.b64decode(imgstr)
+    return data, hashlib.sha256(data).hexdigest()
+
+
+def _write_chunk(handle, hasher, chunk: bytes) -> None:
+    hasher.update(chunk)
+    handle.write(chunk)
+
+
+def _upload_part_path(session_id: int, capture_time: datetime, extension: str):
+    """Where an upload is written before it is moved into place; returns (part path, dated path or None)."""
+    if settings.MEDIA_DEDUPE:
+        return incoming_path(), None
+    rel_path = _screenshot_rel_path(session_id, capture_time, extension)
+    abs_path = settings.MEDIA_ROOT / rel_path
+    os.makedirs(abs_path.parent, exist_ok=True)
+    return abs_path.with_name(abs_path.name + ".part"), rel_path
+
+
+async def _place_upload(db: AsyncSession, part_path, rel_path: Optional[str], digest: str, size: int, extension: str) -> str:
+    """Move a finished upload into place and return its media path (a shared blob when MEDIA_DEDUPE is on)."""
+    if rel_path is None:
+        # Takes a blob reference in this transaction; the caller's commit publishes it.
+        path = await db.run_sync(claim_blob, digest, size, extension)
+        await run_in_threadpool(place_blob, part_path, path)
+        return path
+    await run_in_threadpool(os.replace, part_path, settings.MEDIA_ROOT / rel_path)
+    return rel_path.replace("\\", "/")
 
 
 @router.post("/screenshot/upload")
-def upload_screenshot(payload: UploadScreenshotRequest, db: Session = Depends(get_db)):
-    user = (
-        db.query(User)
-        .filter(User.id == payload.employee_id)
-        .filter(User.tracker_token == payload.active_token)
-        .filter(User.is_active_employee == True)
-        .filter(User.is_active == True)
-        .first()
-    )
+async def upload_screenshot(payload: UploadScreenshotRequest, db: AsyncSession = Depends(get_async_db)):
+    user = await _resolve_agent(db, payload.active_token, payload.employee_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    upload_rate_limiter.check("screenshot", user.id, user.company_id)
 
-    session = (
-        db.query(WorkSession)
-        .filter(WorkSession.id == payload.work_session_id)
-        .filter(WorkSession.employee_id == user.id)
-        .first()
-    )
+    session = await _agent_session(db, payload.work_session_id, user.id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    photo_data = payload.photo
-    imgstr = photo_data.split(",", 1)[1] if "," in photo_data else photo_data
-
     try:
-        decoded_image = base64.b64decode(imgstr)
+        decoded_image, digest = await run_in_threadpool(_decode_photo, payload.photo)
     except Exception as exc:
         raise HTTPException(status_code=400, detail=f"Invalid image data: {exc}")
 
     capture_time = payload.capture_time or datetime.utcnow()
-    filename = f"ss_{session.id}_{datetime.utcnow().timestamp()}.png"
-    rel_path = os.path.join("screenshots", capture_time.strftime("%Y/%m/%d"), filename)
-    abs_path = settings.MEDIA_ROOT / rel_path
-    os.makedirs(abs_path.parent, exist_ok=True)
-
-    with open(abs_path, "wb") as f:
-        f.write(decoded_image)
+    part_path, rel_path = await run_in_threadpool(_upload_part_path, session.id, capture_time, "png")
+    await run_in_threadpool(_write_file, part_path, decoded_image)
+    try:
+        image = await _place_upload(db, part_path, rel_path, digest, len(decoded_image), "png")
+    except BaseException:
+        await run_in_threadpool(_discard_file, part_path)
+        raise
 
     screenshot = Screenshot(
         company_id=user.company_id,
         work_session_id=session.id,
         employee_id=user.id,
-        image=rel_path.replace("\\", "/"),
+        image=image,
         capture_time=capture_time,
         created_at=datetime.utcnow(),
     )
     db.add(screenshot)
-    db.commit()
+    await db.commit()
+    screenshot_pipeline.submit(screenshot.id)
 
     return {"status": True, "message": "Screenshot uploaded"}
 
 
-@router.post("/tasks/get")
-def get_tasks(payload: GetTasksRequest, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == payload.id).first()
+@router.post("/screenshot/upload-binary")
+async def upload_screenshot_binary(
+    request: Request,
+    employee_id: int,
+    work_session_id: int,
+    capture_time: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Raw image bytes in the request body, streamed to MEDIA_ROOT in chunks.
+    Auth uses the ``Authorization: Token <tracker token>`` header.
+    """
+    token = parse_auth_token(request.headers.get("Authorization"))
+    user = await _resolve_agent(db, token, employee_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    upload_rate_limiter.check("screenshot", user.id, user.company_id)
 
-    tasks = db.query(Task).filter(Task.assigned_to_id == user.id).order_by(Task.created_at.desc()).all()
-    tasks_data = []
-    for task in tasks:
-        tasks_data.append(
-            {
-                "id": task.id,
-                "title": task.title,
-                "description": task.description,
-                "status": task.status,
-                "due_date": task.due_date.isoformat() if task.due_date else None,
-                "assigned_by": str(task.assigned_by_id) if task.assigned_by_id else None,
-                "created_at": task.created_at.isoformat() if task.created_at else None,
-                "completed_at": task.completed_at.isoformat() if task.completed_at else None,
-            }
-        )
+    session = await _agent_session(db, work_session_id, user.id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    max_bytes = await _max_screenshot_bytes(db, user.company_id)
+    too_large = HTTPException(status_code=413, detail=f"Screenshot exceeds {max_bytes // (1024 * 1024)} MB")
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_bytes:
+        raise too_large
+
+    content_type = (request.headers.get("content-type") or "").split(";", 1)[0].strip().lower()
+    capture_time = capture_time or datetime.utcnow()
+    extension = SCREENSHOT_EXTENSIONS.get(content_type, "png")
+    part_path, rel_path = await run_in_threadpool(_upload_part_path, session.id, capture_time, extension)
 
+    received = 0
+    hasher = hashlib.sha256()
+    handle = await run_in_threadpool(open, part_path, "wb")
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_bytes:
+                raise too_large
+            await run_in_threadpool(_write_chunk, handle, hasher, chunk)
+    except BaseException:
+        await run_in_threadpool(handle.close)
+        await run_in_threadpool(_discard_file, part_path)
+        raise
+    await run_in_threadpool(handle.close)
+
+    if not received:
+        await run_in_threadpool(_discard_file, part_path)
+        raise HTTPException(status_code=400, detail="Empty image")
+    try:
+        image = await _place_upload(db, part_path, rel_path, hasher.hexdigest(), received, extension)
+    except BaseException:
+        await run_in_threadpool(_discard_file, part_path)
+        raise
+
+    screenshot = Screenshot(
+        company_id=user.company_id,
+        work_session_id=session.id,
+        employee_id=user.id,
+        image=image,
+        capture_time=capture_time,
+        created_at=datetime.utcnow(),
+    )
+    db.add(screenshot)
+    await db.commit()
+    screenshot_pipeline.submit(screenshot.id)
+
+    return {"status": True, "message": "Screenshot uploaded", "data": {"bytes": received}}
+
+
+def _task_data(task: Task) -> dict:
+    return {
+        "id": task.id,
+        "title": task.title,
+        "description": task.description,
+        "status": task.status,
+        "due_date": task.due_date.isoformat() if task.due_date else None,
+        "assigned_by": str(task.assigned_by_id) if task.assigned_by_id else None,
+        "created_at": task.created_at.isoformat() if task.created_at else None,
+        "completed_at": task.completed_at.isoformat() if task.completed_at else None,
+    }
+
+
+async def _assigned_tasks(db: AsyncSession, user_id: int) -> List[dict]:
+    tasks = (
+        await db.scalars(select(Task).where(Task.assigned_to_id == user_id).order_by(Task.created_at.desc()))
+    ).all()
+    return [_task_data(task) for task in tasks]
+
+
+def _task_version(tasks_data: List[dict]) -> str:
+    digest = hashlib.sha1(json.dumps(tasks_data, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+@router.post("/tasks/get")
+async def get_tasks(payload: GetTasksRequest, db: AsyncSession = Depends(get_async_db)):
+    user = await db.get(User, payload.id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    tasks_data = await _assigned_tasks(db, user.id)
     return {
         "status": True,
         "data": tasks_data,
@@ -357,8 +565,8 @@ def get_tasks(payload: GetTasksRequest, db: Session = Depends(get_db)):
 
 
 @router.post("/tasks/update")
-def update_task_status(payload: UpdateTaskStatusRequest, db: Session = Depends(get_db)):
-    task = db.query(Task).filter(Task.id == payload.task_id).first()
+async def update_task_status(payload: UpdateTaskStatusRequest, db: AsyncSession = Depends(get_async_db)):
+    task = await db.get(Task, payload.task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
 
@@ -371,7 +579,8 @@ def update_task_status(payload: UpdateTaskStatusRequest, db: Session = Depends(g
     task.status = payload.status
     if payload.status == "DONE":
         task.completed_at = datetime.utcnow()
-    db.commit()
+    await db.commit()
+    assigned_task_cache.invalidate(task.assigned_to_id)
 
     return {
         "status": True,
@@ -385,25 +594,12 @@ def update_task_status(payload: UpdateTaskStatusRequest, db: Session = Depends(g
 
 
 @router.get("/session/{session_id}/active_time/")
-def session_active_time(session_id: int, db: Session = Depends(get_db)):
-    session = db.query(WorkSession).filter(WorkSession.id == session_id).first()
+async def session_active_time(session_id: int, db: AsyncSession = Depends(get_async_db)):
+    session = await db.get(WorkSession, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    if session.end_time is None:
-        duration = int((datetime.utcnow() - session.start_time).total_seconds())
-        active_sec = (
-            db.query(ActivityLog)
-            .filter(ActivityLog.work_session_id == session.id)
-            .filter(ActivityLog.minute_type == "ACTIVE")
-            .with_entities(ActivityLog.duration_seconds)
-            .all()
-        )
-        active_time = sum(a[0] or 0 for a in active_sec)
-        idle_time = max(0, duration - active_time)
-    else:
-        active_time = session.active_seconds or 0
-        idle_time = session.idle_seconds or 0
+    active_time, idle_time = live_totals(session)
 
     return {
         "active_time": active_time,
@@ -414,63 +610,141 @@ def session_active_time(session_id: int, db: Session = Depends(get_db)):
 
 
 @router.get("/employee-config/")
-def employee_config(request: Request, db: Session = Depends(get_db)):
-    user = _get_user_from_token(db, request)
-
-    policy = db.query(CompanyPolicy).filter(CompanyPolicy.company_id == user.company_id).first()
-    if not policy:
-        policy = CompanyPolicy(company_id=user.company_id, config_version=1)
-        db.add(policy)
-        db.commit()
-        db.refresh(policy)
-
-    config = {
-        "screenshots_enabled": bool(policy.screenshots_enabled),
-        "website_tracking_enabled": bool(policy.website_tracking_enabled),
-        "app_tracking_enabled": bool(policy.app_tracking_enabled),
-        "screenshot_interval_seconds": policy.screenshot_interval_seconds,
-        "idle_threshold_seconds": policy.idle_threshold_seconds,
-        "config_sync_interval_seconds": policy.config_sync_interval_seconds,
-        "max_screenshot_size_mb": policy.max_screenshot_size_mb,
-        "screenshot_quality": policy.screenshot_quality,
-        "enable_keyboard_tracking": bool(policy.enable_keyboard_tracking),
-        "enable_mouse_tracking": bool(policy.enable_mouse_tracking),
-        "enable_idle_detection": bool(policy.enable_idle_detection),
-        "show_tracker_notification": bool(policy.show_tracker_notification),
-        "notification_interval_minutes": policy.notification_interval_minutes,
-        "local_data_retention_days": policy.local_data_retention_days,
-        "config_version": policy.config_version,
-        "updated_at": policy.updated_at.isoformat() if policy.updated_at else None,
-    }
+async def employee_config(request: Request, db: AsyncSession = Depends(get_async_db)):
+    user = await _get_user_from_token(db, request)
+    snapshot = await db.run_sync(policy_cache.get, user.company_id)
+
+    # Agents re-poll this often; an unchanged config costs no DB query.
+    if request.headers.get("if-none-match") == snapshot.etag:
+        return Response(status_code=304, headers={"ETag": snapshot.etag})
+
+    return FastJSONResponse(
+        {
+            "status": True,
+            "config": snapshot.config,
+            "company": snapshot.company,
+            "timestamp": datetime.utcnow().isoformat(),
+        },
+        headers={"ETag": snapshot.etag},
+    )
+
+
+@router.post("/agent/heartbeat")
+async def agent_heartbeat(payload: AgentHeartbeatRequest, db: AsyncSession = Depends(get_async_db)):
+    """
+    One periodic call replacing check-session-active, employee-config and
+    tasks/get polling. Config and tasks are only included when the agent's
+    versions are stale; an activity upload may ride along.
+    """
+    user = await _resolve_agent(db, payload.active_token, payload.employee_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    activity = None
+    if payload.activity is not None:
+        try:
+            upload_rate_limiter.check("activity", user.id, user.company_id)
+            status_code, body = await db.run_sync(_ingest_upload, payload.activity, user)
+            activity = {**body, "status_code": status_code}
+        except HTTPException as exc:
+            activity = {"status": False, "status_code": exc.status_code, "message": exc.detail}
+            if exc.headers and "Retry-After" in exc.headers:
+                activity["retry_after"] = int(exc.headers["Retry-After"])
+
+    commands = []
+    session_state = None
+    if payload.session_id is not None:
+        session = await _agent_session(db, payload.session_id, user.id)
+        session_state = {"id": payload.session_id, "active": bool(session and session.end_time is None)}
+        if not session_state["active"]:
+            reason = "Session ended by administrator" if session else "Session not found"
+            session_state["reason"] = reason
+            commands.append({"type": "stop_session", "reason": reason})
+
+    snapshot = await db.run_sync(policy_cache.get, user.company_id)
+    config_changed = payload.config_version != snapshot.config_version
+    if config_changed:
+        commands.append({"type": "apply_config"})
+
+    cached = assigned_task_cache.get(user.id)
+    if cached is None:
+        tasks_data = await _assigned_tasks(db, user.id)
+        task_version = _task_version(tasks_data)
+        assigned_task_cache.put(user.id, task_version, tasks_data)
+    else:
+        task_version, tasks_data = cached
+    tasks_changed = payload.task_version != task_version
+    if tasks_changed:
+        commands.append({"type": "refresh_tasks"})
 
     return {
         "status": True,
-        "config": config,
-        "company": {
-            "name": user.company.name if user.company else None,
-            "status": user.company.status if user.company else None,
-            "is_active": True,
+        "data": {
+            "session": session_state,
+            "config_version": snapshot.config_version,
+            "config": snapshot.config if config_changed else None,
+            "task_version": task_version,
+            "tasks": tasks_data if tasks_changed else None,
+            "commands": commands,
+            "activity": activity,
+            "server_time": datetime.utcnow().isoformat(),
         },
-        "timestamp": datetime.utcnow().isoformat(),
     }
 
 
+def _sse(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {dumps(event).decode()}\n\n"
+
+
+@router.get("/agent/events")
+async def agent_events(request: Request):
+    """
+    Server-Sent Events stream of session_ended / config_changed / task_changed
+    for the agent owning the ``Authorization: Token`` header.
+    """
+    token = parse_auth_token(request.headers.get("Authorization"))
+    # No request-scoped session: it would stay checked out for the life of the stream.
+    async with AsyncSessionLocal() as db:
+        user = await _resolve_agent(db, token)
+    if not user:
+        raise HTTPException(status_code=403, detail="Invalid token or inactive user")
+
+    subscription = event_broker.subscribe(user.id, user.company_id)
+    keepalive = settings.AGENT_EVENTS_KEEPALIVE_SECONDS
+
+    async def stream():
+        try:
+            yield f"retry: 5000\n\n{_sse({'type': 'connected', 'employee_id': user.id})}"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), timeout=keepalive)
+                except asyncio.TimeoutError:
+                    # A connected stream counts as agent activity even when nothing else is sent.
+                    presence.touch(user.id)
+                    yield ": keepalive\n\n"
+                    continue
+                yield _sse(event)
+        finally:
+            event_broker.unsubscribe(subscription)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.post("/update-company-policy/")
-def update_company_policy(
+async def update_company_policy(
     payload: UpdateCompanyPolicyRequest,
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    user = _get_user_from_token(db, request)
+    user = await _get_user_from_token(db, request)
     if user.role != "OWNER":
         raise HTTPException(status_code=403, detail="Only OWNER can update company policy")
 
-    policy = db.query(CompanyPolicy).filter(CompanyPolicy.company_id == user.company_id).first()
-    if not policy:
-        policy = CompanyPolicy(company_id=user.company_id, config_version=1)
-        db.add(policy)
-        db.commit()
-        db.refresh(policy)
+    policy = await db.run_sync(get_or_create_policy, user.company_id)
 
     for field, value in payload.dict(exclude_unset=True).items():
         if value is None:
@@ -481,7 +755,9 @@ def update_company_policy(
             setattr(policy, field, int(value))
 
     policy.config_version = (policy.config_version or 0) + 1
-    db.commit()
+    await db.commit()
+    policy_cache.invalidate(user.company_id)
+    publish_to_company(user.company_id, "config_changed", config_version=policy.config_version)
 
     return {
         "status": True,
@@ -493,5 +769,5 @@ def update_company_policy(
 
 
 @router.post("/stripe/webhook/")
-def stripe_webhook_handler():
+async def stripe_webhook_handler():
     return {"status": "ok"}
@@ -0,0 +1,28 @@
+import hashlib
+import mimetypes
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
+
+from ..config import settings
+from ..screenshot_packs import PACK_DIR, read_member
+
+router = APIRouter()
+
+
+@router.get(f"{settings.MEDIA_URL.rstrip('/')}/{PACK_DIR}/{{member_path:path}}")
+async def packed_screenshot(member_path: str, request: Request):
+    """Serve one screenshot out of a session pack by reading its byte range."""
+    rel_path = f"{PACK_DIR}/{member_path}"
+    # Packs are immutable, so the member path identifies its content.
+    etag = f'"{hashlib.sha1(rel_path.encode("utf-8")).hexdigest()[:16]}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=86400"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    content = await run_in_threadpool(read_member, rel_path)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    media_type = mimetypes.guess_type(member_path)[0] or "application/octet-stream"
+    return Response(content, media_type=media_type, headers=headers)
@@ -1,14 +1,16 @@
 from typing import Optional
-import json
 from datetime import datetime, timedelta
 from fastapi import APIRouter, Depends, Request, Form
-from fastapi.responses import RedirectResponse, JSONResponse
+from fastapi.responses import RedirectResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy import func
 from sqlalchemy.orm import Session
 
 from ..config import settings
-from ..db import get_db
+from ..fast_json import FastJSONResponse, dumps
+from ..activity_hourly import heatmap as activity_heatmap
+from ..date_ranges import captured_in, day_range, in_month, in_range, in_week, on_day
+from ..db import get_db, pool_stats
 from ..models import (
     User,
     CompanySettings,
@@ -17,7 +19,6 @@ from ..models import (
     WorkSession,
     ApplicationUsage,
     WebsiteUsage,
-    ActivityLog,
     Screenshot,
     Task,
     TaskProgress,
@@ -33,10 +34,22 @@ from ..models import (
     AnalyticsReport,
 )
 from ..auth import verify_password, hash_password
+from ..identity_cache import agent_identity_cache
+from ..ingest_buffer import ingest_buffer
+from ..policy_cache import policy_cache
+from ..task_cache import assigned_task_cache
+from ..events import event_broker, publish_to_company, publish_to_user
+from ..presence import presence
+from ..screenshot_media import screenshot_pipeline
+from ..media_blobs import dedupe_report, release_session_blobs
+from ..rate_limit import upload_rate_limiter
+from ..session_counters import close_session, live_totals
 
 router = APIRouter()
 
 templates = Jinja2Templates(directory=str(settings.TEMPLATE_DIR))
+# Days shown by the activity heatmap when no range is given
+HEATMAP_DEFAULT_DAYS = 28
 
 
 def _get_company_settings(db: Session) -> Optional[CompanySettings]:
@@ -211,7 +224,7 @@ def admin_dashboard_view(request: Request, db: Session = Depends(get_db)):
     todays_sessions = (
         db.query(WorkSession)
         .filter(WorkSession.company_id == user.company_id)
-        .filter(func.date(WorkSession.start_time) == today)
+        .filter(on_day(WorkSession.start_time, today))
         .all()
     )
 
@@ -245,7 +258,7 @@ def admin_dashboard_view(request: Request, db: Session = Depends(get_db)):
         emp_sessions = (
             db.query(WorkSession)
             .filter(WorkSession.employee_id == emp.id)
-            .filter(func.date(WorkSession.start_time) == today)
+            .filter(on_day(WorkSession.start_time, today))
             .all()
         )
         e_total = sum(s.total_seconds or 0 for s in emp_sessions)
@@ -254,7 +267,7 @@ def admin_dashboard_view(request: Request, db: Session = Depends(get_db)):
         recent_ss = (
             db.query(Screenshot)
             .filter(Screenshot.employee_id == emp.id)
-            .filter(func.date(Screenshot.capture_time) == today)
+            .filter(captured_in(Screenshot.capture_time, Screenshot.created_at, day_range(today)))
             .order_by(Screenshot.capture_time.desc())
             .limit(10)
             .all()
@@ -263,6 +276,7 @@ def admin_dashboard_view(request: Request, db: Session = Depends(get_db)):
         recent_ss_json = [
             {
                 "image_url": f"{settings.MEDIA_URL}{ss.image}" if ss.image else "",
+                "thumbnail_url": f"{settings.MEDIA_URL}{ss.thumbnail or ss.image}" if ss.image else "",
                 "capture_time": ss.capture_time.strftime("%H:%M") if ss.capture_time else "",
             }
             for ss in recent_ss
@@ -271,7 +285,7 @@ def admin_dashboard_view(request: Request, db: Session = Depends(get_db)):
         top_apps = (
             db.query(ApplicationUsage.app_name, func.sum(ApplicationUsage.active_seconds).label("total"))
             .filter(ApplicationUsage.employee_id == emp.id)
-            .filter(func.date(ApplicationUsage.created_at) == today)
+            .filter(on_day(ApplicationUsage.created_at, today))
             .group_by(ApplicationUsage.app_name)
             .order_by(func.sum(ApplicationUsage.active_seconds).desc())
             .limit(5)
@@ -281,7 +295,7 @@ def admin_dashboard_view(request: Request, db: Session = Depends(get_db)):
         top_sites = (
             db.query(WebsiteUsage.domain, func.sum(WebsiteUsage.active_seconds).label("total"))
             .filter(WebsiteUsage.employee_id == emp.id)
-            .filter(func.date(WebsiteUsage.created_at) == today)
+            .filter(on_day(WebsiteUsage.created_at, today))
             .group_by(WebsiteUsage.domain)
             .order_by(func.sum(WebsiteUsage.active_seconds).desc())
             .limit(5)
@@ -297,7 +311,7 @@ def admin_dashboard_view(request: Request, db: Session = Depends(get_db)):
                 "is_online": is_online,
                 "total_time": format_hours(e_total),
                 "productivity": round((e_active / e_total) * 100) if e_total > 0 else 0,
-                "recent_ss": json.dumps(recent_ss_json),
+                "recent_ss": dumps(recent_ss_json).decode("utf-8"),
                 "recent_ss_list": recent_ss_json,
                 "top_apps": [{"app_name": a[0], "total": a[1]} for a in top_apps],
                 "top_sites": [{"domain": s[0], "total": s[1]} for s in top_sites],
@@ -331,16 +345,15 @@ def user_dashboard_view(request: Request, db: Session = Depends(get_db)):
     sessions = (
         db.query(WorkSession)
         .filter(WorkSession.employee_id == user.id)
-        .filter(func.date(WorkSession.start_time) == today)
+        .filter(on_day(WorkSession.start_time, today))
         .all()
     )
     total_sec = sum(s.total_seconds or 0 for s in sessions)
     active_sec = sum(s.active_seconds or 0 for s in sessions)
-    weekly_start = today - timedelta(days=today.weekday())
     weekly_sessions = (
         db.query(WorkSession)
         .filter(WorkSession.employee_id == user.id)
-        .filter(func.date(WorkSession.start_time) >= weekly_start)
+        .filter(in_week(WorkSession.start_time, today))
         .all()
     )
     weekly_total_sec = sum(s.total_seconds or 0 for s in weekly_sessions)
@@ -348,7 +361,7 @@ def user_dashboard_view(request: Request, db: Session = Depends(get_db)):
     top_apps = (
         db.query(ApplicationUsage.app_name, func.sum(ApplicationUsage.active_seconds).label("total"))
         .filter(ApplicationUsage.employee_id == user.id)
-        .filter(func.date(ApplicationUsage.created_at) == today)
+        .filter(on_day(ApplicationUsage.created_at, today))
         .group_by(ApplicationUsage.app_name)
         .order_by(func.sum(ApplicationUsage.active_seconds).desc())
         .limit(5)
@@ -465,6 +478,7 @@ async def employee_edit_post(request: Request, emp_id: int, db: Session = Depend
     if new_password:
         emp.password = hash_password(new_password)
     db.commit()
+    agent_identity_cache.invalidate_user(emp.id)
     return RedirectResponse("/employees/", status_code=302)
 
 
@@ -478,6 +492,7 @@ def employee_delete_view(request: Request, emp_id: int, db: Session = Depends(ge
     if emp and emp.id != user.id:
         db.delete(emp)
         db.commit()
+        agent_identity_cache.invalidate_user(emp_id)
     return RedirectResponse("/employees/", status_code=302)
 
 
@@ -491,6 +506,7 @@ def employee_toggle_status_view(request: Request, emp_id: int, db: Session = Dep
     if emp:
         emp.is_active_employee = not bool(emp.is_active_employee)
         db.commit()
+        agent_identity_cache.invalidate_user(emp.id)
     return RedirectResponse("/employees/", status_code=302)
 
 
@@ -504,6 +520,7 @@ def employee_reset_password_view(request: Request, emp_id: int, db: Session = De
     if emp:
         emp.password = hash_password("123456")
         db.commit()
+        agent_identity_cache.invalidate_user(emp.id)
     return RedirectResponse("/employees/", status_code=302)
 
 
@@ -604,6 +621,7 @@ async def staff_edit_post(request: Request, staff_id: int, db: Session = Depends
     if new_password:
         staff.password = hash_password(new_password)
     db.commit()
+    agent_identity_cache.invalidate_user(staff.id)
     return RedirectResponse("/staff/", status_code=302)
 
 
@@ -639,8 +657,7 @@ def session_detail_view(request: Request, session_id: int, db: Session = Depends
     websites = db.query(WebsiteUsage).filter(WebsiteUsage.work_session_id == session_id).order_by(WebsiteUsage.active_seconds.desc()).all()
     screenshots = db.query(Screenshot).filter(Screenshot.work_session_id == session_id).order_by(Screenshot.capture_time.asc()).all()
 
-    active_time = session.active_seconds if session else 0
-    idle_time = session.idle_seconds if session else 0
+    active_time, idle_time = live_totals(session) if session else (0, 0)
 
     def format_time(seconds: int) -> str:
         h = seconds // 3600
@@ -670,19 +687,11 @@ def session_end_view(request: Request, session_id: int, db: Session = Depends(ge
 
     session = db.query(WorkSession).filter(WorkSession.id == session_id).first()
     if session and session.end_time is None:
-        session.end_time = datetime.utcnow()
-        duration = (session.end_time - session.start_time).total_seconds()
-        session.total_seconds = int(duration)
-        active_logs = (
-            db.query(ActivityLog)
-            .filter(ActivityLog.work_session_id == session.id)
-            .filter(ActivityLog.minute_type == "ACTIVE")
-            .all()
-        )
-        active_sec = sum(log.duration_seconds or 0 for log in active_logs)
-        session.active_seconds = int(active_sec)
-        session.idle_seconds = max(0, session.total_seconds - session.active_seconds)
+        close_session(session, datetime.utcnow())
         db.commit()
+        publish_to_user(
+            session.employee_id, "session_ended", session_id=session.id, reason="Session ended by administrator"
+        )
     return RedirectResponse(f"/sessions/{session_id}/", status_code=302)
 
 
@@ -694,6 +703,7 @@ def session_delete_view(request: Request, session_id: int, db: Session = Depends
 
     session = db.query(WorkSession).filter(WorkSession.id == session_id).first()
     if session:
+        release_session_blobs(db, session.id)
         db.delete(session)
         db.commit()
     return RedirectResponse("/sessions/", status_code=302)
@@ -737,7 +747,7 @@ def report_daily_view(request: Request, db: Session = Depends(get_db)):
         sessions = (
             db.query(WorkSession)
             .filter(WorkSession.employee_id == emp.id)
-            .filter(func.date(WorkSession.start_time) == date_obj)
+            .filter(on_day(WorkSession.start_time, date_obj))
             .all()
         )
         if not sessions:
@@ -792,8 +802,7 @@ def report_monthly_view(request: Request, db: Session = Depends(get_db)):
         sessions = (
             db.query(WorkSession)
             .filter(WorkSession.employee_id == emp.id)
-            .filter(func.extract("year", WorkSession.start_time) == year)
-            .filter(func.extract("month", WorkSession.start_time) == month)
+            .filter(in_month(WorkSession.start_time, year, month))
             .all()
         )
         if not sessions:
@@ -869,7 +878,7 @@ def user_report_daily_view(request: Request, db: Session = Depends(get_db)):
     sessions = (
         db.query(WorkSession)
         .filter(WorkSession.employee_id == user.id)
-        .filter(func.date(WorkSession.start_time) == date_obj)
+        .filter(on_day(WorkSession.start_time, date_obj))
         .all()
     )
     total = sum(s.total_seconds or 0 for s in sessions)
@@ -912,8 +921,7 @@ def user_report_monthly_view(request: Request, db: Session = Depends(get_db)):
     sessions = (
         db.query(WorkSession)
         .filter(WorkSession.employee_id == user.id)
-        .filter(func.extract("year", WorkSession.start_time) == year)
-        .filter(func.extract("month", WorkSession.start_time) == month)
+        .filter(in_month(WorkSession.start_time, year, month))
         .all()
     )
     total = sum(s.total_seconds or 0 for s in sessions)
@@ -1015,6 +1023,8 @@ async def task_add_post(request: Request, db: Session = Depends(get_db)):
     )
     db.add(task)
     db.commit()
+    assigned_task_cache.invalidate(task.assigned_to_id)
+    publish_to_user(task.assigned_to_id, "task_changed", task_id=task.id)
     return RedirectResponse("/tasks/", status_code=302)
 
 
@@ -1032,6 +1042,8 @@ async def task_update_status_view(request: Request, task_id: int, db: Session =
         if status == "DONE":
             task.completed_at = datetime.utcnow()
         db.commit()
+        assigned_task_cache.invalidate(task.assigned_to_id)
+        publish_to_user(task.assigned_to_id, "task_changed", task_id=task.id)
     return RedirectResponse("/tasks/", status_code=302)
 
 
@@ -1043,8 +1055,11 @@ def task_delete_view(request: Request, task_id: int, db: Session = Depends(get_d
 
     task = db.query(Task).filter(Task.id == task_id, Task.company_id == user.company_id).first()
     if task:
+        assigned_to_id = task.assigned_to_id
         db.delete(task)
         db.commit()
+        assigned_task_cache.invalidate(assigned_to_id)
+        publish_to_user(assigned_to_id, "task_changed", task_id=task_id)
     return RedirectResponse("/tasks/", status_code=302)
 
 
@@ -1320,6 +1335,8 @@ async def policy_configuration_post(
 
     policy.config_version = (policy.config_version or 0) + 1
     db.commit()
+    policy_cache.invalidate(target_company_id)
+    publish_to_company(target_company_id, "config_changed", config_version=policy.config_version)
 
     return RedirectResponse(f"/owner/company/{target_company_id}/policy/", status_code=302)
 
@@ -1357,7 +1374,7 @@ def audit_log_viewer_view(request: Request, db: Session = Depends(get_db)):
 def dashboard_alerts_api(request: Request, db: Session = Depends(get_db)):
     user = _require_login(db, request)
     if not user or not _ensure_role(user, ["ADMIN", "OWNER"]):
-        return JSONResponse({"error": "Permission denied"}, status_code=403)
+        return FastJSONResponse({"error": "Permission denied"}, status_code=403)
 
     offline_agents = (
         db.query(User)
@@ -1367,15 +1384,16 @@ def dashboard_alerts_api(request: Request, db: Session = Depends(get_db)):
         .all()
     )
 
+    last_seen = {emp.id: presence.last_seen(emp.id, emp.last_agent_sync_at) for emp in offline_agents}
     offline_agents_data = [
         {
             "id": emp.id,
             "username": emp.username,
             "email": emp.email,
-            "last_agent_sync_at": emp.last_agent_sync_at,
+            "last_agent_sync_at": last_seen[emp.id],
         }
         for emp in offline_agents
-        if emp.last_agent_sync_at is not None
+        if last_seen[emp.id] is not None
     ]
 
     never_synced_data = [
@@ -1385,7 +1403,7 @@ def dashboard_alerts_api(request: Request, db: Session = Depends(get_db)):
             "email": emp.email,
         }
         for emp in offline_agents
-        if emp.last_agent_sync_at is None
+        if last_seen[emp.id] is None
     ]
 
     recent_logs = (
@@ -1406,13 +1424,49 @@ def dashboard_alerts_api(request: Request, db: Session = Depends(get_db)):
         for log in recent_logs
     ]
 
+    return FastJSONResponse(
+        {
+            "status": "success",
+            "offline_agents_count": len(offline_agents_data),
+            "offline_agents": offline_agents_data,
+            "never_synced_count": len(never_synced_data),
+            "never_synced_agents": never_synced_data,
+            "recent_audit_logs": recent_logs_data,
+        }
+    )
+
+
+@router.get("/api/runtime-metrics/")
+def runtime_metrics_api(request: Request, db: Session = Depends(get_db)):
+    user = _require_login(db, request)
+    if not user or not _ensure_role(user, ["OWNER"]):
+        return FastJSONResponse({"error": "Permission denied"}, status_code=403)
+
     return {
         "status": "success",
-        "offline_agents_count": len(offline_agents_data),
-        "offline_agents": offline_agents_data,
-        "never_synced_count": len(never_synced_data),
-        "never_synced_agents": never_synced_data,
-        "recent_audit_logs": recent_logs_data,
+        "identity_cache": agent_identity_cache.stats(),
+        "ingest_buffer": ingest_buffer.stats(),
+        "policy_cache": policy_cache.stats(),
+        "task_cache": assigned_task_cache.stats(),
+        "agent_events": event_broker.stats(),
+        "presence": presence.stats(),
+        "db_pools": pool_stats(),
+        "screenshot_pipeline": screenshot_pipeline.stats(),
+        "upload_rate_limits": upload_rate_limiter.stats(),
+    }
+
+
+@router.get("/api/storage-dedupe/")
+def storage_dedupe_api(request: Request, db: Session = Depends(get_db)):
+    user = _require_login(db, request)
+    if not user or not _ensure_role(user, ["OWNER"]):
+        return FastJSONResponse({"error": "Permission denied"}, status_code=403)
+
+    report = dedupe_report(db, user.company_id)
+    return {
+        "status": "success",
+        "dedupe_enabled": settings.MEDIA_DEDUPE,
+        "storage": report[0] if report else None,
     }
 
 
@@ -1436,21 +1490,22 @@ def employee_sync_status_view(request: Request, db: Session = Depends(get_db)):
     offline_threshold = datetime.utcnow() - timedelta(minutes=15)
 
     for emp in employees:
+        last_sync = presence.last_seen(emp.id, emp.last_agent_sync_at)
         status_data = {
             "id": emp.id,
             "username": emp.username,
             "full_name": f"{emp.first_name or ''} {emp.last_name or ''}".strip(),
             "email": emp.email,
-            "last_sync": emp.last_agent_sync_at,
+            "last_sync": last_sync,
             "is_online": False,
             "minutes_since_sync": 0,
         }
-        if emp.last_agent_sync_at is None:
+        if last_sync is None:
             status_data["status"] = "Never Synced"
             status_data["status_badge"] = "danger"
             never_synced_agents.append(status_data)
         else:
-            if emp.last_agent_sync_at > offline_threshold:
+            if last_sync > offline_threshold:
                 status_data["status"] = "Online"
                 status_data["status_badge"] = "success"
                 status_data["is_online"] = True
@@ -1567,7 +1622,7 @@ async def admin_task_assign_post(request: Request, db: Session = Depends(get_db)
     priority = form.get("priority") or "MEDIUM"
 
     if not title or not employee_id:
-        return JSONResponse({"status": False, "message": "Title and employee are required"}, status_code=400)
+        return FastJSONResponse({"status": False, "message": "Title and employee are required"}, status_code=400)
 
     employee = (
         db.query(User)
@@ -1577,7 +1632,7 @@ async def admin_task_assign_post(request: Request, db: Session = Depends(get_db)
         .first()
     )
     if not employee:
-        return JSONResponse({"status": False, "message": "Employee not found"}, status_code=404)
+        return FastJSONResponse({"status": False, "message": "Employee not found"}, status_code=404)
 
     project = None
     if project_id:
@@ -1606,8 +1661,10 @@ async def admin_task_assign_post(request: Request, db: Session = Depends(get_db)
     db.add(task)
     db.commit()
     db.refresh(task)
+    assigned_task_cache.invalidate(task.assigned_to_id)
+    publish_to_user(task.assigned_to_id, "task_changed", task_id=task.id)
 
-    return JSONResponse({"status": True, "message": "Task assigned successfully", "task_id": task.id}, status_code=201)
+    return FastJSONResponse({"status": True, "message": "Task assigned successfully", "task_id": task.id}, status_code=201)
 
 
 @router.get("/dashboard/tasks/statistics/")
@@ -1961,19 +2018,60 @@ def analytics_dashboard_view(request: Request, db: Session = Depends(get_db)):
 
     end_date = datetime.utcnow().date()
     start_date = end_date - timedelta(days=30)
+    # Daily rows written by `python -m app.rollups`
+    window = in_range(ProductivityMetric.date, (day_range(start_date)[0], day_range(end_date)[1]))
     metrics = (
         db.query(ProductivityMetric)
         .filter(ProductivityMetric.company_id == user.company_id)
         .filter(ProductivityMetric.metric_level == "COMPANY")
+        .filter(window)
+        .order_by(ProductivityMetric.date)
+        .all()
+    )
+    dept_metrics = (
+        db.query(ProductivityMetric)
+        .filter(ProductivityMetric.company_id == user.company_id)
+        .filter(ProductivityMetric.metric_level == "DEPARTMENT")
+        .filter(window)
+        .order_by(ProductivityMetric.date)
         .all()
     )
+    user_totals = (
+        db.query(
+            ProductivityMetric.user_id,
+            func.sum(ProductivityMetric.total_work_time).label("total_work_time"),
+            func.sum(ProductivityMetric.productive_time).label("productive_time"),
+        )
+        .filter(ProductivityMetric.company_id == user.company_id)
+        .filter(ProductivityMetric.metric_level == "USER")
+        .filter(window)
+        .group_by(ProductivityMetric.user_id)
+        .order_by(func.sum(ProductivityMetric.productive_time).desc())
+        .all()
+    )
+    names = {u.id: u for u in db.query(User).filter(User.id.in_([row.user_id for row in user_totals[:10]]))}
+    top_users = [
+        {
+            "user": names.get(row.user_id),
+            "total_work_hours": round((row.total_work_time or 0) / 3600, 1),
+            "productive_hours": round((row.productive_time or 0) / 3600, 1),
+            "productivity_score": round((row.productive_time or 0) * 100 / row.total_work_time) if row.total_work_time else 0,
+        }
+        for row in user_totals[:10]
+    ]
+    total_work = sum(m.total_work_time or 0 for m in metrics)
+    productive = sum(m.productive_time or 0 for m in metrics)
 
     context = {
         "request": request,
         "company_metrics": metrics,
-        "dept_metrics": [],
-        "top_users": [],
-        "overall_stats": {"avg_productivity": 0, "total_work_hours": 0, "total_employees": 0},
+        "dept_metrics": dept_metrics,
+        "top_users": top_users,
+        "overall_stats": {
+            "avg_productivity": round(productive * 100 / total_work, 1) if total_work else 0,
+            "total_work_hours": round(total_work / 3600, 1),
+            "total_employees": len(user_totals),
+        },
         "start_date": start_date,
         "end_date": end_date,
         "page": "analytics",
@@ -1993,13 +2091,18 @@ def time_utilization_view(request: Request, db: Session = Depends(get_db)):
         db.query(ProductivityMetric)
         .filter(ProductivityMetric.company_id == user.company_id)
         .filter(ProductivityMetric.metric_level == "COMPANY")
+        .filter(in_range(ProductivityMetric.date, (day_range(start_date)[0], day_range(end_date)[1])))
+        .order_by(ProductivityMetric.date)
         .all()
     )
 
     context = {
         "request": request,
         "metrics": metrics,
-        "totals": {},
+        "totals": {
+            field: sum(getattr(m, field) or 0 for m in metrics)
+            for field in ("total_work_time", "productive_time", "idle_time", "break_time")
+        },
         "start_date": start_date,
         "end_date": end_date,
         "page": "time-utilization",
@@ -2013,16 +2116,69 @@ def activity_heatmap_view(request: Request, db: Session = Depends(get_db)):
     if not user or not _ensure_role(user, ["ADMIN", "OWNER"]):
         return RedirectResponse("/admin/login/", status_code=302)
 
+    end_date = datetime.utcnow().date()
+    start_date = end_date - timedelta(days=HEATMAP_DEFAULT_DAYS - 1)
+    grid = activity_heatmap(db, user.company_id, start_date, end_date)
+    activities = [
+        {
+            "weekday": weekday,
+            "hour": hour,
+            "active_seconds": grid["active_seconds"][index][hour],
+            "idle_seconds": grid["idle_seconds"][index][hour],
+        }
+        for index, weekday in enumerate(grid["weekdays"])
+        for hour in grid["hours"]
+    ]
+
     context = {
         "request": request,
-        "activities": [],
-        "start_date": datetime.utcnow().date(),
-        "end_date": datetime.utcnow().date(),
+        "activities": activities,
+        "start_date": start_date,
+        "end_date": end_date,
         "page": "activity-heatmap",
     }
     return templates.TemplateResponse("activity_heatmap.html", context)
 
 
+@router.get("/api/activity-heatmap/")
+def activity_heatmap_api(request: Request, db: Session = Depends(get_db)):
+    """
+    Weekday x hour (UTC) heatmap from the hourly aggregates. Query parameters:
+    ``start`` / ``end`` (YYYY-MM-DD, inclusive; default the last 28 days),
+    optional ``department_id`` and ``team_id``.
+    """
+    user = _require_login(db, request)
+    if not user or not _ensure_role(user, ["ADMIN", "OWNER", "MANAGER"]):
+        return FastJSONResponse({"error": "Permission denied"}, status_code=403)
+
+    params = request.query_params
+    try:
+        end_date = datetime.strptime(params["end"], "%Y-%m-%d").date() if params.get("end") else datetime.utcnow().date()
+        start_date = (
+            datetime.strptime(params["start"], "%Y-%m-%d").date()
+            if params.get("start")
+            else end_date - timedelta(days=HEATMAP_DEFAULT_DAYS - 1)
+        )
+        department_id = int(params["department_id"]) if params.get("department_id") else None
+        team_id = int(params["team_id"]) if params.get("team_id") else None
+    except ValueError:
+        return FastJSONResponse({"error": "Invalid start, end, department_id or team_id"}, status_code=400)
+    if end_date < start_date:
+        return FastJSONResponse({"error": "end is before start"}, status_code=400)
+    if department_id is not None and not db.query(Department.id).filter(
+        Department.id == department_id, Department.company_id == user.company_id
+    ).first():
+        return FastJSONResponse({"error": "Department not found"}, status_code=404)
+    if team_id is not None and not db.query(Team.id).filter(Team.id == team_id, Team.company_id == user.company_id).first():
+        return FastJSONResponse({"error": "Team not found"}, status_code=404)
+    try:
+        grid = activity_heatmap(db, user.company_id, start_date, end_date, department_id, team_id)
+    except ValueError as exc:
+        return FastJSONResponse({"error": f"Cannot filter by team: {exc}"}, status_code=400)
+
+    return {"status": "success", "heatmap": grid}
+
+
 @router.get("/branding/")
 def branding_settings_view(request: Request, db: Session = Depends(get_db)):
     user = _require_login(db, request)
@@ -0,0 +1,327 @@
+"""
+Transcode new screenshots and render gallery thumbnails.
+
+Uploads arrive as full-resolution PNG (or whatever the tracker sent). Each new
+``Screenshot`` is re-encoded to ``SCREENSHOT_FORMAT`` (webp / avif) at the
+company's ``screenshot_quality``. Two downscaled copies are recorded as
+``thumbnail`` and ``preview``. The original file is replaced only when the
+transcoded copy is smaller. With ``MEDIA_DEDUPE`` the outputs are stored as
+shared blobs like the uploads themselves.
+
+The API hands each committed upload to a per-worker thread pool; Pillow releases
+the GIL while decoding and encoding, so the threads use several cores. Anything
+the pool did not get to (restarts, a full queue, older screenshots) is picked up
+by this CLI.
+
+Usage (from backend/):
+    python -m app.screenshot_media --limit 500
+    python -m app.screenshot_media --loop --interval 300
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .db import IngestSessionLocal, SessionLocal
+from .media_blobs import incoming_path, is_blob, release_blob, store_blob
+from .models import Screenshot
+from .policy_cache import policy_cache
+from .screenshot_packs import is_packed, read_member
+
+try:
+    from PIL import Image, features
+except ImportError:  # Pillow is optional; without it screenshots are kept as uploaded
+    Image = None
+    features = None
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {"WEBP": "webp", "AVIF": "avif", "JPEG": "jpg"}
+
+
+def output_format() -> Optional[str]:
+    """Pillow format name for transcoded images, or None to keep uploads as they are."""
+    wanted = settings.SCREENSHOT_FORMAT.upper()
+    if Image is None or wanted == "ORIGINAL":
+        return None
+    if wanted == "AVIF" and not features.check("avif"):
+        return "WEBP"
+    return wanted if wanted in EXTENSIONS else "WEBP"
+
+
+def _encode(image, fmt: str, quality: int) -> bytes:
+    if fmt == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    options = {"quality": quality}
+    if fmt == "WEBP":
+        options["method"] = 4  # encoder effort: a good size/CPU balance for screen content
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt, **options)
+    return buffer.getvalue()
+
+
+def _scaled(image, width: int):
+    copy = image.copy()
+    copy.thumbnail((width, width * 4))  # bounded by width; keeps the aspect ratio
+    return copy
+
+
+def _write(rel_path: str, data: bytes) -> None:
+    path = settings.MEDIA_ROOT / rel_path
+    part_path = path.with_name(path.name + ".part")
+    os.makedirs(path.parent, exist_ok=True)
+    with open(part_path, "wb") as handle:
+        handle.write(data)
+    os.replace(part_path, path)
+
+
+def _write_part(path, data: bytes) -> None:
+    with open(path, "wb") as handle:
+        handle.write(data)
+
+
+def _decode(source: bytes):
+    try:
+        with Image.open(io.BytesIO(source)) as opened:
+            opened.load()
+            if opened.mode in ("RGB", "RGBA", "L"):
+                return opened.copy()
+            return opened.convert("RGBA" if "transparency" in opened.info else "RGB")
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+
+def _read_source(rel_path: str) -> Optional[bytes]:
+    if is_packed(rel_path):
+        return read_member(rel_path)
+    try:
+        return (settings.MEDIA_ROOT / rel_path).read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+def process_screenshot(db: Session, screenshot_id: int) -> Optional[Dict[str, int]]:
+    """
+    Transcode one screenshot and write its thumbnails; commits. Returns
+    {"before": bytes, "after": bytes} or None if there was nothing to do.
+    """
+    fmt = output_format()
+    screenshot = db.get(Screenshot, screenshot_id)
+    if fmt is None or screenshot is None or screenshot.processed_at is not None or not screenshot.image:
+        return None
+
+    source = _read_source(screenshot.image)
+    image = _decode(source) if source is not None else None
+    if image is None:
+        screenshot.processed_at = datetime.utcnow()  # missing or unreadable; do not retry forever
+        db.commit()
+        return None
+
+    quality = policy_cache.get(db, screenshot.company_id).config.get("screenshot_quality") or 85
+    extension = EXTENSIONS[fmt]
+    if is_packed(screenshot.image) or is_blob(screenshot.image):
+        capture_time = screenshot.capture_time or datetime.utcnow()
+        base = f"screenshots/{capture_time:%Y/%m/%d}/ss_{screenshot.work_session_id}_{screenshot.id}"
+    else:
+        base = screenshot.image.rsplit(".", 1)[0]
+
+    outputs = {}
+    replaced = None
+    # Packed originals stay where they are; only thumbnails are added for them.
+    if not is_packed(screenshot.image):
+        encoded = _encode(image, fmt, quality)
+        if len(encoded) < len(source):
+            outputs["image"] = (f"{base}.{extension}", encoded)
+            replaced = screenshot.image
+    widths = {"thumbnail": settings.SCREENSHOT_THUMBNAIL_WIDTH, "preview": settings.SCREENSHOT_PREVIEW_WIDTH}
+    for column, width in widths.items():
+        outputs[column] = (f"{base}_t{width}.{extension}", _encode(_scaled(image, width), fmt, quality))
+
+    written = []
+    try:
+        for column, (rel_path, data) in outputs.items():
+            if settings.MEDIA_DEDUPE:
+                part_path = incoming_path()
+                _write_part(part_path, data)
+                rel_path = store_blob(db, part_path, hashlib.sha256(data).hexdigest(), len(data), extension)
+            else:
+                _write(rel_path, data)
+                written.append(rel_path)
+            release_blob(db, getattr(screenshot, column))  # reprocessing replaces earlier outputs
+            setattr(screenshot, column, rel_path)
+        screenshot.processed_at = datetime.utcnow()
+        db.commit()
+    except BaseException:
+        db.rollback()
+        for rel_path in written:
+            if rel_path != replaced:
+                _discard(rel_path)
+        raise
+
+    if replaced and replaced != screenshot.image and not is_blob(replaced):
+        _discard(replaced)
+    after = len(outputs["image"][1]) if "image" in outputs else len(source)
+    return {"before": len(source), "after": after}
+
+
+def _discard(rel_path: str) -> None:
+    try:
+        os.remove(settings.MEDIA_ROOT / rel_path)
+    except FileNotFoundError:
+        pass
+
+
+class ScreenshotPipeline:
+    """Per-worker thread pool transcoding freshly uploaded screenshots."""
+
+    def __init__(self, workers: int, max_pending: int) -> None:
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.processed = 0
+        self.skipped = 0
+        self.failed = 0
+        self.bytes_before = 0
+        self.bytes_after = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0 and output_format() is not None
+
+    def submit(self, screenshot_id: int) -> bool:
+        """Queue ``screenshot_id``; False when disabled or backlogged (the CLI catches up)."""
+        if not self.enabled:
+            return False
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.skipped += 1
+                return False
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="screenshot-media")
+            executor = self._executor
+            self.pending += 1
+        executor.submit(self._run, screenshot_id)
+        return True
+
+    def stop(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "format": output_format(),
+                "workers": self.workers,
+                "pending": self.pending,
+                "processed": self.processed,
+                "skipped": self.skipped,
+                "failed": self.failed,
+                "bytes_before": self.bytes_before,
+                "bytes_after": self.bytes_after,
+            }
+
+    def _run(self, screenshot_id: int) -> None:
+        db = IngestSessionLocal()
+        try:
+            result = process_screenshot(db, screenshot_id)
+        except Exception:
+            logger.exception("Screenshot %s could not be transcoded; the CLI will retry", screenshot_id)
+            with self._lock:
+                self.failed += 1
+            return
+        finally:
+            db.close()
+            with self._lock:
+                self.pending -= 1
+        if result:
+            with self._lock:
+                self.processed += 1
+                self.bytes_before += result["before"]
+                self.bytes_after += result["after"]
+
+
+screenshot_pipeline = ScreenshotPipeline(settings.SCREENSHOT_WORKERS, settings.SCREENSHOT_QUEUE_MAX)
+
+
+def find_unprocessed(db: Session, limit: int, after_id: int = 0) -> List[int]:
+    return list(
+        db.scalars(
+            select(Screenshot.id)
+            .where(Screenshot.processed_at.is_(None))
+            .where(Screenshot.id > after_id)
+            .order_by(Screenshot.id)
+            .limit(limit)
+        )
+    )
+
+
+def process_backlog(limit: int, workers: int) -> Dict[str, int]:
+    """Process up to ``limit`` screenshots the upload path did not get to."""
+    stats = {"screenshots": 0, "failed": 0, "bytes_before": 0, "bytes_after": 0}
+    db = SessionLocal()
+    try:
+        ids = find_unprocessed(db, limit)
+    finally:
+        db.close()
+
+    def run(screenshot_id: int) -> Optional[Dict[str, int]]:
+        session = SessionLocal()
+        try:
+            return process_screenshot(session, screenshot_id)
+        finally:
+            session.close()
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        for screenshot_id, future in zip(ids, [executor.submit(run, i) for i in ids]):
+            try:
+                result = future.result()
+            except Exception:
+                logger.exception("Screenshot %s could not be transcoded", screenshot_id)
+                stats["failed"] += 1
+                continue
+            if result:
+                stats["screenshots"] += 1
+                stats["bytes_before"] += result["before"]
+                stats["bytes_after"] += result["after"]
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Transcode screenshots and generate thumbnails")
+    parser.add_argument("--limit", type=int, default=500, help="screenshots per pass")
+    parser.add_argument("--workers", type=int, default=settings.SCREENSHOT_WORKERS or 2, help="encoder threads")
+    parser.add_argument("--loop", action="store_true", help="keep running, one pass per interval")
+    parser.add_argument("--interval", type=int, default=300, help="seconds between passes with --loop")
+    args = parser.parse_args()
+
+    if output_format() is None:
+        print("[screenshot_media] disabled (Pillow missing or SCREENSHOT_FORMAT=original)")
+        return
+    while True:
+        stats = process_backlog(args.limit, args.workers)
+        print(
+            f"[screenshot_media] screenshots={stats['screenshots']} failed={stats['failed']} "
+            f"bytes {stats['bytes_before']} -> {stats['bytes_after']}"
+        )
+        if not args.loop:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""
+Pack each closed work session's screenshots into one archive file.
+
+Loose uploads (``screenshots/YYYY/MM/DD/ss_*.png``) cost one inode each. This
+job appends a closed session's screenshots and their thumbnails to
+``screenshots/packs/YYYY/MM/session_<id>.pack``, points each ``Screenshot``
+media column at its member (``.../session_<id>.pack/<n>.<ext>``) and removes the
+loose files. The media
+route serves members by reading their byte range from the pack. Deduplicated
+blobs (``MEDIA_DEDUPE``, off by default) are shared between screenshots and are
+never packed, so with dedupe on new uploads stay one file each.
+
+Pack layout (little-endian)::
+
+    b"EPTPACK1"
+    blob 0 | blob 1 | ... | blob n-1
+    index: n x (offset u64, length u32)
+    footer: b"EPTPACK1", index offset u64, n u32
+
+Usage (from backend/):
+    python -m app.screenshot_packs --older-than-hours 1 --limit 200
+    python -m app.screenshot_packs --all
+    python -m app.screenshot_packs --loop --interval 900
+"""
+import argparse
+from collections import OrderedDict
+import os
+import struct
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .db import SessionLocal
+from .media_blobs import BLOB_DIR, is_blob
+from .models import Screenshot, WorkSession
+
+MAGIC = b"EPTPACK1"
+ENTRY = struct.Struct("<QI")
+FOOTER = struct.Struct("<8sQI")
+PACK_DIR = "screenshots/packs"
+# Screenshot columns holding media paths; thumbnails are packed alongside the originals.
+MEDIA_COLUMNS = ("image", "thumbnail", "preview")
+INDEX_CACHE_SIZE = 256
+
+_index_cache: "OrderedDict[str, Tuple[float, List[Tuple[int, int]]]]" = OrderedDict()
+_index_lock = threading.Lock()
+
+
+class PackError(Exception):
+    pass
+
+
+def is_packed(image: Optional[str]) -> bool:
+    return bool(image) and image.startswith(PACK_DIR + "/")
+
+
+def parse_member(rel_path: str) -> Optional[Tuple[str, int]]:
+    """Split ``.../session_1.pack/3.png`` into (pack path, member number)."""
+    pack_path, _, member = rel_path.rpartition("/")
+    if not pack_path.endswith(".pack") or not is_packed(pack_path):
+        return None
+    number = member.split(".", 1)[0]
+    return (pack_path, int(number)) if number.isdigit() else None
+
+
+def write_pack(path: Path, blobs) -> List[Tuple[int, int]]:
+    """Write ``blobs`` (an iterable of bytes) to ``path`` atomically; returns the offset table."""
+    entries: List[Tuple[int, int]] = []
+    part_path = path.with_name(path.name + ".part")
+    os.makedirs(path.parent, exist_ok=True)
+    try:
+        with open(part_path, "wb") as handle:
+            handle.write(MAGIC)
+            offset = len(MAGIC)
+            for blob in blobs:
+                handle.write(blob)
+                entries.append((offset, len(blob)))
+                offset += len(blob)
+            for entry in entries:
+                handle.write(ENTRY.pack(*entry))
+            handle.write(FOOTER.pack(MAGIC, offset, len(entries)))
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(part_path, path)
+    except BaseException:
+        _remove_quietly(part_path)
+        raise
+    return entries
+
+
+def read_index(path: Path) -> List[Tuple[int, int]]:
+    key = str(path)
+    mtime = path.stat().st_mtime
+    with _index_lock:
+        cached = _index_cache.get(key)
+        if cached is not None and cached[0] == mtime:
+            _index_cache.move_to_end(key)
+            return cached[1]
+
+    with open(path, "rb") as handle:
+        handle.seek(-FOOTER.size, os.SEEK_END)
+        magic, index_offset, count = FOOTER.unpack(handle.read(FOOTER.size))
+        if magic != MAGIC:
+            raise PackError(f"{path} is not a screenshot pack")
+        handle.seek(index_offset)
+        raw = handle.read(count * ENTRY.size)
+    entries = [ENTRY.unpack_from(raw, i * ENTRY.size) for i in range(count)]
+
+    with _index_lock:
+        _index_cache[key] = (mtime, entries)
+        while len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return entries
+
+
+def read_member(rel_path: str) -> Optional[bytes]:
+    """Bytes of one packed screenshot, or None if the pack or member does not exist."""
+    parsed = parse_member(rel_path)
+    if parsed is None:
+        return None
+    pack_path, number = parsed
+    path = settings.MEDIA_ROOT / pack_path
+    try:
+        entries = read_index(path)
+    except (FileNotFoundError, PackError):
+        return None
+    if number >= len(entries):
+        return None
+    offset, length = entries[number]
+    with open(path, "rb") as handle:
+        handle.seek(offset)
+        return handle.read(length)
+
+
+def _pack_rel_path(session: WorkSession) -> str:
+    started = session.start_time or datetime.utcnow()
+    base = f"{PACK_DIR}/{started:%Y/%m}/session_{session.id}"
+    rel_path, n = f"{base}.pack", 1
+    # Screenshots arriving after a session was packed go into a follow-up pack.
+    while (settings.MEDIA_ROOT / rel_path).exists():
+        n += 1
+        rel_path = f"{base}_{n}.pack"
+    return rel_path
+
+
+def _remove_quietly(path: Path) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def pack_session(db: Session, session: WorkSession) -> Dict[str, int]:
+    """Pack the session's loose screenshot files. The caller owns the transaction, which this commits."""
+    members = []  # (screenshot, column, loose path)
+    for screenshot in db.scalars(
+        select(Screenshot)
+        .where(Screenshot.work_session_id == session.id)
+        .order_by(Screenshot.capture_time, Screenshot.id)
+    ):
+        for column in MEDIA_COLUMNS:
+            value = getattr(screenshot, column)
+            if value and not is_packed(value) and not is_blob(value) and (settings.MEDIA_ROOT / value).is_file():
+                members.append((screenshot, column, settings.MEDIA_ROOT / value))
+    if not members:
+        return {"screenshots": 0, "bytes": 0}
+
+    rel_path = _pack_rel_path(session)
+    pack_path = settings.MEDIA_ROOT / rel_path
+    loose = [path for _, _, path in members]
+    entries = write_pack(pack_path, (path.read_bytes() for path in loose))
+
+    try:
+        for number, (screenshot, column, path) in enumerate(members):
+            setattr(screenshot, column, f"{rel_path}/{number}{path.suffix or '.png'}")
+        db.commit()
+    except BaseException:
+        db.rollback()
+        _remove_quietly(pack_path)
+        raise
+
+    # Loose copies are only removed once the rows point into the pack.
+    for path in loose:
+        _remove_quietly(path)
+        try:
+            path.parent.rmdir()
+        except OSError:
+            pass
+    screenshots = {id(screenshot) for screenshot, _, _ in members}
+    return {"screenshots": len(screenshots), "bytes": sum(length for _, length in entries)}
+
+
+def find_unpacked_sessions(db: Session, older_than: Optional[datetime], limit: int, after_id: int = 0) -> List[int]:
+    query = (
+        select(WorkSession.id)
+        .join(Screenshot, Screenshot.work_session_id == WorkSession.id)
+        .where(WorkSession.id > after_id)
+        .where(WorkSession.end_time.is_not(None))
+        .where(
+            or_(
+                *(
+                    getattr(Screenshot, column).is_not(None)
+                    & getattr(Screenshot, column).not_like(f"{PACK_DIR}/%")
+                    & getattr(Screenshot, column).not_like(f"{BLOB_DIR}/%")
+                    for column in MEDIA_COLUMNS
+                )
+            )
+        )
+        .group_by(WorkSession.id)
+        .order_by(WorkSession.id)
+        .limit(limit)
+    )
+    if older_than is not None:
+        query = query.where(WorkSession.end_time < older_than)
+    return list(db.scalars(query))
+
+
+def pack_history(older_than: Optional[datetime], limit: int = 200, after_id: int = 0) -> Dict[str, int]:
+    """Pack up to ``limit`` closed sessions after ``after_id``, one transaction per session."""
+    stats = {"scanned": 0, "last_session_id": after_id, "sessions": 0, "screenshots": 0, "bytes": 0}
+    db = SessionLocal()
+    try:
+        for session_id in find_unpacked_sessions(db, older_than, limit, after_id):
+            stats["scanned"] += 1
+            stats["last_session_id"] = session_id
+            result = pack_session(db, db.get(WorkSession, session_id))
+            if result["screenshots"]:
+                stats["sessions"] += 1
+                stats["screenshots"] += result["screenshots"]
+                stats["bytes"] += result["bytes"]
+    finally:
+        db.close()
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Pack closed sessions' screenshots into per-session archives")
+    parser.add_argument("--older-than-hours", type=int, default=1, help="only sessions closed before this age")
+    parser.add_argument("--all", action="store_true", help="pack every closed session regardless of age (migration)")
+    parser.add_argument("--limit", type=int, default=200, help="sessions per query page")
+    parser.add_argument("--loop", action="store_true", help="keep running, one pass per interval")
+    parser.add_argument("--interval", type=int, default=900, help="seconds between passes with --loop")
+    args = parser.parse_args()
+
+    while True:
+        cutoff = None if args.all else datetime.utcnow() - timedelta(hours=args.older_than_hours)
+        totals = {"sessions": 0, "screenshots": 0, "bytes": 0}
+        after_id = 0
+        while True:
+            # Page by id so sessions whose files are gone cannot hold up the rest.
+            stats = pack_history(cutoff, args.limit, after_id)
+            for key in totals:
+                totals[key] += stats[key]
+            if stats["scanned"] < args.limit:
+                break
+            after_id = stats["last_session_id"]
+        print(f"[screenshot_packs] sessions={totals['sessions']} screenshots={totals['screenshots']} bytes={totals['bytes']}")
+        if not args.loop:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
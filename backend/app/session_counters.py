@@ -0,0 +1,147 @@
+"""
+WorkSession.active_seconds / idle_seconds maintenance.
+
+Uploads add their ACTIVE and INACTIVE seconds onto the session row with a single
+``UPDATE ... SET x = x + n`` so reading a session's totals never touches
+ActivityLog. The reconciliation command compares those counters with the raw logs.
+
+Usage (from backend/):
+    python -m app.session_counters --days 7          # report mismatches
+    python -m app.session_counters --days 7 --fix    # rewrite counters from logs
+"""
+import argparse
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import case, func, select, update
+from sqlalchemy.orm import Session
+
+from .db import SessionLocal
+from .models import ActivityLog, WorkSession
+
+
+def _idle_remainder(active_expr, total=None):
+    # Closed sessions report idle time as wall-clock time not spent active.
+    if total is None:
+        total = func.coalesce(WorkSession.total_seconds, 0)
+    return case((total > active_expr, total - active_expr), else_=0)
+
+
+def activity_deltas(batches: Sequence) -> Dict[int, Tuple[int, int]]:
+    deltas: Dict[int, Tuple[int, int]] = {}
+    for batch in batches:
+        active, idle = deltas.get(batch.work_session_id, (0, 0))
+        for log in batch.activities:
+            seconds = log["duration_seconds"] or 0
+            if log["minute_type"] == "ACTIVE":
+                active += seconds
+            else:
+                idle += seconds
+        deltas[batch.work_session_id] = (active, idle)
+    return deltas
+
+
+def bump_session_counters(db: Session, batches: Sequence) -> None:
+    """Atomically add the batches' activity seconds onto their sessions."""
+    for session_id, (active, idle) in activity_deltas(batches).items():
+        if not active and not idle:
+            continue
+        new_active = func.coalesce(WorkSession.active_seconds, 0) + active
+        db.execute(
+            update(WorkSession)
+            .where(WorkSession.id == session_id)
+            .values(
+                active_seconds=new_active,
+                idle_seconds=case(
+                    (WorkSession.end_time.is_(None), func.coalesce(WorkSession.idle_seconds, 0) + idle),
+                    else_=_idle_remainder(new_active),
+                ),
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+
+def close_session(session: WorkSession, end_time: datetime) -> None:
+    """Stop ``session`` using its maintained counters; flushed by the caller's commit."""
+    session.end_time = end_time
+    total = int((end_time - session.start_time).total_seconds())
+    session.total_seconds = total
+    # Evaluated in SQL so an upload committing concurrently is not overwritten.
+    session.idle_seconds = _idle_remainder(func.coalesce(WorkSession.active_seconds, 0), total)
+
+
+def live_totals(session: WorkSession, now: Optional[datetime] = None) -> Tuple[int, int]:
+    """Return (active, idle) seconds for a session without reading ActivityLog."""
+    active = session.active_seconds or 0
+    if session.end_time is None:
+        duration = int(((now or datetime.utcnow()) - session.start_time).total_seconds())
+        return active, max(0, duration - active)
+    return active, session.idle_seconds or 0
+
+
+def reconcile_counters(db: Session, started_after: Optional[datetime], fix: bool = False) -> List[dict]:
+    """Compare session counters with ActivityLog sums; optionally rewrite the counters."""
+    is_active = ActivityLog.minute_type == "ACTIVE"
+    sums = (
+        select(
+            ActivityLog.work_session_id.label("session_id"),
+            func.sum(case((is_active, ActivityLog.duration_seconds), else_=0)).label("active"),
+            func.sum(case((is_active, 0), else_=ActivityLog.duration_seconds)).label("idle"),
+        )
+        .group_by(ActivityLog.work_session_id)
+        .subquery()
+    )
+    query = select(WorkSession, sums.c.active, sums.c.idle).outerjoin(sums, sums.c.session_id == WorkSession.id)
+    if started_after is not None:
+        query = query.where(WorkSession.start_time >= started_after)
+
+    mismatches = []
+    for session, logged_active, logged_idle in db.execute(query.order_by(WorkSession.id)):
+        logged_active = int(logged_active or 0)
+        if session.end_time is None:
+            expected_idle = int(logged_idle or 0)
+        else:
+            expected_idle = max(0, (session.total_seconds or 0) - logged_active)
+        if (session.active_seconds or 0) == logged_active and (session.idle_seconds or 0) == expected_idle:
+            continue
+        mismatches.append(
+            {
+                "session_id": session.id,
+                "active_seconds": session.active_seconds,
+                "logged_active": logged_active,
+                "idle_seconds": session.idle_seconds,
+                "expected_idle": expected_idle,
+            }
+        )
+        if fix:
+            session.active_seconds = logged_active
+            session.idle_seconds = expected_idle
+    if fix:
+        db.commit()
+    return mismatches
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Verify WorkSession counters against ActivityLog")
+    parser.add_argument("--days", type=int, default=7, help="sessions started within the last N days (0 = all)")
+    parser.add_argument("--fix", action="store_true", help="rewrite mismatching counters from the logs")
+    args = parser.parse_args()
+
+    started_after = datetime.utcnow() - timedelta(days=args.days) if args.days else None
+    db = SessionLocal()
+    try:
+        mismatches = reconcile_counters(db, started_after, fix=args.fix)
+    finally:
+        db.close()
+
+    for item in mismatches:
+        print(
+            f"session {item['session_id']}: active {item['active_seconds']} (logs {item['logged_active']}), "
+            f"idle {item['idle_seconds']} (expected {item['expected_idle']})"
+        )
+    action = "fixed" if args.fix else "found"
+    print(f"[session_counters] {len(mismatches)} mismatching session(s) {action}")
+
+
+if __name__ == "__main__":
+    main()
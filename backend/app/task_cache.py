@@ -0,0 +1,77 @@
+from collections import OrderedDict
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from .config import settings
+
+
+class AssignedTaskCache:
+    """
+    In-process TTL + LRU cache of user_id -> (task_version, task list) for the
+    agent heartbeat, so an unchanged task list costs no query and no hashing.
+
+    Task create/edit/delete invalidates the local worker immediately; other
+    workers reload once the entry's TTL expires.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: int) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[int, Tuple[str, List[dict], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 and self.max_entries > 0
+
+    def get(self, user_id: int) -> Optional[Tuple[str, List[dict]]]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[2] <= time.monotonic():
+                self._entries.pop(user_id, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, user_id: int, task_version: str, tasks: List[dict]) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[user_id] = (task_version, tasks, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id: Optional[int]) -> None:
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+assigned_task_cache = AssignedTaskCache(settings.AGENT_CACHE_MAX_ENTRIES, settings.TASK_CACHE_TTL_SECONDS)
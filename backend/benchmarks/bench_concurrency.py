@@ -0,0 +1,143 @@
+"""
+Agent API concurrency benchmark: sync handlers on the threadpool vs. async handlers on AsyncSession.
+
+Usage (from backend/):
+    python -m benchmarks.bench_concurrency --levels 50,200,800 --p99-ms 250
+
+Both variants serve the check-session-active workload (token lookup plus one
+session query) in-process. ``--rtt-ms`` adds a simulated database round trip
+per request: a blocking sleep in the sync handler, an awaited one in the async
+handler. Set it to 0 when DATABASE_URL points at a remote PostgreSQL database.
+Reports p50/p99 latency and throughput per concurrency level, and the highest
+level each variant sustains within the p99 target.
+"""
+import argparse
+import asyncio
+import math
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench_concurrency.db"
+
+import httpx  # noqa: E402
+from fastapi import Depends, FastAPI  # noqa: E402
+from sqlalchemy import select  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.db import Base, SessionLocal, engine, get_db  # noqa: E402
+from app.db_async import async_engine, get_async_db  # noqa: E402
+from app.identity_cache import agent_identity_cache, resolve_agent  # noqa: E402
+from app.models import User, WorkSession  # noqa: E402
+from app.schemas import CheckSessionActiveRequest  # noqa: E402
+
+TOKEN = "bench-token"
+
+
+def _build_apps(rtt: float):
+    sync_app, async_app = FastAPI(), FastAPI()
+
+    @sync_app.post("/check")
+    def sync_check(payload: CheckSessionActiveRequest, db: Session = Depends(get_db)):
+        user = resolve_agent(db, payload.active_token, payload.employee_id)
+        if rtt:
+            time.sleep(rtt)
+        session = db.scalar(
+            select(WorkSession).where(WorkSession.id == payload.session_id, WorkSession.employee_id == user.id)
+        )
+        return {"status": session is not None and session.end_time is None}
+
+    @async_app.post("/check")
+    async def async_check(payload: CheckSessionActiveRequest, db: AsyncSession = Depends(get_async_db)):
+        user = await db.run_sync(resolve_agent, payload.active_token, payload.employee_id)
+        if rtt:
+            await asyncio.sleep(rtt)
+        session = await db.scalar(
+            select(WorkSession).where(WorkSession.id == payload.session_id, WorkSession.employee_id == user.id)
+        )
+        return {"status": session is not None and session.end_time is None}
+
+    return sync_app, async_app
+
+
+async def _level(app, body: dict, concurrency: int, per_client: int) -> dict:
+    latencies = []
+    transport = httpx.ASGITransport(app=app)
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", limits=limits) as client:
+
+        async def agent():
+            for _ in range(per_client):
+                started = time.perf_counter()
+                response = await client.post("/check", json=body)
+                latencies.append(time.perf_counter() - started)
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(agent() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[math.ceil(len(latencies) * 0.99) - 1] * 1000,
+        "rps": len(latencies) / elapsed,
+    }
+
+
+def _seed() -> dict:
+    Base.metadata.create_all(engine)
+    db = SessionLocal()
+    try:
+        user = db.scalar(select(User).where(User.tracker_token == TOKEN))
+        if user is None:
+            user = User(username="bench", email="bench@example.com", role="EMPLOYEE", is_active=True,
+                        is_active_employee=True, tracker_token=TOKEN)
+            db.add(user)
+            db.flush()
+        session = WorkSession(employee_id=user.id, start_time=datetime.utcnow())
+        db.add(session)
+        db.commit()
+        return {"employee_id": user.id, "active_token": TOKEN, "session_id": session.id}
+    finally:
+        db.close()
+
+
+async def _main(args) -> None:
+    body = _seed()
+    sync_app, async_app = _build_apps(args.rtt_ms / 1000)
+    levels = [int(level) for level in args.levels.split(",") if level.strip()]
+    print(f"database: {engine.url.render_as_string(hide_password=True)}  rtt: {args.rtt_ms}ms  p99 target: {args.p99_ms}ms")
+    print(f"{'variant':<7} {'clients':>7} {'p50 ms':>9} {'p99 ms':>9} {'req/sec':>10}")
+
+    sustained = {}
+    for label, app in (("sync", sync_app), ("async", async_app)):
+        agent_identity_cache.clear()
+        sustained[label] = 0
+        for concurrency in levels:
+            result = await _level(app, body, concurrency, args.requests)
+            print(f"{label:<7} {concurrency:>7} {result['p50_ms']:9.1f} {result['p99_ms']:9.1f} {result['rps']:10.0f}")
+            if result["p99_ms"] > args.p99_ms:
+                break
+            sustained[label] = concurrency
+
+    await async_engine.dispose()
+    for label, concurrency in sustained.items():
+        print(f"{label:<7} sustains {concurrency} concurrent agents within p99 {args.p99_ms}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--levels", default="50,100,200,400,800", help="comma-separated concurrent agent counts")
+    parser.add_argument("--requests", type=int, default=5, help="sequential requests per agent at each level")
+    parser.add_argument("--p99-ms", type=float, default=250.0, help="p99 latency target")
+    parser.add_argument("--rtt-ms", type=float, default=50.0, help="simulated database round trip per request")
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Activity ingestion benchmark: per-row ORM inserts vs. the bulk ingest engine.
+
+Usage (from backend/):
+    python -m benchmarks.bench_ingest --batches 200 --rows 150
+
+Uses DATABASE_URL when set (point it at a scratch PostgreSQL database to measure
+COPY), otherwise a temporary SQLite file.
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime
+
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench_ingest.db"
+
+from app.db import Base, SessionLocal, engine  # noqa: E402
+from app.ingest import IngestBatch, ingest_activity  # noqa: E402
+from app.models import ActivityLog, ApplicationUsage, WebsiteUsage, WorkSession  # noqa: E402
+from app.schemas import ActivityApp, ActivityLogItem, ActivityWebsite  # noqa: E402
+
+
+def _make_batch(session_id: int, rows: int) -> IngestBatch:
+    third = max(1, rows // 3)
+    return IngestBatch(
+        company_id=1,
+        employee_id=1,
+        work_session_id=session_id,
+        applications=[
+            ActivityApp(app_name="Code", window_title=f"main.py - project {i}", active_seconds=60)
+            for i in range(third)
+        ],
+        websites=[
+            ActivityWebsite(domain="github.com", url=f"https://github.com/org/repo/pull/{i}", active_seconds=30)
+            for i in range(third)
+        ],
+        activities=[
+            ActivityLogItem(minute_type="ACTIVE" if i % 5 else "INACTIVE", duration_seconds=1)
+            for i in range(rows - 2 * third)
+        ],
+    )
+
+
+def _legacy_ingest(db, batch: IngestBatch) -> None:
+    for app in batch.applications:
+        db.add(
+            ApplicationUsage(
+                company_id=batch.company_id,
+                work_session_id=batch.work_session_id,
+                employee_id=batch.employee_id,
+                app_name=app["app_name"],
+                window_title=app["window_title"],
+                active_seconds=app["active_seconds"] or 0,
+                created_at=datetime.utcnow(),
+            )
+        )
+    for site in batch.websites:
+        db.add(
+            WebsiteUsage(
+                company_id=batch.company_id,
+                work_session_id=batch.work_session_id,
+                employee_id=batch.employee_id,
+                domain=site["domain"],
+                url=site["url"],
+                active_seconds=site["active_seconds"] or 0,
+                created_at=datetime.utcnow(),
+            )
+        )
+    for log in batch.activities:
+        db.add(
+            ActivityLog(
+                company_id=batch.company_id,
+                work_session_id=batch.work_session_id,
+                employee_id=batch.employee_id,
+                minute_type=log["minute_type"],
+                duration_seconds=log["duration_seconds"] or 0,
+                created_at=datetime.utcnow(),
+            )
+        )
+
+
+def _run(label: str, fn, batches) -> float:
+    rows = sum(b.row_count for b in batches)
+    started = time.perf_counter()
+    for batch in batches:
+        db = SessionLocal()
+        try:
+            fn(db, batch)
+            db.commit()
+        finally:
+            db.close()
+    elapsed = time.perf_counter() - started
+    rate = rows / elapsed if elapsed else float("inf")
+    print(f"{label:<10} {rows:>8} rows  {elapsed:8.3f}s  {rate:12.0f} rows/sec")
+    return rate
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batches", type=int, default=200, help="uploads to replay per run")
+    parser.add_argument("--rows", type=int, default=150, help="rows per upload")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(engine)
+    db = SessionLocal()
+    session = WorkSession(company_id=1, employee_id=1, start_time=datetime.utcnow())
+    db.add(session)
+    db.commit()
+    session_id = session.id
+    db.close()
+
+    batches = [_make_batch(session_id, args.rows) for _ in range(args.batches)]
+    print(f"database: {engine.url.render_as_string(hide_password=True)}")
+    before = _run("orm", _legacy_ingest, batches)
+    after = _run("bulk", lambda db, b: ingest_activity(db, [b]), batches)
+    print(f"speedup: {after / before:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
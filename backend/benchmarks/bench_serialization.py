@@ -0,0 +1,156 @@
+"""
+JSON serialization benchmark: stdlib json + per-row models vs. orjson + TypedDict rows.
+
+Usage (from backend/):
+    python -m benchmarks.bench_serialization --rows 2000 --tasks 200
+
+Times the per-request work outside the database for the activity upload
+(body parse + schema validation, response render) and task list (response
+render) endpoints. "stdlib" is what FastAPI does by default: ``json.loads``,
+validating each row into a model instance, and ``jsonable_encoder`` followed by
+``JSONResponse``. "fast" is the current path: ``fast_json`` parsing, TypedDict
+rows, and ``FastJSONResponse`` on the result as returned by the handler. No
+database is needed.
+"""
+import argparse
+from datetime import datetime, timedelta
+import json
+import time
+from typing import List, Optional
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field, TypeAdapter
+
+from app import fast_json
+from app.fast_json import FastJSONResponse
+from app.schemas import UploadActivityRequest
+
+
+class _ModelApp(BaseModel):
+    app_name: Optional[str]
+    window_title: Optional[str]
+    active_seconds: Optional[int]
+
+
+class _ModelWebsite(BaseModel):
+    domain: Optional[str]
+    url: Optional[str]
+    active_seconds: Optional[int]
+
+
+class _ModelLogItem(BaseModel):
+    minute_type: Optional[str]
+    duration_seconds: Optional[int]
+    created_at: Optional[datetime] = None
+
+
+class _ModelUploadActivityRequest(BaseModel):
+    """The upload schema with one BaseModel per row, as before TypedDict rows."""
+
+    employee_id: int
+    active_token: str
+    work_session_id: int
+    batch_id: Optional[str] = Field(default=None, max_length=64)
+    sequence: Optional[int] = None
+    applications: List[_ModelApp] = []
+    websites: List[_ModelWebsite] = []
+    activities: List[_ModelLogItem] = []
+
+
+def _upload_body(rows: int) -> bytes:
+    third = max(1, rows // 3)
+    started = datetime(2026, 1, 5, 9, 0)
+    return json.dumps(
+        {
+            "employee_id": 1,
+            "active_token": "bench-token",
+            "work_session_id": 1,
+            "batch_id": "bench-batch",
+            "sequence": 1,
+            "applications": [
+                {"app_name": "Code", "window_title": f"main.py - project {i}", "active_seconds": 60} for i in range(third)
+            ],
+            "websites": [
+                {"domain": "github.com", "url": f"https://github.com/org/repo/pull/{i}", "active_seconds": 30}
+                for i in range(third)
+            ],
+            "activities": [
+                {
+                    "minute_type": "ACTIVE" if i % 5 else "INACTIVE",
+                    "duration_seconds": 60,
+                    "created_at": (started + timedelta(minutes=i)).isoformat(),
+                }
+                for i in range(rows - 2 * third)
+            ],
+        }
+    ).encode("utf-8")
+
+
+def _task_response(tasks: int) -> dict:
+    now = datetime.utcnow()
+    data = [
+        {
+            "id": i,
+            "title": f"Task {i}: review the quarterly report",
+            "description": "Go through the figures and leave comments on anything unclear. " * 3,
+            "status": "OPEN" if i % 3 else "DONE",
+            "due_date": (now + timedelta(days=i % 14)).isoformat(),
+            "assigned_by": str(i % 7 + 1),
+            "created_at": now.isoformat(),
+            "completed_at": now.isoformat() if i % 3 == 0 else None,
+        }
+        for i in range(tasks)
+    ]
+    return {"status": True, "data": data, "message": f"Retrieved {len(data)} tasks"}
+
+
+def _time_us(fn, iterations: int) -> float:
+    fn()  # warm up (validator build, caches)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations * 1_000_000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2000, help="rows per activity upload")
+    parser.add_argument("--tasks", type=int, default=200, help="tasks in the task list response")
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    body = _upload_body(args.rows)
+    model_adapter = TypeAdapter(_ModelUploadActivityRequest)
+    fast_adapter = TypeAdapter(UploadActivityRequest)
+    upload_reply = {"status": True, "message": "Data synced", "data": {"inserted": {"applications": args.rows}}}
+    tasks_reply = _task_response(args.tasks)
+
+    cases = [
+        (
+            f"upload request ({args.rows} rows)",
+            lambda: model_adapter.validate_python(json.loads(body)),
+            lambda: fast_adapter.validate_python(fast_json.loads(body)),
+        ),
+        (
+            "upload response",
+            lambda: JSONResponse(jsonable_encoder(upload_reply)).body,
+            lambda: FastJSONResponse(upload_reply).body,
+        ),
+        (
+            f"task list response ({args.tasks} tasks)",
+            lambda: JSONResponse(jsonable_encoder(tasks_reply)).body,
+            lambda: FastJSONResponse(tasks_reply).body,
+        ),
+    ]
+
+    print(f"JSON backend: {'orjson' if fast_json.orjson is not None else 'stdlib json (orjson not installed)'}")
+    print(f"{'case':<34} {'stdlib us':>10} {'fast us':>10} {'saved us':>10} {'speedup':>8}")
+    for label, baseline, fast in cases:
+        before = _time_us(baseline, args.iterations)
+        after = _time_us(fast, args.iterations)
+        print(f"{label:<34} {before:>10.1f} {after:>10.1f} {before - after:>10.1f} {before / after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
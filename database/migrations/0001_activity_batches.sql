@@ -0,0 +1,15 @@
+-- Idempotent activity uploads: one row per accepted agent batch.
+-- Apply once (PostgreSQL): psql "$DATABASE_URL" -f database/migrations/0001_activity_batches.sql
+CREATE TABLE IF NOT EXISTS core_activitybatch (
+    id SERIAL PRIMARY KEY,
+    company_id INTEGER REFERENCES core_company (id) ON DELETE CASCADE,
+    employee_id INTEGER REFERENCES core_user (id) ON DELETE CASCADE,
+    work_session_id INTEGER REFERENCES core_worksession (id) ON DELETE CASCADE,
+    batch_id VARCHAR(64) NOT NULL,
+    sequence INTEGER,
+    row_count INTEGER,
+    created_at TIMESTAMP
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS core_activitybatch_employee_batch_uniq
+    ON core_activitybatch (employee_id, batch_id);
@@ -0,0 +1,9 @@
+-- Screenshot transcoding pipeline: thumbnail / preview paths and a processed marker.
+-- Apply once (PostgreSQL): psql "$DATABASE_URL" -f database/migrations/0002_screenshot_thumbnails.sql
+ALTER TABLE core_screenshot ADD COLUMN IF NOT EXISTS thumbnail VARCHAR(100);
+ALTER TABLE core_screenshot ADD COLUMN IF NOT EXISTS preview VARCHAR(100);
+ALTER TABLE core_screenshot ADD COLUMN IF NOT EXISTS processed_at TIMESTAMP;
+
+-- Existing screenshots are picked up by `python -m app.screenshot_media`; keep that scan cheap.
+CREATE INDEX IF NOT EXISTS core_screenshot_unprocessed_idx
+    ON core_screenshot (id) WHERE processed_at IS NULL;
@@ -0,0 +1,19 @@
+-- Content-addressed screenshot storage: one row per stored file, counted by the Screenshot columns using it.
+-- Apply once (PostgreSQL): psql "$DATABASE_URL" -f database/migrations/0003_media_blobs.sql
+CREATE TABLE IF NOT EXISTS core_mediablob (
+    id SERIAL PRIMARY KEY,
+    sha256 VARCHAR(64) NOT NULL UNIQUE,
+    path VARCHAR(100) NOT NULL,
+    size BIGINT,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS core_mediablob_path_idx ON core_mediablob (path);
+-- `python -m app.media_blobs gc` only looks at unreferenced blobs.
+CREATE INDEX IF NOT EXISTS core_mediablob_unreferenced_idx ON core_mediablob (created_at) WHERE ref_count <= 0;
+
+-- Reference checks and the per-company dedupe report look screenshots up by media path.
+CREATE INDEX IF NOT EXISTS core_screenshot_image_idx ON core_screenshot (image);
+CREATE INDEX IF NOT EXISTS core_screenshot_thumbnail_idx ON core_screenshot (thumbnail);
+CREATE INDEX IF NOT EXISTS core_screenshot_preview_idx ON core_screenshot (preview);
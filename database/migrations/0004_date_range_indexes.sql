@@ -0,0 +1,25 @@
+-- Composite indexes for the half-open date-range filters in app/date_ranges.py.
+-- Apply once (PostgreSQL): psql "$DATABASE_URL" -f database/migrations/0004_date_range_indexes.sql
+-- CONCURRENTLY keeps the tables writable while the indexes build (psql runs each statement in its own transaction).
+
+-- Dashboards, reports and login: one employee's (or company's) sessions for a day / week / month.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS core_worksession_employee_start_idx
+    ON core_worksession (employee_id, start_time);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS core_worksession_company_start_idx
+    ON core_worksession (company_id, start_time);
+
+-- Top apps / sites per employee for a day.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS core_applicationusage_employee_created_idx
+    ON core_applicationusage (employee_id, created_at);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS core_websiteusage_employee_created_idx
+    ON core_websiteusage (employee_id, created_at);
+
+-- Active / idle totals per session (session counters reconciliation) and per employee over time.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS core_activitylog_session_type_idx
+    ON core_activitylog (work_session_id, minute_type);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS core_activitylog_employee_created_idx
+    ON core_activitylog (employee_id, created_at);
+
+-- Recent screenshots per employee.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS core_screenshot_employee_capture_idx
+    ON core_screenshot (employee_id, capture_time);
@@ -0,0 +1,100 @@
+-- Monthly range partitioning for the append-only time series (activity, app/site usage, screenshots).
+-- Apply once (PostgreSQL 12+): psql "$DATABASE_URL" -f database/migrations/0005_partition_time_series.sql
+-- Each table is rebuilt as a partitioned table and its rows copied over in one transaction, which holds an
+-- exclusive lock on it until the copy finishes: run in a maintenance window. Afterwards keep partitions
+-- created ahead of time with `python -m app.partitions maintain --loop` (see README_DEPLOY.md).
+
+CREATE OR REPLACE FUNCTION pg_temp.partition_by_month(tbl text, months_ahead int DEFAULT 3) RETURNS void AS $$
+DECLARE
+    legacy text := tbl || '_unpartitioned';
+    seq text;
+    pkey text;
+    fkey text;
+    first_month date;
+    month date;
+    copied bigint;
+    expected bigint;
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = tbl::regclass) THEN
+        RAISE NOTICE '% is already partitioned', tbl;
+        RETURN;
+    END IF;
+
+    -- The partition key is part of the primary key, so it cannot be NULL.
+    EXECUTE format('UPDATE %I SET created_at = now() AT TIME ZONE ''UTC'' WHERE created_at IS NULL', tbl);
+
+    EXECUTE format('ALTER TABLE %I RENAME TO %I', tbl, legacy);
+    -- Free the primary key's name for the new table.
+    SELECT conname INTO pkey FROM pg_constraint WHERE conrelid = legacy::regclass AND contype = 'p';
+    IF pkey IS NOT NULL THEN
+        EXECUTE format('ALTER TABLE %I RENAME CONSTRAINT %I TO %I', legacy, pkey, legacy || '_pkey');
+    END IF;
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING IDENTITY) PARTITION BY RANGE (created_at)',
+                   tbl, legacy);
+    EXECUTE format('ALTER TABLE %I ALTER COLUMN created_at SET NOT NULL', tbl);
+    EXECUTE format('ALTER TABLE %I ADD PRIMARY KEY (id, created_at)', tbl);
+
+    EXECUTE format('SELECT date_trunc(''month'', COALESCE(min(created_at), now() AT TIME ZONE ''UTC''))::date FROM %I',
+                   legacy) INTO first_month;
+    month := first_month;
+    WHILE month <= (date_trunc('month', now() AT TIME ZONE 'UTC') + make_interval(months => months_ahead))::date LOOP
+        EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                       tbl || '_p' || to_char(month, 'YYYY_MM'), tbl, month, (month + interval '1 month')::date);
+        month := (month + interval '1 month')::date;
+    END LOOP;
+    -- Catches rows stamped outside every monthly partition (e.g. far-off agent clocks).
+    EXECUTE format('CREATE TABLE %I PARTITION OF %I DEFAULT', tbl || '_default', tbl);
+
+    EXECUTE format('INSERT INTO %I SELECT * FROM %I', tbl, legacy);
+    GET DIAGNOSTICS copied = ROW_COUNT;
+    EXECUTE format('SELECT count(*) FROM %I', legacy) INTO expected;
+    IF copied <> expected THEN
+        RAISE EXCEPTION '%: copied % of % rows', tbl, copied, expected;
+    END IF;
+
+    -- Keep ids increasing: SERIAL ids move their sequence over, identity ids continue after the copied rows.
+    seq := pg_get_serial_sequence(legacy, 'id');
+    IF seq IS NOT NULL AND pg_get_serial_sequence(tbl, 'id') IS NULL THEN
+        EXECUTE format('ALTER SEQUENCE %s OWNED BY %I.id', seq, tbl);
+    END IF;
+    EXECUTE format('SELECT setval(pg_get_serial_sequence(%L, ''id''), COALESCE(max(id), 0) + 1, false) FROM %I',
+                   tbl, tbl);
+
+    -- Same foreign keys as before (Django's, to company / user / work session).
+    FOR fkey IN SELECT pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = legacy::regclass AND contype = 'f' LOOP
+        EXECUTE format('ALTER TABLE %I ADD %s', tbl, fkey);
+    END LOOP;
+
+    -- Plain DROP: fails (and rolls everything back) if anything still references the old table.
+    EXECUTE format('DROP TABLE %I', legacy);
+END;
+$$ LANGUAGE plpgsql;
+
+BEGIN;
+SELECT pg_temp.partition_by_month('core_activitylog');
+SELECT pg_temp.partition_by_month('core_applicationusage');
+SELECT pg_temp.partition_by_month('core_websiteusage');
+SELECT pg_temp.partition_by_month('core_screenshot');
+
+-- Indexes on the partitioned tables (created on every partition, present and future).
+-- They replace the indexes dropped with the old tables: Django's foreign-key indexes and those from 0002-0004.
+CREATE INDEX IF NOT EXISTS core_activitylog_session_type_idx ON core_activitylog (work_session_id, minute_type);
+CREATE INDEX IF NOT EXISTS core_activitylog_employee_created_idx ON core_activitylog (employee_id, created_at);
+CREATE INDEX IF NOT EXISTS core_activitylog_company_created_idx ON core_activitylog (company_id, created_at);
+
+CREATE INDEX IF NOT EXISTS core_applicationusage_employee_created_idx ON core_applicationusage (employee_id, created_at);
+CREATE INDEX IF NOT EXISTS core_applicationusage_session_idx ON core_applicationusage (work_session_id);
+CREATE INDEX IF NOT EXISTS core_applicationusage_company_created_idx ON core_applicationusage (company_id, created_at);
+
+CREATE INDEX IF NOT EXISTS core_websiteusage_employee_created_idx ON core_websiteusage (employee_id, created_at);
+CREATE INDEX IF NOT EXISTS core_websiteusage_session_idx ON core_websiteusage (work_session_id);
+CREATE INDEX IF NOT EXISTS core_websiteusage_company_created_idx ON core_websiteusage (company_id, created_at);
+
+CREATE INDEX IF NOT EXISTS core_screenshot_employee_capture_idx ON core_screenshot (employee_id, capture_time);
+CREATE INDEX IF NOT EXISTS core_screenshot_session_idx ON core_screenshot (work_session_id);
+CREATE INDEX IF NOT EXISTS core_screenshot_company_created_idx ON core_screenshot (company_id, created_at);
+CREATE INDEX IF NOT EXISTS core_screenshot_image_idx ON core_screenshot (image);
+CREATE INDEX IF NOT EXISTS core_screenshot_thumbnail_idx ON core_screenshot (thumbnail);
+CREATE INDEX IF NOT EXISTS core_screenshot_preview_idx ON core_screenshot (preview);
+CREATE INDEX IF NOT EXISTS core_screenshot_unprocessed_idx ON core_screenshot (id) WHERE processed_at IS NULL;
+COMMIT;
@@ -0,0 +1,8 @@
+-- Daily ProductivityMetric rollups (app/rollups.py): analytics pages read a company's rows by level and day.
+-- Apply once (PostgreSQL): psql "$DATABASE_URL" -f database/migrations/0006_productivity_rollups.sql
+CREATE INDEX CONCURRENTLY IF NOT EXISTS core_productivitymetric_company_level_date_idx
+    ON core_productivitymetric (company_id, metric_level, date);
+
+-- The rollup watermark: newest USER row.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS core_productivitymetric_user_updated_idx
+    ON core_productivitymetric (updated_at) WHERE metric_level = 'USER';
@@ -0,0 +1,16 @@
+-- Hourly activity aggregates (app/activity_hourly.py) behind the activity heatmap, kept current at ingest.
+-- Apply once (PostgreSQL): psql "$DATABASE_URL" -f database/migrations/0007_activity_hourly.sql
+-- Backfill only with ACTIVITY_COMPACTION=1: cd backend && python -m app.activity_hourly --days 90
+-- Without compaction, skip it: the heatmap fills from live ingest and shows earlier history as empty hours.
+CREATE TABLE IF NOT EXISTS core_activityhourly (
+    id SERIAL PRIMARY KEY,
+    company_id INTEGER REFERENCES core_company (id) ON DELETE CASCADE,
+    employee_id INTEGER NOT NULL REFERENCES core_user (id) ON DELETE CASCADE,
+    date DATE NOT NULL,
+    hour SMALLINT NOT NULL,
+    active_seconds INTEGER NOT NULL DEFAULT 0,
+    idle_seconds INTEGER NOT NULL DEFAULT 0,
+    CONSTRAINT core_activityhourly_employee_hour_uniq UNIQUE (employee_id, date, hour)
+);
+
+CREATE INDEX IF NOT EXISTS core_activityhourly_company_date_idx ON core_activityhourly (company_id, date);
@@ -0,0 +1,9 @@
+-- Per-company retention (app/retention.py) finds expired rows by (company_id, created_at).
+-- Apply once (PostgreSQL): psql "$DATABASE_URL" -f database/migrations/0008_retention_indexes.sql
+-- Tables partitioned by 0005 already have the first four (CONCURRENTLY is not available on partitioned tables,
+-- so these are plain builds: on large unpartitioned tables they hold off writes while building; run off-hours).
+CREATE INDEX IF NOT EXISTS core_activitylog_company_created_idx ON core_activitylog (company_id, created_at);
+CREATE INDEX IF NOT EXISTS core_applicationusage_company_created_idx ON core_applicationusage (company_id, created_at);
+CREATE INDEX IF NOT EXISTS core_websiteusage_company_created_idx ON core_websiteusage (company_id, created_at);
+CREATE INDEX IF NOT EXISTS core_screenshot_company_created_idx ON core_screenshot (company_id, created_at);
+CREATE INDEX IF NOT EXISTS core_activitybatch_company_created_idx ON core_activitybatch (company_id, created_at);
@@ -4,10 +4,13 @@ import sqlite3
 import subprocess
 import queue
 import config
+import session_replay
 import requests
 import sys
 import os
 import json
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from urllib.parse import urlparse
 
@@ -379,9 +382,147 @@ def detect_domain_and_url(title, process_name=None):
 # ==========================
 # Upload to API
 # ==========================
+UPLOAD_TABLES = ("application_usages", "website_usages", "employee_activity_logs")
+
+
+def _claim_upload_batches(conn, work_session_id):
+    """
+    Assigns unclaimed local rows to new upload batches (at most
+    UPLOAD_BATCH_MAX_ROWS rows per table each). Rows keep their batch_id until
+    the server acknowledges it, so retries resend exactly the same batch.
+    Rows of offline sessions (negative provisional ids) are left to session_replay.
+    """
+    unclaimed = "batch_id IS NULL AND (work_session_id IS NULL OR work_session_id >= 0)"
+    cur = conn.cursor()
+    while True:
+        pending = [t for t in UPLOAD_TABLES if cur.execute(f"SELECT 1 FROM {t} WHERE {unclaimed} LIMIT 1").fetchone()]
+        if not pending:
+            break
+        batch_id = uuid.uuid4().hex
+        cur.execute("INSERT INTO upload_batches (batch_id, work_session_id) VALUES (?, ?)", (batch_id, work_session_id))
+        for table in pending:
+            cur.execute(f"""
+                UPDATE {table} SET batch_id = ?
+                WHERE id IN (SELECT id FROM {table} WHERE {unclaimed} ORDER BY id LIMIT ?)
+            """, (batch_id, config.UPLOAD_BATCH_MAX_ROWS))
+        conn.commit()
+
+
+def _build_batch_payload(conn, configure, batch_id, sequence, work_session_id):
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM application_usages WHERE batch_id=?", (batch_id,))
+    apps = cur.fetchall()
+    cur.execute("SELECT * FROM website_usages WHERE batch_id=?", (batch_id,))
+    sites = cur.fetchall()
+    cur.execute("""
+        SELECT MAX(id), company_id, employee_id, work_session_id, minute_type, SUM(duration_seconds), MIN(created_at) 
+        FROM employee_activity_logs 
+        WHERE batch_id=?
+        GROUP BY company_id, employee_id, work_session_id, minute_type, strftime('%Y-%m-%d %H:%M', created_at)
+    """, (batch_id,))
+    logs = cur.fetchall()
+
+    app_list = [{"app_name": r[4], "window_title": r[5], "active_seconds": r[6], "created_at": r[7] if len(r) > 7 else None} for r in apps]
+    site_list = [{"domain": r[4], "url": r[5] if len(r) > 5 else None, "active_seconds": r[6] if len(r) > 6 else r[5], "created_at": r[7] if len(r) > 7 else None} for r in sites]
+    log_list = [{"minute_type": r[4], "duration_seconds": r[5], "created_at": r[6]} for r in logs]
+
+    return {
+        "employee_id": configure["employee_id"],
+        "company_id": configure["company_id"],
+        "active_token": configure["active_token"],
+        "work_session_id": work_session_id or configure["work_session_id"],
+        "batch_id": batch_id,
+        "sequence": sequence,
+        "applications": app_list,
+        "websites": site_list,
+        "activities": log_list
+    }
+
+
+# Set when the server rate-limits uploads (429) for longer than a retry sleep
+_upload_paused_until = 0.0
+_upload_pause_lock = threading.Lock()
+
+
+def pause_uploads(seconds):
+    """Holds activity uploads (upload thread and heartbeat piggyback) for ``seconds``."""
+    global _upload_paused_until
+    with _upload_pause_lock:
+        _upload_paused_until = max(_upload_paused_until, time.monotonic() + seconds)
+    print(f"Activity uploads rate-limited; retrying in {int(seconds)}s")
+
+
+def uploads_paused():
+    return time.monotonic() < _upload_paused_until
+
+
+def _send_batch(payload):
+    """Posts one batch, retrying with backoff. Safe because the server ignores repeated batch ids."""
+    from api_helper import api_post, backoff_delay
+
+    for attempt in range(config.UPLOAD_MAX_RETRIES + 1):
+        if uploads_paused():
+            return False
+        res = None
+        try:
+            res = api_post("/upload/employee-activity", json_data=payload, timeout=30)
+            # 202: accepted by a server running buffered ingestion
+            if res.status_code in (200, 202):
+                return True
+            if res.status_code < 500 and res.status_code != 429:
+                return False  # rejected; leave it for the next sync cycle
+        except requests.RequestException as e:
+            print(f"Upload of batch {payload['batch_id']} failed: {e}")
+        delay = backoff_delay(attempt, res)
+        if res is not None and res.status_code == 429 and delay > config.UPLOAD_RETRY_SLEEP_MAX:
+            pause_uploads(delay)
+            return False
+        if attempt < config.UPLOAD_MAX_RETRIES and config.tracking_active:
+            time.sleep(min(delay, config.UPLOAD_RETRY_SLEEP_MAX))
+    return False
+
+
+def pending_upload_payloads(configure):
+    """Claims new local rows into batches and returns the payloads of every unacknowledged batch."""
+    conn = sqlite3.connect(config.DB_PATH, check_same_thread=False)
+    try:
+        # New batches need a server session id; an offline session has none yet
+        if not session_replay.is_provisional(configure["work_session_id"]):
+            _claim_upload_batches(conn, configure["work_session_id"])
+        batches = conn.execute("SELECT sequence, batch_id, work_session_id FROM upload_batches ORDER BY sequence").fetchall()
+        return [_build_batch_payload(conn, configure, batch_id, seq, ws_id) for seq, batch_id, ws_id in batches]
+    finally:
+        conn.close()
+
+
+def send_upload_batches(payloads):
+    """Sends batches concurrently; returns one success flag per payload."""
+    if uploads_paused():
+        return [False] * len(payloads)
+    # Batches are idempotent, so several can be in flight at once
+    with ThreadPoolExecutor(max_workers=config.UPLOAD_PIPELINE_DEPTH) as pool:
+        return list(pool.map(_send_batch, payloads))
+
+
+def acknowledge_batches(batch_ids):
+    """Deletes the local rows of batches the server has accepted."""
+    if not batch_ids:
+        return
+    conn = sqlite3.connect(config.DB_PATH, check_same_thread=False)
+    try:
+        cur = conn.cursor()
+        for batch_id in batch_ids:
+            for table in UPLOAD_TABLES:
+                cur.execute(f"DELETE FROM {table} WHERE batch_id=?", (batch_id,))
+            cur.execute("DELETE FROM upload_batches WHERE batch_id=?", (batch_id,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
 def upload_to_api(configure):
     import internet_check
-    from api_helper import api_post
+    import heartbeat
     
     while config.tracking_active:
         for _ in range(config.SYNC_ACTIVITY_TIMER):
@@ -392,52 +533,28 @@ def upload_to_api(configure):
         if not config.tracking_active:
             return
 
+        # Finished offline sessions go up whole once the server is reachable
+        if not uploads_paused() and internet_check.is_connected():
+            session_replay.replay_offline_sessions(configure["employee_id"], configure["active_token"])
+
+        # The dashboard heartbeat carries uploads while it is working
+        if heartbeat.piggyback_active.is_set():
+            continue
+
         if not internet_check.is_connected():
             print("No Internet.")
             continue
 
-        try:
-            conn = sqlite3.connect(config.DB_PATH, check_same_thread=False)
-            cur = conn.cursor()
-            
-            cur.execute("SELECT * FROM application_usages")
-            apps = cur.fetchall()
-            cur.execute("SELECT * FROM website_usages")
-            sites = cur.fetchall()
-            cur.execute("""
-                SELECT MAX(id), company_id, employee_id, work_session_id, minute_type, SUM(duration_seconds), MAX(created_at) 
-                FROM employee_activity_logs 
-                GROUP BY company_id, employee_id, work_session_id, minute_type
-            """)
-            logs = cur.fetchall()
-            conn.close()
+        if uploads_paused():
+            continue
 
-            if not apps and not sites and not logs:
+        try:
+            payloads = pending_upload_payloads(configure)
+            if not payloads:
                 continue
-            
-            app_list = [{"app_name": r[4], "window_title": r[5], "active_seconds": r[6], "created_at": r[7] if len(r) > 7 else None} for r in apps]
-            site_list = [{"domain": r[4], "url": r[5] if len(r) > 5 else None, "active_seconds": r[6] if len(r) > 6 else r[5], "created_at": r[7] if len(r) > 7 else None} for r in sites]
-            log_list = [{"minute_type": r[4], "duration_seconds": r[5], "created_at": r[6]} for r in logs]
-
-            payload = {
-                "employee_id": configure["employee_id"],
-                "company_id": configure["company_id"],
-                "active_token": configure["active_token"],
-                "work_session_id": configure["work_session_id"],
-                "applications": app_list,
-                "websites": site_list,
-                "activities": log_list
-            }
 
-            res = api_post("/upload/employee-activity", json_data=payload, timeout=30)
-            if res.status_code == 200:
-                conn = sqlite3.connect(config.DB_PATH, check_same_thread=False)
-                cur = conn.cursor()
-                cur.execute("DELETE FROM application_usages")
-                cur.execute("DELETE FROM website_usages")
-                cur.execute("DELETE FROM employee_activity_logs")
-                conn.commit()
-                conn.close()
+            results = send_upload_batches(payloads)
+            acknowledge_batches([p["batch_id"] for p, ok in zip(payloads, results) if ok])
         except Exception as e:
             print(f"Upload failed: {e}")
 
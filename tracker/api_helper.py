@@ -2,6 +2,11 @@
 API Helper Module
 Centralizes API requests with proper headers (including X-Company-Key)
 """
+import gzip
+import json
+import random
+import time
+from email.utils import parsedate_to_datetime
 import requests
 import config
 from config import API_URL
@@ -9,6 +14,9 @@ from config import API_URL
 # Company Key for multi-tenant support
 COMPANY_KEY = config.COMPANY_KEY
 
+# Cleared when the server turns out not to understand compressed bodies
+_compression_supported = True
+
 def get_headers(token=None):
     """
     Get standard headers for API requests
@@ -54,13 +62,36 @@ def api_post(endpoint, json_data=None, data=None, token=None, timeout=30):
     headers = get_headers(token)
     
     if json_data is not None:
-        return requests.post(url, json=json_data, headers=headers, timeout=timeout)
+        return _post_json(url, json_data, headers, timeout)
     if data is not None:
         return requests.post(url, json=data, headers=headers, timeout=timeout)
     return requests.post(url, headers=headers, timeout=timeout)
 
 
-def api_get(endpoint, token=None, timeout=5):
+def _post_json(url, json_data, headers, timeout):
+    """
+    POST a JSON body, gzip-compressed once it reaches UPLOAD_COMPRESS_MIN_BYTES.
+    Falls back to plain JSON if the server rejects the compressed request.
+    """
+    global _compression_supported
+
+    body = json.dumps(json_data).encode("utf-8")
+    if not _compression_supported or len(body) < config.UPLOAD_COMPRESS_MIN_BYTES:
+        return requests.post(url, data=body, headers=headers, timeout=timeout)
+
+    compressed_headers = dict(headers, **{'Content-Encoding': 'gzip'})
+    res = requests.post(url, data=gzip.compress(body, compresslevel=6), headers=compressed_headers, timeout=timeout)
+    if res.status_code not in (415, 422):
+        return res
+
+    # Older servers answer 415, or 422 when they try to parse the gzip bytes as JSON
+    plain = requests.post(url, data=body, headers=headers, timeout=timeout)
+    if plain.status_code not in (415, 422):
+        _compression_supported = False
+    return plain
+
+
+def api_get(endpoint, token=None, timeout=5, extra_headers=None):
     """
     Make GET request with proper headers
     
@@ -68,11 +99,88 @@ def api_get(endpoint, token=None, timeout=5):
         endpoint: API endpoint
         token: Optional authentication token
         timeout: Request timeout
+        extra_headers: Optional additional headers (e.g. If-None-Match)
         
     Returns:
         Response object
     """
     url = _build_url(endpoint)
     headers = get_headers(token)
+    if extra_headers:
+        headers.update(extra_headers)
     
     return requests.get(url, headers=headers, timeout=timeout)
+
+
+def api_post_file(endpoint, file_path, params=None, token=None, content_type='application/octet-stream', timeout=30):
+    """
+    Stream a file as the raw request body (no base64, no JSON wrapper)
+
+    Args:
+        endpoint: API endpoint
+        file_path: Path of the file to send
+        params: Optional query parameters
+        token: Optional authentication token
+        content_type: MIME type of the file
+        timeout: Request timeout
+
+    Returns:
+        Response object
+    """
+    url = _build_url(endpoint)
+    headers = get_headers(token)
+    headers['Content-Type'] = content_type
+
+    with open(file_path, 'rb') as body:
+        return requests.post(url, data=body, params=params, headers=headers, timeout=timeout)
+
+
+def retry_after_seconds(response):
+    """
+    Seconds the server asked us to wait (Retry-After as seconds or an HTTP date)
+
+    Returns:
+        float or None if the response carries no usable Retry-After
+    """
+    value = (response.headers.get('Retry-After') or '').strip() if response is not None else ''
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def endpoint_missing(response):
+    """
+    True when the server lacks the endpoint (an older backend): any 405, and any
+    404 except the API's own JSON "... not found" for a missing record. A 404
+    without a JSON body (e.g. from a proxy) counts as missing.
+    """
+    if response.status_code == 405:
+        return True
+    if response.status_code != 404:
+        return False
+    try:
+        detail = response.json().get("detail")
+    except (ValueError, AttributeError):
+        return True
+    return not isinstance(detail, str) or detail == "Not Found"
+
+
+def backoff_delay(attempt, response=None):
+    """
+    Jittered wait before retrying a rejected or failed request
+
+    Honors Retry-After (never retrying earlier, spread over up to a quarter
+    more so agents limited together do not return together); otherwise
+    exponential backoff with equal jitter, capped at UPLOAD_MAX_BACKOFF_SECONDS.
+    """
+    retry_after = retry_after_seconds(response)
+    if retry_after is not None:
+        retry_after = min(retry_after, config.UPLOAD_MAX_BACKOFF_SECONDS)
+        return retry_after + random.uniform(0, max(1.0, retry_after * 0.25))
+    delay = min(2 ** attempt, config.UPLOAD_MAX_BACKOFF_SECONDS)
+    return delay / 2 + random.uniform(0, delay / 2)
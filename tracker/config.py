@@ -32,6 +32,30 @@ print(f"📡 API URL: {API_URL}")
 
 # Faster sync for realtime updates (seconds)
 SYNC_ACTIVITY_TIMER = 10
+# Activity upload batching: rows per table per batch, batches sent in parallel,
+# and quick retries of a failed batch before waiting for the next sync cycle
+UPLOAD_BATCH_MAX_ROWS = 2000
+UPLOAD_PIPELINE_DEPTH = 3
+UPLOAD_MAX_RETRIES = 3
+# Longest a rate-limited (429) upload waits before trying again, and the longest
+# wait spent sleeping inside a retry loop (longer ones pause uploads instead)
+UPLOAD_MAX_BACKOFF_SECONDS = 300
+UPLOAD_RETRY_SLEEP_MAX = 30
+# Start sessions offline (provisional id) when the server is unreachable and
+# replay them in one call once it is back
+OFFLINE_SESSIONS_ENABLED = True
+# JSON request bodies at least this large are sent gzip-compressed
+UPLOAD_COMPRESS_MIN_BYTES = 1024
+
+# Single heartbeat replacing the session/config/task pollers (falls back to
+# polling automatically against servers without /agent/heartbeat)
+HEARTBEAT_ENABLED = True
+HEARTBEAT_INTERVAL_SECONDS = 10
+
+# Server push (SSE) stream; while connected the heartbeat and pollers slow down to a safety resync
+EVENT_STREAM_ENABLED = True
+EVENT_STREAM_READ_TIMEOUT = 60  # seconds without data (server keepalive is 20 s) before reconnecting
+EVENT_STREAM_RESYNC_SECONDS = 60  # catches events a multi-worker server without LISTEN/NOTIFY never delivers
 # Capture screenshots within a 2-minute window for quicker visibility
 CAPTURE_DURATION = 120
 
@@ -22,6 +22,7 @@ class ConfigManager:
         self.last_check_time = 0
         self.config_version = self.local_config.get('config_version', 0)
         self.last_update_time = self.local_config.get('updated_at', None)
+        self.etag = None  # ETag of the last config response; lets the server answer 304
         
         self._log("🔧 ConfigManager initialized")
 
@@ -102,7 +103,12 @@ class ConfigManager:
             True if config was updated, False otherwise
         """
         try:
-            response = api_get("/employee-config/", token=employee_token, timeout=5)
+            extra_headers = {'If-None-Match': self.etag} if self.etag else None
+            response = api_get("/employee-config/", token=employee_token, timeout=5, extra_headers=extra_headers)
+            
+            if response.status_code == 304:
+                # Config not changed
+                return False
             
             if response.status_code == 401:
                 self._log("❌ Auth failed - token invalid")
@@ -113,6 +119,7 @@ class ConfigManager:
                 return False
             
             data = response.json()
+            self.etag = response.headers.get('ETag')
             
             if not data.get('status'):
                 self._log(f"❌ Config fetch failed: {data.get('message', 'Unknown error')}")
@@ -143,6 +150,19 @@ class ConfigManager:
             self._log(f"❌ Config fetch error: {e}")
             return False
     
+    def apply_remote_config(self, new_config):
+        """
+        Apply a config received outside _fetch_from_api (e.g. in a heartbeat).
+
+        Returns:
+            True if config was updated, False otherwise
+        """
+        if not new_config or new_config.get('config_version', 0) <= self.config_version:
+            return False
+        self._log(f"🔄 Config update: v{self.config_version} → v{new_config.get('config_version', 0)}")
+        self._apply_config(new_config)
+        return True
+    
     def _apply_config(self, new_config):
         """
         Apply new configuration and notify app.
@@ -3,7 +3,7 @@ from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QLabel, QPushButton, QMessage
                              QFrame, QHBoxLayout, QTextEdit, QSpacerItem, QSizePolicy, 
                              QSystemTrayIcon, QGraphicsDropShadowEffect, QDialog)
 from PyQt6.QtGui import QFont, QCloseEvent, QIcon, QCursor, QDesktopServices, QColor
-from PyQt6.QtCore import Qt, QTimer, QUrl
+from PyQt6.QtCore import Qt, QTimer, QUrl, pyqtSignal
 import config
 from config_manager import ConfigManager
 from task_manager import TaskManager, TaskProgressTracker
@@ -11,9 +11,12 @@ from task_ui import TaskCardContainer
 from work_session_controller import WorkSessionController
 from screenshot_controller import ScreenshotController
 from activity_tracker import start_tracking
+from heartbeat import HeartbeatClient
+from event_stream import EventStreamClient
 import threading
 import internet_check
 from api_helper import api_post
+import session_replay
 
 class DashboardUI(QWidget):
     """
@@ -22,6 +25,14 @@ class DashboardUI(QWidget):
     Allows starting/stopping work sessions and logging out.
     Integrates realtime config sync from backend API.
     """
+    # Emitted from the heartbeat / event stream / refresh threads; handled on the UI thread
+    heartbeat_received = pyqtSignal(object)
+    push_event_received = pyqtSignal(object)
+    push_state_changed = pyqtSignal(bool)
+    session_status_received = pyqtSignal(object, object)
+    config_refreshed = pyqtSignal(bool)
+    tasks_fetched = pyqtSignal(object)
+
     def __init__(self, controller):
         super().__init__()
         self.controller = controller
@@ -107,12 +118,31 @@ class DashboardUI(QWidget):
         # Uses interval from config manager
         self.config_check_timer = QTimer()
         self.config_check_timer.timeout.connect(self.check_config_updates)
-        self.config_check_timer.start(2000)  # Check every 2 seconds (will respect API interval)
         
         # Setup timer for checking task updates (realtime polling)
         self.task_check_timer = QTimer()
         self.task_check_timer.timeout.connect(self.check_task_updates)
-        self.task_check_timer.start(5000)  # Check every 5 seconds for new tasks
+
+        # Single heartbeat replacing the three pollers above (and carrying
+        # activity uploads); the pollers are used against older servers
+        self.heartbeat = HeartbeatClient(self.config_manager)
+        self.heartbeat_busy = False
+        self.heartbeat_received.connect(self.on_heartbeat)
+        self.heartbeat_timer = QTimer()
+        self.heartbeat_timer.timeout.connect(self.send_heartbeat)
+
+        # Server push stream; while connected only a slow safety resync runs
+        self.event_stream = None
+        self.push_event_received.connect(self.on_push_event)
+        self.push_state_changed.connect(self.on_push_state)
+        self.resync_timer = QTimer()
+        self.resync_timer.timeout.connect(self.resync)
+        self.session_status_received.connect(self.on_session_status)
+        self.config_refreshed.connect(self.on_config_refreshed)
+        self.tasks_fetched.connect(self.apply_task_result)
+
+        self.sync_mode = None
+        self.set_sync_mode(self.fallback_sync_mode())
 
         self.init_ui()
         
@@ -120,6 +150,7 @@ class DashboardUI(QWidget):
         self.check_and_handle_stalled_session()
         
         self.render_dashboard()
+        self.start_event_stream()
 
     def init_ui(self):
         """Sets up the main layout container."""
@@ -655,7 +686,8 @@ class DashboardUI(QWidget):
         self.seconds = 0
 
         self.timer.start(1000)
-        self.session_check_timer.start(10000)  # Check every 10 seconds if session is still active
+        if self.sync_mode == "polling":
+            self.session_check_timer.start(10000)  # Check every 10 seconds if session is still active
         
         # Start activity tracking in a background thread
         threading.Thread(
@@ -696,34 +728,184 @@ class DashboardUI(QWidget):
         self.session_check_timer.stop()  # Stop checking session status
         QMessageBox.information(self, "Stopped", "Session stopped successfully")
 
+    def fallback_sync_mode(self):
+        """Sync mode to use when the push stream is not connected."""
+        return "heartbeat" if config.HEARTBEAT_ENABLED and self.heartbeat.supported else "polling"
+
+    def set_sync_mode(self, mode):
+        """
+        Switches how the dashboard learns about server-side changes:
+        'push' (event stream plus a slow resync), 'heartbeat' (one timer) or
+        'polling' (separate session/config/task timers).
+        """
+        if mode == self.sync_mode:
+            return
+        self.sync_mode = mode
+        timers = (self.heartbeat_timer, self.config_check_timer, self.task_check_timer,
+                  self.session_check_timer, self.resync_timer)
+        for timer in timers:
+            timer.stop()
+        if mode != "heartbeat":
+            self.heartbeat.stop()
+
+        if mode == "push":
+            self.resync_timer.start(config.EVENT_STREAM_RESYNC_SECONDS * 1000)
+        elif mode == "heartbeat":
+            self.heartbeat_timer.start(config.HEARTBEAT_INTERVAL_SECONDS * 1000)
+        elif mode == "polling":
+            self.config_check_timer.start(2000)  # Check every 2 seconds (will respect API interval)
+            self.task_check_timer.start(5000)  # Check every 5 seconds for new tasks
+            if self.running:
+                self.session_check_timer.start(10000)
+
+    def start_event_stream(self):
+        """Opens the push stream once the employee's token is known."""
+        if not config.EVENT_STREAM_ENABLED or self.event_stream is not None or not getattr(self, 'active_token', None):
+            return
+        self.event_stream = EventStreamClient(
+            self.active_token,
+            on_event=self.push_event_received.emit,
+            on_state=self.push_state_changed.emit,
+        )
+        self.event_stream.start()
+
+    def on_push_state(self, connected):
+        if connected:
+            self.set_sync_mode("push")
+            # Catch up on anything that changed while disconnected
+            self.resync()
+        else:
+            self.set_sync_mode(self.fallback_sync_mode())
+
+    def resync(self):
+        """
+        Catches up on session, config and task state in the background. Runs on
+        every (re)connect of the push stream and every EVENT_STREAM_RESYNC_SECONDS
+        while it is up: a server running several workers without LISTEN/NOTIFY
+        only delivers the events published by the worker holding this stream.
+        """
+        if config.HEARTBEAT_ENABLED and self.heartbeat.supported:
+            self.send_heartbeat(carry_activity=False)
+        else:
+            self.refresh_in_background(session=True, config_changed=True, tasks_changed=True)
+
+    def refresh_in_background(self, session=False, config_changed=False, tasks_changed=False):
+        """Fetches session status, config and/or tasks from a worker thread; results land on the UI thread."""
+        if not getattr(self, 'active_token', None):
+            return
+        token = self.active_token
+        session_id = self.session_id if session and self.running else None
+        if session_replay.is_provisional(session_id):
+            session_id = None
+
+        def worker():
+            if session_id:
+                self.session_status_received.emit(session_id, self.fetch_session_status(session_id))
+            if config_changed:
+                self.config_refreshed.emit(self.config_manager.force_refresh(token))
+            if tasks_changed:
+                try:
+                    self.tasks_fetched.emit(self.task_manager.check_for_new_tasks())
+                except Exception as e:
+                    print(f"Task check error: {e}")
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def on_push_event(self, event):
+        event_type = event.get("type")
+        if event_type == "session_ended":
+            if self.running and event.get("session_id") == self.session_id:
+                self.auto_stop_session(event.get("reason", "Session ended by administrator"))
+        elif event_type == "config_changed":
+            self.refresh_in_background(config_changed=True)
+        elif event_type == "task_changed":
+            self.refresh_in_background(tasks_changed=True)
+
+    def on_config_refreshed(self, updated):
+        if updated:
+            status = self.config_manager.get_status_info()
+            print(f"✅ Config applied - v{status['version']} | Screenshot interval: {status['screenshot_interval']}")
+
+    def send_heartbeat(self, carry_activity=True):
+        """Sends a heartbeat from a worker thread so the UI never blocks on the network."""
+        if self.heartbeat_busy or not hasattr(self, 'emp_id'):
+            return
+        self.heartbeat_busy = True
+        # An offline session is unknown to the server until it is replayed
+        session_id = self.session_id if self.running and not session_replay.is_provisional(self.session_id) else None
+        args = (self.emp_id, self.company_id, self.active_token, session_id,
+                self.running and carry_activity)
+
+        def worker():
+            data = None
+            try:
+                data = self.heartbeat.beat(*args)
+            except Exception as e:
+                print(f"Heartbeat error: {e}")
+            self.heartbeat_received.emit(data)
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def on_heartbeat(self, data):
+        """Applies a heartbeat response: session state, config and task changes."""
+        self.heartbeat_busy = False
+        if self.sync_mode != "heartbeat":
+            # A catch-up beat (or one finishing after a mode switch) must not keep uploads paused
+            self.heartbeat.stop()
+        if data is None:
+            if not self.heartbeat.supported and self.sync_mode == "heartbeat":
+                print("Server has no heartbeat endpoint; falling back to polling")
+                self.set_sync_mode("polling")
+            return
+
+        session = data.get("session")
+        if self.running and session and session.get("id") == self.session_id and not session.get("active"):
+            self.auto_stop_session(session.get("reason", "Session ended by administrator"))
+
+        if data.get("config") and self.config_manager.apply_remote_config(data["config"]):
+            status = self.config_manager.get_status_info()
+            print(f"✅ Config applied - v{status['version']} | Screenshot interval: {status['screenshot_interval']}")
+
+        if data.get("tasks") is not None:
+            result = self.task_manager.apply_task_list(data["tasks"])
+            if hasattr(self, 'task_container'):
+                self.task_container.update_all_tasks(result['tasks'])
+            if result.get('newly_added_count', 0) > 0 and config.DEBUG_LOGS:
+                print(f"📋 {result['newly_added_count']} new task(s) assigned")
+
     def check_session_status(self):
         """
         Periodic check to verify if the session is still active on the server.
         If admin ends the session from the web dashboard, this will detect it
         and stop the local session immediately without logging out the user.
         """
-        if not self.running or not self.session_id:
+        if not self.running or not self.session_id or session_replay.is_provisional(self.session_id):
             return
-        
+        self.on_session_status(self.session_id, self.fetch_session_status(self.session_id))
+
+    def fetch_session_status(self, session_id):
+        """Asks the server whether session_id is still active; None if it could not tell."""
         try:
             response = api_post(
                 "/check-session-active",
                 json_data={
-                    "session_id": self.session_id,
+                    "session_id": session_id,
                     "employee_id": self.emp_id,
                     "active_token": self.active_token
                 },
                 timeout=5
             )
-            
             if response.status_code == 200:
-                data = response.json()
-                # If session is no longer active on server, stop it locally
-                if not data.get("status"):
-                    self.auto_stop_session(data.get("message", "Session ended by administrator"))
+                return response.json()
         except Exception as e:
             # Silent fail - don't disrupt user experience
             print(f"Session check error: {e}")
+        return None
+
+    def on_session_status(self, session_id, data):
+        # If session is no longer active on server, stop it locally
+        if data is not None and not data.get("status") and self.running and self.session_id == session_id:
+            self.auto_stop_session(data.get("message", "Session ended by administrator"))
 
     def check_config_updates(self):
         """
@@ -769,35 +951,37 @@ class DashboardUI(QWidget):
             token = result[0]
             
             # Check for new or updated tasks
-            result = self.task_manager.check_for_new_tasks()
-            
-            if result['status']:
-                tasks = result.get('tasks', [])
-                
-                # Update task card container with all tasks
-                if hasattr(self, 'task_container'):
-                    self.task_container.update_all_tasks(tasks)
-                
-                # Log changes
-                if result.get('newly_added_count', 0) > 0:
-                    if config.DEBUG_LOGS:
-                        print(f"📋 {result['newly_added_count']} new task(s) assigned")
-                
-                if result.get('removed_count', 0) > 0:
-                    if config.DEBUG_LOGS:
-                        print(f"✅ {result['removed_count']} task(s) completed/removed")
-                
-            elif result.get('offline'):
-                # Using cached tasks
-                if hasattr(self, 'task_container'):
-                    tasks = result.get('tasks', [])
-                    self.task_container.update_all_tasks(tasks)
-                if config.DEBUG_LOGS:
-                    print(f"📋 Offline mode - Using {len(tasks)} cached tasks")
+            self.apply_task_result(self.task_manager.check_for_new_tasks())
                 
         except Exception as e:
             if config.DEBUG_LOGS:
                 print(f"Task check error: {e}")
+
+    def apply_task_result(self, result):
+        """Shows the outcome of a task fetch (TaskManager.check_for_new_tasks)."""
+        if result['status']:
+            tasks = result.get('tasks', [])
+            
+            # Update task card container with all tasks
+            if hasattr(self, 'task_container'):
+                self.task_container.update_all_tasks(tasks)
+            
+            # Log changes
+            if result.get('newly_added_count', 0) > 0:
+                if config.DEBUG_LOGS:
+                    print(f"📋 {result['newly_added_count']} new task(s) assigned")
+            
+            if result.get('removed_count', 0) > 0:
+                if config.DEBUG_LOGS:
+                    print(f"✅ {result['removed_count']} task(s) completed/removed")
+            
+        elif result.get('offline'):
+            # Using cached tasks
+            tasks = result.get('tasks', [])
+            if hasattr(self, 'task_container'):
+                self.task_container.update_all_tasks(tasks)
+            if config.DEBUG_LOGS:
+                print(f"📋 Offline mode - Using {len(tasks)} cached tasks")
     
     def on_task_progress_update(self, task_id: int, progress: int, notes: str):
         """Handle task progress update from UI"""
@@ -868,6 +1052,9 @@ class DashboardUI(QWidget):
         """
         if self.running:
             self.stop_session()
+        if self.event_stream is not None:
+            self.event_stream.stop()
+        self.set_sync_mode(None)
             
         self.close()
         from login_ui import LoginUI
@@ -1,6 +1,14 @@
 import sqlite3
 import config
 
+
+def _ensure_column(cur, table, column, definition):
+    """Adds a column to an existing table created by an older tracker version."""
+    cur.execute(f"PRAGMA table_info({table})")
+    if column not in [col[1] for col in cur.fetchall()]:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
 def init_db():
     """
     Initializes the local SQLite database.
@@ -109,6 +117,27 @@ def init_db():
                 end_time TEXT
             )
         """)
+        # Offline sessions: session_api_id holds a negative provisional id until replayed
+        _ensure_column(cur, "work_sessions", "local_id", "TEXT")
+        # Last replay rejection; the session is kept and retried
+        _ensure_column(cur, "work_sessions", "replay_error", "TEXT")
+
+        # ----------------------
+        # Upload batches
+        # Rows are claimed into a batch (batch_id column) before upload so a
+        # retry resends the same batch id and the server can ignore duplicates.
+        # ----------------------
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS upload_batches (
+                sequence INTEGER PRIMARY KEY AUTOINCREMENT,
+                batch_id TEXT UNIQUE,
+                work_session_id INTEGER,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        for table in ("application_usages", "website_usages", "employee_activity_logs"):
+            _ensure_column(cur, table, "batch_id", "TEXT")
+            cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_batch_id ON {table} (batch_id)")
 
         conn.commit()
         print("[DB INIT] All tables created successfully.")
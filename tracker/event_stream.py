@@ -0,0 +1,104 @@
+"""
+Agent Event Stream Module
+Keeps a Server-Sent Events connection to /agent/events open in a background
+thread and hands each event (session_ended, config_changed, task_changed) to a
+callback. While connected the dashboard only runs a slow resync instead of
+polling; when the stream drops it reports disconnected and reconnects with backoff.
+"""
+import json
+import random
+import threading
+import time
+import requests
+import config
+from api_helper import _build_url, get_headers
+
+
+class EventStreamClient:
+    """
+    Args:
+        token: Agent tracker token
+        on_event: Called with each event dict (from the stream thread)
+        on_state: Called with True on connect, False on disconnect (from the stream thread)
+    """
+
+    def __init__(self, token, on_event, on_state):
+        self.token = token
+        self.on_event = on_event
+        self.on_state = on_state
+        self.supported = True  # False once the server turns out to predate the endpoint
+        self._stop = threading.Event()
+        self._response = None
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        response = self._response
+        if response is not None:
+            try:
+                response.close()  # unblocks the reading thread
+            except Exception:
+                pass
+
+    def _run(self):
+        delay = 1
+        while not self._stop.is_set():
+            connected = False
+            try:
+                headers = get_headers(self.token)
+                headers['Accept'] = 'text/event-stream'
+                # Read timeout well above the server keepalive interval detects dead connections
+                with requests.get(_build_url("/agent/events"), headers=headers, stream=True,
+                                  timeout=(5, config.EVENT_STREAM_READ_TIMEOUT)) as response:
+                    self._response = response
+                    if response.status_code == 404:
+                        self.supported = False
+                        self.on_state(False)
+                        return
+                    if response.status_code != 200:
+                        raise requests.RequestException(f"status {response.status_code}")
+                    connected = True
+                    delay = 1
+                    self.on_state(True)
+                    self._consume(response)
+            except Exception as e:
+                if config.DEBUG_LOGS and not self._stop.is_set():
+                    print(f"Event stream error: {e}")
+            finally:
+                self._response = None
+                if connected:
+                    self.on_state(False)
+            if self._stop.wait(delay + random.uniform(0, 1)):
+                return
+            delay = min(delay * 2, 60)
+
+    def _consume(self, response):
+        event_type, data_lines = None, []
+        for line in response.iter_lines(decode_unicode=True):
+            if self._stop.is_set():
+                return
+            if line is None:
+                continue
+            if line == "":
+                if data_lines:
+                    try:
+                        event = json.loads("\n".join(data_lines))
+                    except ValueError:
+                        event = {"type": event_type}
+                    event.setdefault("type", event_type)
+                    if event.get("type") != "connected":
+                        self.on_event(event)
+                event_type, data_lines = None, []
+            elif line.startswith(":"):
+                continue  # keepalive comment
+            elif line.startswith("event:"):
+                event_type = line[6:].strip()
+            elif line.startswith("data:"):
+                data_lines.append(line[5:].lstrip())
@@ -0,0 +1,95 @@
+"""
+Agent Heartbeat Module
+One periodic request replacing the session-check, config and task pollers.
+The oldest pending activity batch rides along with it.
+"""
+import threading
+import requests
+import config
+import activity_tracker
+from api_helper import api_post, endpoint_missing
+
+# Set while heartbeats succeed; upload_to_api leaves activity uploads to the heartbeat meanwhile
+piggyback_active = threading.Event()
+
+# Auth fields already present at the top level of the heartbeat body
+_AUTH_FIELDS = ("employee_id", "company_id", "active_token")
+
+
+class HeartbeatClient:
+    """
+    Sends heartbeats to /agent/heartbeat and keeps the task-list version the
+    server compares against. Config version comes from the ConfigManager.
+    """
+
+    def __init__(self, config_manager):
+        self.config_manager = config_manager
+        self.task_version = None
+        self.supported = True  # False once the server turns out to predate the endpoint
+
+    def beat(self, employee_id, company_id, active_token, session_id=None, tracking=False):
+        """
+        Send one heartbeat.
+
+        Returns:
+            dict: The response 'data' block, or None if the heartbeat failed
+        """
+        payloads = []
+        if tracking and session_id and not activity_tracker.uploads_paused():
+            try:
+                payloads = activity_tracker.pending_upload_payloads({
+                    "employee_id": employee_id,
+                    "company_id": company_id,
+                    "active_token": active_token,
+                    "work_session_id": session_id,
+                })
+            except Exception as e:
+                print(f"Heartbeat could not read pending activity: {e}")
+
+        body = {
+            "employee_id": employee_id,
+            "active_token": active_token,
+            "session_id": session_id,
+            "config_version": self.config_manager.config_version,
+            "task_version": self.task_version,
+        }
+        if payloads:
+            body["activity"] = {k: v for k, v in payloads[0].items() if k not in _AUTH_FIELDS}
+
+        try:
+            res = api_post("/agent/heartbeat", json_data=body, timeout=10)
+            if endpoint_missing(res):
+                self.supported = False
+                piggyback_active.clear()
+                return None
+            if res.status_code != 200:
+                piggyback_active.clear()
+                return None
+            data = res.json().get("data") or {}
+        except (requests.RequestException, ValueError) as e:
+            if config.DEBUG_LOGS:
+                print(f"Heartbeat error: {e}")
+            piggyback_active.clear()
+            return None
+
+        acknowledged = []
+        activity = data.get("activity")
+        if payloads and activity and activity.get("status_code") in (200, 202):
+            acknowledged.append(payloads[0]["batch_id"])
+        if activity and activity.get("status_code") == 429:
+            activity_tracker.pause_uploads(activity.get("retry_after") or config.HEARTBEAT_INTERVAL_SECONDS)
+        # Backlog beyond the piggybacked batch goes out through the regular pipeline
+        if len(payloads) > 1 and not activity_tracker.uploads_paused():
+            results = activity_tracker.send_upload_batches(payloads[1:])
+            acknowledged += [p["batch_id"] for p, ok in zip(payloads[1:], results) if ok]
+        activity_tracker.acknowledge_batches(acknowledged)
+
+        if data.get("task_version"):
+            self.task_version = data["task_version"]
+        if tracking:
+            piggyback_active.set()
+        return data
+
+    def stop(self):
+        """Hand activity uploads back to the upload thread."""
+        piggyback_active.clear()
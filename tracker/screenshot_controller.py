@@ -10,7 +10,7 @@ import config
 import threading
 import internet_check
 import time
-from api_helper import api_post
+from api_helper import api_post, api_post_file, backoff_delay, endpoint_missing
 
 class ScreenshotController:
     """
@@ -21,6 +21,9 @@ class ScreenshotController:
         self.active_token = None  # set when session starts
         self.capture_timers = []  # Keep references to prevent garbage collection
         self.upload_loop_started = False
+        self.binary_upload_supported = True  # cleared if the server predates /screenshot/upload-binary
+        self.upload_paused_until = 0.0  # set when the server answers 429
+        self.rate_limited_count = 0
 
     def _load_runtime_config(self):
         defaults = {
@@ -104,8 +107,8 @@ class ScreenshotController:
             db = sqlite3.connect(config.DB_PATH)
             cursor = db.cursor()
 
-            # Fetch up to 5 pending screenshots
-            cursor.execute("SELECT * FROM screenshots WHERE uploaded=0 LIMIT 5")
+            # Fetch up to 5 pending screenshots (offline sessions' wait for session_replay)
+            cursor.execute("SELECT * FROM screenshots WHERE uploaded=0 AND (work_session_id IS NULL OR work_session_id >= 0) LIMIT 5")
             rows = cursor.fetchall()
 
             for row in rows:
@@ -118,23 +121,51 @@ class ScreenshotController:
                     continue
 
                 try:
-                    # Encode image to Base64
-                    with open(path, "rb") as img_file:
-                        encoded = base64.b64encode(img_file.read()).decode()
-
-                    payload = {
-                        "employee_id": emp,
-                        "company_id": comp,
-                        "work_session_id": ws_id,
-                        "capture_time": ctime,
-                        "photo": encoded,
-                        "active_token": self.active_token,  # required by backend
-                    }
-
-                    # Upload to API
-                    res = api_post("/screenshot/upload", json_data=payload, timeout=30)
+                    res = None
+                    if self.binary_upload_supported:
+                        # Stream the file as-is; no base64 inflation or JSON wrapper
+                        params = {
+                            "employee_id": emp,
+                            "work_session_id": ws_id,
+                            "capture_time": ctime,
+                        }
+                        res = api_post_file(
+                            "/screenshot/upload-binary",
+                            path,
+                            params=params,
+                            token=self.active_token,
+                            content_type="image/png",
+                            timeout=30,
+                        )
+                        if endpoint_missing(res):
+                            self.binary_upload_supported = False
+                            res = None
+
+                    if res is None:
+                        # Older servers only accept the base64 JSON upload
+                        with open(path, "rb") as img_file:
+                            encoded = base64.b64encode(img_file.read()).decode()
+
+                        payload = {
+                            "employee_id": emp,
+                            "company_id": comp,
+                            "work_session_id": ws_id,
+                            "capture_time": ctime,
+                            "photo": encoded,
+                            "active_token": self.active_token,  # required by backend
+                        }
+                        res = api_post("/screenshot/upload", json_data=payload, timeout=30)
+
+                    if res.status_code == 429:
+                        # Rate-limited: keep the rest for later and back off as the server asks
+                        delay = backoff_delay(self.rate_limited_count, res)
+                        self.rate_limited_count += 1
+                        self.upload_paused_until = time.monotonic() + delay
+                        print(f"Screenshot uploads rate-limited; retrying in {int(delay)}s")
+                        break
 
                     if res.status_code == 200 and res.json().get("status"):
+                        self.rate_limited_count = 0
                         # Mark as uploaded (delete record and file)
                         cursor.execute("DELETE FROM screenshots WHERE id=?", (local_id,))
                         db.commit()
@@ -165,8 +196,9 @@ class ScreenshotController:
 
         def upload_loop():
             while config.tracking_active:
-                self.safe_upload()
-                time.sleep(30)
+                if time.monotonic() >= self.upload_paused_until:
+                    self.safe_upload()
+                time.sleep(max(30, self.upload_paused_until - time.monotonic()))
 
         threading.Thread(target=upload_loop, daemon=True).start()
                 
@@ -0,0 +1,194 @@
+"""
+Offline Session Replay
+A session started while the server is unreachable gets a provisional id: the
+negative of its local work_sessions row id. Its activity and screenshots are
+recorded locally under that id and held back from the regular uploads. Once the
+session has ended and the server is reachable, the whole session goes to
+/work-session/replay in one call, and the local rows are re-pointed at the
+session id the server returns.
+
+Only a session the server refuses for good (410: older than it accepts) is
+dropped. Any other rejection is recorded in work_sessions.replay_error and the
+session is retried on later passes, e.g. once a server upgrade or a corrected
+clock lets it through.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import uuid
+import requests
+import config
+from api_helper import api_post, backoff_delay, endpoint_missing
+
+# False once the server turns out to predate /work-session/replay
+supported = True
+_replay_lock = threading.Lock()
+
+ACTIVITY_TABLES = ("application_usages", "website_usages", "employee_activity_logs")
+
+
+def is_provisional(session_id):
+    """True for ids handed out locally while offline (they are negative)."""
+    try:
+        return session_id is not None and int(session_id) < 0
+    except (TypeError, ValueError):
+        return False
+
+
+def start_offline_session(employee_id, session_start):
+    """Records a session locally and returns its provisional id."""
+    conn = sqlite3.connect(config.DB_PATH, check_same_thread=False)
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO work_sessions (employee_id, start_time, local_id)
+            VALUES (?, ?, ?)
+        """, (employee_id, session_start, uuid.uuid4().hex))
+        provisional_id = -cur.lastrowid
+        cur.execute("UPDATE work_sessions SET session_api_id=? WHERE id=?", (provisional_id, -provisional_id))
+        conn.commit()
+        return provisional_id
+    finally:
+        conn.close()
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _build_payload(conn, employee_id, active_token, provisional_id, local_id, start_time, end_time):
+    """Aggregated usage, per-minute activity and a screenshot manifest for one offline session."""
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT app_name, window_title, SUM(active_seconds) FROM application_usages
+        WHERE work_session_id=? GROUP BY app_name, window_title
+    """, (provisional_id,))
+    apps = [{"app_name": r[0], "window_title": r[1], "active_seconds": r[2]} for r in cur.fetchall()]
+    cur.execute("""
+        SELECT domain, url, SUM(active_seconds) FROM website_usages
+        WHERE work_session_id=? GROUP BY domain, url
+    """, (provisional_id,))
+    sites = [{"domain": r[0], "url": r[1], "active_seconds": r[2]} for r in cur.fetchall()]
+    cur.execute("""
+        SELECT minute_type, SUM(duration_seconds), MIN(created_at) FROM employee_activity_logs
+        WHERE work_session_id=? GROUP BY minute_type, strftime('%Y-%m-%d %H:%M', created_at)
+    """, (provisional_id,))
+    logs = [{"minute_type": r[0], "duration_seconds": r[1], "created_at": r[2]} for r in cur.fetchall()]
+
+    screenshots = []
+    cur.execute("SELECT id, photo_path, capture_time FROM screenshots WHERE work_session_id=? AND uploaded=0",
+                (provisional_id,))
+    for ss_id, path, capture_time in cur.fetchall():
+        if os.path.exists(path):
+            screenshots.append({"local_id": str(ss_id), "capture_time": capture_time, "sha256": _file_sha256(path)})
+
+    return {
+        "employee_id": employee_id,
+        "active_token": active_token,
+        "local_session_id": local_id or str(-provisional_id),
+        "start_time": start_time,
+        "end_time": end_time,
+        "applications": apps,
+        "websites": sites,
+        "activities": logs,
+        "screenshots": screenshots,
+    }
+
+
+def _apply_replay(conn, row_id, provisional_id, server_id, attached):
+    """Drops what the server stored and hands the remaining screenshots to the regular upload loop."""
+    cur = conn.cursor()
+    for table in ACTIVITY_TABLES:
+        cur.execute(f"DELETE FROM {table} WHERE work_session_id=?", (provisional_id,))
+    for ss_id in attached:
+        cur.execute("SELECT photo_path FROM screenshots WHERE id=?", (int(ss_id),))
+        found = cur.fetchone()
+        cur.execute("DELETE FROM screenshots WHERE id=?", (int(ss_id),))
+        if found and os.path.exists(found[0]):
+            os.remove(found[0])
+    cur.execute("UPDATE screenshots SET work_session_id=? WHERE work_session_id=?", (server_id, provisional_id))
+    cur.execute("UPDATE work_sessions SET session_api_id=?, replay_error=NULL WHERE id=?", (server_id, row_id))
+    conn.commit()
+
+
+def _discard(conn, row_id, provisional_id):
+    """Drops a session the server will never accept (older than it allows)."""
+    cur = conn.cursor()
+    for table in ACTIVITY_TABLES:
+        cur.execute(f"DELETE FROM {table} WHERE work_session_id=?", (provisional_id,))
+    cur.execute("SELECT photo_path FROM screenshots WHERE work_session_id=?", (provisional_id,))
+    for (path,) in cur.fetchall():
+        if path and os.path.exists(path):
+            os.remove(path)
+    cur.execute("DELETE FROM screenshots WHERE work_session_id=?", (provisional_id,))
+    cur.execute("DELETE FROM work_sessions WHERE id=?", (row_id,))
+    conn.commit()
+
+
+def replay_offline_sessions(employee_id, active_token):
+    """
+    Replays every ended offline session of ``employee_id``, oldest first.
+
+    Returns:
+        int: Number of sessions the server accepted
+    """
+    global supported
+    if not (config.OFFLINE_SESSIONS_ENABLED and supported and active_token):
+        return 0
+    if not _replay_lock.acquire(blocking=False):
+        return 0  # another thread is already replaying
+
+    import activity_tracker
+
+    replayed = 0
+    conn = sqlite3.connect(config.DB_PATH, check_same_thread=False)
+    try:
+        sessions = conn.execute("""
+            SELECT id, session_api_id, local_id, start_time, end_time FROM work_sessions
+            WHERE session_api_id < 0 AND end_time IS NOT NULL AND employee_id=?
+            ORDER BY id
+        """, (employee_id,)).fetchall()
+        for row_id, provisional_id, local_id, start_time, end_time in sessions:
+            payload = _build_payload(conn, employee_id, active_token, provisional_id, local_id, start_time, end_time)
+            try:
+                res = api_post("/work-session/replay", json_data=payload, timeout=60)
+            except requests.RequestException as e:
+                print(f"Offline session replay failed: {e}")
+                break
+            if endpoint_missing(res):
+                supported = False
+                print("Server has no session replay endpoint; offline sessions stay local")
+                break
+            if res.status_code == 429:
+                activity_tracker.pause_uploads(backoff_delay(0, res))
+                break
+            if res.status_code == 410:
+                print(f"Offline session {local_id} is too old to replay; dropping it: {res.text[:200]}")
+                _discard(conn, row_id, provisional_id)
+                continue
+            if res.status_code in (400, 422):
+                # Kept for a later pass; the next sessions can still go through
+                print(f"Server rejected offline session {local_id}; keeping it: {res.text[:200]}")
+                conn.execute("UPDATE work_sessions SET replay_error=? WHERE id=?",
+                             (f"{res.status_code}: {res.text[:500]}", row_id))
+                conn.commit()
+                continue
+            if res.status_code != 200:
+                break
+            data = res.json().get("data") or {}
+            _apply_replay(conn, row_id, provisional_id, data["id"], data.get("screenshots", {}).get("attached", []))
+            replayed += 1
+            print(f"Offline session replayed as session {data['id']}")
+    finally:
+        conn.close()
+        _replay_lock.release()
+    return replayed
+
+
+def replay_in_background(employee_id, active_token):
+    threading.Thread(target=replay_offline_sessions, args=(employee_id, active_token), daemon=True).start()
@@ -78,32 +78,7 @@ class TaskManager:
                     'offline': False
                 }
             
-            all_tasks = data.get('data', [])
-            new_tasks = [t for t in all_tasks if t.get('status') != 'DONE']
-            
-            # Compare with cached tasks
-            new_task_ids = {task['id'] for task in new_tasks}
-            old_task_ids = set(self.cached_tasks.keys())
-            
-            newly_added = new_task_ids - old_task_ids
-            removed_tasks = old_task_ids - new_task_ids
-            
-            # Update cache
-            self.cached_tasks = {task['id']: task for task in new_tasks}
-            self._save_cache()
-            
-            self.last_fetch_time = datetime.now()
-            
-            return {
-                'status': True,
-                'tasks': new_tasks,
-                'newly_added_count': len(newly_added),
-                'removed_count': len(removed_tasks),
-                'total_count': len(new_tasks),
-                'newly_added_ids': list(newly_added),
-                'removed_ids': list(removed_tasks),
-                'timestamp': datetime.now().isoformat()
-            }
+            return self.apply_task_list(data.get('data', []))
             
         except requests.exceptions.ConnectionError:
             # Network error - return cached data
@@ -122,6 +97,37 @@ class TaskManager:
                 'offline': True
             }
     
+    def apply_task_list(self, all_tasks: List[Dict]) -> Dict:
+        """
+        Replace the cached task list with one received from the API
+        (tasks/get or a heartbeat) and report what changed
+        """
+        new_tasks = [t for t in all_tasks if t.get('status') != 'DONE']
+        
+        # Compare with cached tasks
+        new_task_ids = {task['id'] for task in new_tasks}
+        old_task_ids = set(self.cached_tasks.keys())
+        
+        newly_added = new_task_ids - old_task_ids
+        removed_tasks = old_task_ids - new_task_ids
+        
+        # Update cache
+        self.cached_tasks = {task['id']: task for task in new_tasks}
+        self._save_cache()
+        
+        self.last_fetch_time = datetime.now()
+        
+        return {
+            'status': True,
+            'tasks': new_tasks,
+            'newly_added_count': len(newly_added),
+            'removed_count': len(removed_tasks),
+            'total_count': len(new_tasks),
+            'newly_added_ids': list(newly_added),
+            'removed_ids': list(removed_tasks),
+            'timestamp': datetime.now().isoformat()
+        }
+    
     def get_task_by_id(self, task_id: int) -> Optional[Dict]:
         """Get a specific task from cache"""
         return self.cached_tasks.get(task_id)
@@ -2,6 +2,7 @@ import requests
 import sqlite3
 from datetime import datetime, timezone
 import config
+import session_replay
 from api_helper import api_post
 
 class WorkSessionController:
@@ -33,6 +34,12 @@ class WorkSessionController:
 
         try:
             response = api_post("/work-session/create", data=data, timeout=30)
+        except requests.RequestException as e:
+            if config.OFFLINE_SESSIONS_ENABLED:
+                # Track locally; the session is replayed to the server once it is reachable
+                print(f"Server unreachable ({e}); starting an offline session")
+                return session_replay.start_offline_session(employee_id, session_start), "OFFLINE"
+            return None, f"Network Error: {str(e)}"
         except Exception as e:
             return None, f"Network Error: {str(e)}"
 
@@ -63,7 +70,9 @@ class WorkSessionController:
             self.db.commit()
         except Exception as e:
             print("DB Error in start_session:", e)
-            
+
+        # Sessions recorded during an earlier outage
+        session_replay.replay_in_background(employee_id, active_token)
         return session_id, "OK"
 
     def stop_session(self, employee_id, session_api_id, active_token):
@@ -76,7 +85,17 @@ class WorkSessionController:
         """
         url = f"{config.API_URL}/work-session/stop"
         session_end = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
-        
+
+        if session_replay.is_provisional(session_api_id):
+            # Offline session: close it locally and replay it as a whole
+            try:
+                self.cursor.execute("UPDATE work_sessions SET end_time=? WHERE session_api_id=?",
+                                    (session_end, session_api_id))
+                self.db.commit()
+            except Exception as e:
+                return False, f"DB Error: {e}"
+            session_replay.replay_in_background(employee_id, active_token)
+            return True, "OK"
 
         data = {
             "employee_id": str(employee_id),